@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+pyperf benchmarks for the indexes and catalog operations.
+
+A synthetic catalog of ``--documents`` documents (default 10,000) is
+built in a ``MappingStorage`` or, with ``--storage file``, a
+``FileStorage``. Building a large catalog is slow and every pyperf
+worker process needs one, so for large sizes give a ``--path``: the
+FileStorage is then built once and reused by later workers and runs.
+
+Save the results of each commit and compare them with pyperf::
+
+    python benchmarks/bench_catalog.py -o before.json
+    git checkout ...
+    python benchmarks/bench_catalog.py -o after.json
+    python -m pyperf compare_to before.json after.json
+
+Only results made with the same options are comparable; the options
+are recorded in the metadata of each result. Use ``-b`` (repeatable)
+to run only benchmarks whose name contains the given text.
+
+To only check that every benchmark still runs, as ``tox -e
+bench-smoke`` does, use a tiny catalog and a single run::
+
+    python benchmarks/bench_catalog.py --documents 200 --debug-single-value
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import datetime
+import os
+import shutil
+import tempfile
+import time
+
+import BTrees
+from persistent import Persistent
+import pyperf
+import transaction
+from zc.catalog.extentcatalog import Extent
+from ZODB.DB import DB
+from ZODB.FileStorage import FileStorage
+from ZODB.MappingStorage import MappingStorage
+
+from nti.zope_catalog.catalog import Catalog
+from nti.zope_catalog.datetime import TimestampNormalizer
+from nti.zope_catalog.datetime import TimestampTo64BitIntNormalizer
+from nti.zope_catalog.index import AttributeKeywordIndex
+from nti.zope_catalog.index import AttributeValueIndex
+from nti.zope_catalog.index import CaseInsensitiveAttributeFieldIndex
+from nti.zope_catalog.index import IntegerAttributeIndex
+from nti.zope_catalog.number import FloatTo64BitIntNormalizer
+from nti.zope_catalog.string import StringTokenNormalizer
+from nti.zope_catalog.topic import ExtentFilteredSet
+from nti.zope_catalog.topic import TopicIndex
+
+family = BTrees.family64
+
+#: How many documents are indexed by the ``index_doc`` benchmarks.
+INDEX_DOC_DOCUMENTS = 10000
+
+#: How many documents are committed at a time while building.
+BUILD_CHUNK = 10000
+
+_now = time.perf_counter
+
+
+class Document(Persistent):
+
+    def __init__(self, docid):
+        self.value = docid % 1000
+        self.number = docid
+        self.name = 'Name %d' % (docid % 5000)
+        self.tags = ('tag%d' % (docid % 10), 'tag%d' % (docid % 97))
+
+
+def is_even(_extent, docid, _document):
+    return docid % 2 == 0
+
+
+def is_small(_extent, _docid, document):
+    return document.value < 100
+
+
+class BenchCatalog(Catalog):
+
+    #: Whether :meth:`updateIndexes` prefetches the documents.
+    PREFETCH = True
+
+    documents = None
+
+    def _visitAllSublocations(self):
+        return iter(self.documents.items())
+
+    def _filterSublocations(self, sublocations, applicable=None):
+        if self.PREFETCH:
+            return super()._filterSublocations(sublocations, applicable)
+        return sublocations
+
+
+def _make_indexes():
+    topic = TopicIndex()
+    topic.addFilter(ExtentFilteredSet('even', is_even))
+    topic.addFilter(ExtentFilteredSet('small', is_small))
+    return {
+        'value': AttributeValueIndex('value'),
+        'number': IntegerAttributeIndex('number'),
+        'name': CaseInsensitiveAttributeFieldIndex('name'),
+        'tags': AttributeKeywordIndex('tags'),
+        'topic': topic,
+    }
+
+
+class Fixture(object):
+
+    def __init__(self, args):
+        self.count = args.documents
+        self._tempdir = None
+        if args.storage == 'mapping':
+            storage = MappingStorage()
+        else:
+            path = args.path
+            if not path:
+                self._tempdir = tempfile.mkdtemp()
+                path = os.path.join(self._tempdir, 'bench.fs')
+            storage = FileStorage(path)
+        self.db = DB(storage, cache_size=BUILD_CHUNK * 2)
+        self.conn = self.db.open()
+        root = self.conn.root
+        catalog = getattr(root, 'catalog', None)
+        if catalog is None or len(catalog.documents) != self.count:
+            self._build()
+        self.catalog = root.catalog
+        self.documents = root.catalog.documents
+
+    def _build(self):
+        root = self.conn.root
+        root.catalog = catalog = BenchCatalog(family=family)
+        for name, index in _make_indexes().items():
+            catalog[name] = index
+        catalog.documents = documents = family.IO.BTree()
+        transaction.commit()
+        for start in range(0, self.count, BUILD_CHUNK):
+            for docid in range(start, min(start + BUILD_CHUNK, self.count)):
+                documents[docid] = Document(docid)
+            transaction.commit()
+            self.conn.cacheMinimize()
+        catalog.updateIndexes()
+        transaction.commit()
+        self.conn.cacheMinimize()
+
+    def close(self):
+        transaction.abort()
+        self.conn.close()
+        self.db.close()
+        if self._tempdir:
+            shutil.rmtree(self._tempdir)
+
+
+_fixture = None
+
+def fixture():
+    # Only worker processes build the catalog, and only once.
+    global _fixture
+    if _fixture is None:
+        _fixture = Fixture(runner.args)
+    return _fixture
+
+
+def bench_index_doc(loops, name):
+    fix = fixture()
+    documents = list(fix.documents.items()[:INDEX_DOC_DOCUMENTS])
+    index = _make_indexes()[name]
+    total = 0
+    for _ in range(loops):
+        index.clear()
+        start = _now()
+        for docid, document in documents:
+            index.index_doc(docid, document)
+        total += _now() - start
+    return total
+
+
+def bench_apply(loops, name, query):
+    index = fixture().catalog[name]
+    if callable(query):
+        query = query()
+    start = _now()
+    for _ in range(loops):
+        index.apply(query)
+    return _now() - start
+
+
+def bench_catalog_apply(loops, query):
+    catalog = fixture().catalog
+    start = _now()
+    for _ in range(loops):
+        catalog.apply(query)
+    return _now() - start
+
+
+def bench_zip(loops, name):
+    fix = fixture()
+    index = fix.catalog[name]
+    docids = list(fix.documents.keys()[:INDEX_DOC_DOCUMENTS])
+    start = _now()
+    for _ in range(loops):
+        for _pair in index.zip(docids):
+            pass
+    return _now() - start
+
+
+def bench_updateIndexes(loops, prefetch=True, read_ahead=False):
+    fix = fixture()
+    catalog = fix.catalog
+    BenchCatalog.PREFETCH = prefetch
+    BenchCatalog.PREFETCH_READ_AHEAD = read_ahead
+    total = 0
+    try:
+        for _ in range(loops):
+            catalog.clear()
+            # Start with the documents on disk.
+            fix.conn.cacheMinimize()
+            start = _now()
+            catalog.updateIndexes()
+            total += _now() - start
+            transaction.abort()
+    finally:
+        BenchCatalog.PREFETCH = True
+        BenchCatalog.PREFETCH_READ_AHEAD = False
+    return total
+
+
+def bench_normalizer(loops, normalizer, values):
+    start = _now()
+    for _ in range(loops):
+        for value in values:
+            normalizer.value(value)
+    return _now() - start
+
+
+def _none_query():
+    extent = Extent(family=family)
+    for docid in range(0, fixture().count, 3):
+        extent.add(docid, None)
+    return {'none': extent}
+
+
+def _add_cmdline_args(cmd, args):
+    cmd.extend(('--documents', str(args.documents),
+                '--storage', args.storage))
+    if args.path:
+        cmd.extend(('--path', args.path))
+    for name in args.bench or ():
+        cmd.extend(('-b', name))
+
+
+def _benchmarks(count):
+    benchmarks = []
+    for name in ('value', 'number', 'name', 'tags', 'topic'):
+        benchmarks.append(('index_doc %s' % name, bench_index_doc, name))
+    benchmarks.extend([
+        ('apply value any_of', bench_apply, 'value', {'any_of': (1, 2, 3)}),
+        ('apply value between', bench_apply, 'value', {'between': (100, 200)}),
+        ('apply number between', bench_apply, 'number',
+         {'between': (count // 4, count // 2)}),
+        ('apply name', bench_apply, 'name', ('name 1', 'name 1')),
+        ('apply name range', bench_apply, 'name', ('name 1', 'name 2')),
+        ('apply tags and', bench_apply, 'tags',
+         {'query': ['tag1', 'tag5'], 'operator': 'and'}),
+        ('apply tags or', bench_apply, 'tags',
+         {'query': ['tag1', 'tag5', 'tag7'], 'operator': 'or'}),
+        ('apply tags none', bench_apply, 'tags', _none_query),
+        ('apply topic all_of', bench_apply, 'topic', {'all_of': ['even', 'small']}),
+        ('catalog apply', bench_catalog_apply,
+         {'value': {'any_of': (1, 2, 3)},
+          'tags': {'query': ['tag1'], 'operator': 'or'}}),
+        ('zip value', bench_zip, 'value'),
+        ('zip tags', bench_zip, 'tags'),
+        ('updateIndexes', bench_updateIndexes),
+        ('updateIndexes no prefetch', bench_updateIndexes, False),
+        ('updateIndexes read-ahead', bench_updateIndexes, True, True),
+        ('normalize float', bench_normalizer, FloatTo64BitIntNormalizer(),
+         [i / 7.0 for i in range(1000)]),
+        ('normalize string', bench_normalizer, StringTokenNormalizer(),
+         ['  Token %d ' % i for i in range(1000)]),
+    ])
+    now = datetime.datetime(2020, 1, 1)
+    dates = [now + datetime.timedelta(seconds=i * 61) for i in range(1000)]
+    benchmarks.extend([
+        ('normalize timestamp', bench_normalizer, TimestampNormalizer(), dates),
+        ('normalize timestamp int', bench_normalizer,
+         TimestampTo64BitIntNormalizer(), dates),
+    ])
+    return benchmarks
+
+
+runner = pyperf.Runner(add_cmdline_args=_add_cmdline_args)
+runner.argparser.add_argument('--documents', type=int, default=10000,
+                              help='The number of documents in the catalog.')
+runner.argparser.add_argument('--storage', choices=('mapping', 'file'),
+                              default='mapping')
+runner.argparser.add_argument('--path',
+                              help='Keep the FileStorage at this path and reuse it.')
+runner.argparser.add_argument('-b', '--bench', action='append',
+                              help='Only run benchmarks whose name contains this.')
+
+
+def main():
+    args = runner.parse_args()
+    runner.metadata['catalog_documents'] = args.documents
+    runner.metadata['catalog_storage'] = args.storage
+    for name, func, *func_args in _benchmarks(args.documents):
+        if args.bench and not any(b in name for b in args.bench):
+            continue
+        inner_loops = None
+        if func is bench_index_doc:
+            inner_loops = min(args.documents, INDEX_DOC_DOCUMENTS)
+        runner.bench_time_func(name, func, *func_args, inner_loops=inner_loops)
+    if _fixture is not None:
+        _fixture.close()
+
+
+if __name__ == '__main__':
+    main()
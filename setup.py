@@ -6,6 +6,7 @@ from setuptools import find_namespace_packages
 TESTS_REQUIRE = [
     'pyhamcrest',
     'nti.testing',
+    'numpy',
     'zope.testing',
     'zope.testrunner',
 ]
@@ -56,6 +57,7 @@ setup(
         'nti.zodb >= 1.0.0',
         'persistent',
         'pytz',
+        'transaction',
         'six',
         'zc.catalog >= 2.0.1',
         'ZODB >= 5.0.0',
@@ -63,12 +65,18 @@ setup(
         'zope.catalog',
         'zope.component',
         'zope.container',
+        'zope.intid',
         'zope.index',
+        'zope.keyreference',
         'zope.interface',
+        'zope.lifecycleevent',
         'zope.location',
     ],
     extras_require={
         'test': TESTS_REQUIRE,
+        'numpy': [
+            'numpy',
+        ],
         'docs': [
             'Sphinx',
             'repoze.sphinx.autointerface',
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Support for bulk-loading BTrees from sorted data.
+
+Inserting keys into a BTree one at a time splits each bucket in half
+when it overflows, so a tree built from ascending keys ends up with
+buckets that are only about half full. When the data is known in
+advance and the tree is empty, :func:`fill_tree` can instead build the
+buckets and interior nodes directly, each as full as the tree allows.
+That's faster and produces fewer, smaller persistent objects.
+
+:class:`ExternalSorter` produces sorted data from unsorted input that
+may not fit in memory.
+
+:func:`bucket_items` goes the other way, reading a tree one whole
+bucket at a time.
+
+.. versionadded:: 4.3.0
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import heapq
+import itertools
+import pickle
+import tempfile
+
+__docformat__ = "restructuredtext en"
+
+logger = __import__('logging').getLogger(__name__)
+
+
+def _is_set(tree):
+    # TreeSets have no values.
+    return not hasattr(tree, 'values')
+
+
+def _chunks(iterable, size, _islice=itertools.islice):
+    iterable = iter(iterable)
+    while True:
+        chunk = list(_islice(iterable, size))
+        if not chunk:
+            break
+        yield chunk
+
+
+def fill_tree(tree, items):
+    """
+    Populate the empty BTree or TreeSet *tree* from *items*.
+
+    For a BTree, *items* is an iterable of ``(key, value)`` pairs;
+    for a TreeSet, an iterable of keys. The keys must be in ascending
+    order without duplicates; this isn't checked.
+
+    Every bucket and interior node is filled to the maximum size the
+    tree type allows (except perhaps the last one of each level), and
+    the tree is marked as changed so that it will be stored.
+
+    Returns the *tree*.
+
+    :raises ValueError: If the tree isn't empty.
+    """
+    if tree:
+        raise ValueError("Can only fill an empty tree", tree)
+
+    tree_type = type(tree)
+    bucket_type = tree_type._bucket_type
+    is_set = _is_set(tree)
+
+    keys = []
+    buckets = []
+    for chunk in _chunks(items, tree_type.max_leaf_size):
+        if is_set:
+            keys.append(chunk[0])
+            state = tuple(chunk)
+        else:
+            keys.append(chunk[0][0])
+            state = tuple(itertools.chain.from_iterable(chunk))
+        buckets.append(state)
+
+    if not buckets:
+        return tree
+
+    # Buckets are linked to their successor, so build from the end.
+    next_bucket = None
+    for i in range(len(buckets) - 1, -1, -1):
+        bucket = bucket_type()
+        if next_bucket is None:
+            bucket.__setstate__((buckets[i],))
+        else:
+            bucket.__setstate__((buckets[i], next_bucket))
+        buckets[i] = next_bucket = bucket
+    first_bucket = next_bucket
+
+    # Now the interior levels, until only one node remains
+    # for the root.
+    children = buckets
+    firsts = buckets
+    max_internal_size = tree_type.max_internal_size
+    while len(children) > max_internal_size:
+        nodes = []
+        node_keys = []
+        node_firsts = []
+        for start in range(0, len(children), max_internal_size):
+            end = start + max_internal_size
+            node = tree_type()
+            node.__setstate__((_interleave(children[start:end], keys[start:end]),
+                               firsts[start]))
+            nodes.append(node)
+            node_keys.append(keys[start])
+            node_firsts.append(firsts[start])
+        children = nodes
+        keys = node_keys
+        firsts = node_firsts
+
+    tree.__setstate__((_interleave(children, keys), first_bucket))
+    tree._p_changed = True
+    return tree
+
+
+def _interleave(children, keys):
+    # (child0, key1, child1, key2, child2, ...)
+    state = [children[0]]
+    for key, child in zip(keys[1:], children[1:]):
+        state.append(key)
+        state.append(child)
+    return tuple(state)
+
+
+def bucket_items(tree):
+    """
+    Iterate the buckets of the BTree or TreeSet *tree* in order,
+    yielding the flat tuple of items of each: ``(key1, value1, key2,
+    value2, ...)`` for a BTree and ``(key1, key2, ...)`` for a
+    TreeSet. Only the buckets are loaded, not the interior nodes, and
+    each bucket is converted in one step.
+    """
+    bucket = tree._firstbucket
+    while bucket is not None:
+        state = bucket.__getstate__()
+        yield state[0]
+        bucket = state[1] if len(state) > 1 else None
+
+
+class ExternalSorter(object):
+    """
+    Sorts an arbitrary number of items, using temporary files to hold
+    sorted runs once more than *max_in_memory* items have been added.
+
+    Add items with :meth:`add` or :meth:`extend`, then iterate the
+    sorter (once) to get them back in order. The sort is stable. If
+    *key* is given it is used as for :func:`sorted`. Spilled items
+    must be picklable.
+    """
+
+    #: The default number of items to keep in memory.
+    MAX_IN_MEMORY = 500000
+
+    #: How many items are pickled together when spilling.
+    _SPILL_CHUNK_SIZE = 1000
+
+    def __init__(self, key=None, max_in_memory=None):
+        self._key = key
+        self._max_in_memory = max_in_memory or self.MAX_IN_MEMORY
+        self._items = []
+        self._runs = []
+
+    def add(self, item):
+        self._items.append(item)
+        if len(self._items) >= self._max_in_memory:
+            self._spill()
+
+    def extend(self, items):
+        items = iter(items)
+        while True:
+            room = self._max_in_memory - len(self._items)
+            self._items.extend(itertools.islice(items, room))
+            if len(self._items) < self._max_in_memory:
+                break
+            self._spill()
+
+    def _spill(self):
+        self._items.sort(key=self._key)
+        run = tempfile.TemporaryFile()
+        for chunk in _chunks(self._items, self._SPILL_CHUNK_SIZE):
+            pickle.dump(chunk, run, pickle.HIGHEST_PROTOCOL)
+        run.seek(0)
+        self._runs.append(run)
+        self._items = []
+        logger.debug("Spilled sorted run %d to disk", len(self._runs))
+
+    def __iter__(self):
+        self._items.sort(key=self._key)
+        items = self._items
+        runs = self._runs
+        self._items = []
+        self._runs = []
+        if not runs:
+            return iter(items)
+        # Earlier runs win ties, as in a stable sort.
+        return heapq.merge(*([_read_run(run) for run in runs] + [items]),
+                           key=self._key)
+
+
+def _read_run(run):
+    try:
+        while True:
+            try:
+                chunk = pickle.load(run)
+            except EOFError:
+                break
+            for item in chunk:
+                yield item
+    finally:
+        run.close()
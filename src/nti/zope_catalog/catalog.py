@@ -11,18 +11,46 @@ from __future__ import print_function
 
 # stdlib imports
 import collections
+from collections.abc import Mapping
+import concurrent.futures
+import copy
+import datetime
+import decimal
+import functools
 import itertools
+import os
+import time
 import warnings
+import weakref
 
 import BTrees
+from BTrees.Length import Length
+from persistent import Persistent
+import transaction
+from ZODB.interfaces import IStorageIteration
 from ZODB.POSException import POSError
+from ZODB.utils import get_pickle_metadata
+from ZODB.utils import p64
+from ZODB.utils import u64
+from zope import component
 from zope import interface
+from zope.catalog.attribute import AttributeIndex
 from zope.catalog.catalog import Catalog as _ZCatalog
 from zope.catalog.interfaces import ICatalog
+from zope.index.interfaces import IIndexSort
+from zope.intid.interfaces import IIntIds
+from zope.keyreference.persistent import KeyReferenceToPersistent
+from zope.location import location
+from zope.location.interfaces import ILocationInfo
 
 from nti.zodb import isBroken
-from .interfaces import INoAutoIndex
+from .index import _NOT_APPLICABLE
+from .index import _ExtractedValue
+from .index import _SortMixin
+from .index import attribute_index_value
+from .instrumentation import get_recorder
 from .interfaces import IDeferredCatalog
+from .interfaces import INoAutoIndex
 
 
 __docformat__ = "restructuredtext en"
@@ -34,17 +62,29 @@ class ResultSet(object):
     """
     Lazily accessed set of objects.
 
-    This is just like :class:`zope.catalog.catalog.ResultSet`
-    except it is slower (it has more overhead) and it offers the dubious
-    feature of ignoring broken objects (which is a footgun if ever
-    there was). If you have such objects, your code or deployment
-    is broken.
+    This is like :class:`zope.catalog.catalog.ResultSet`, except that:
 
-    Prefer not to use this class in normal operations (it might be useful
-    for recovery, but even that's doubtful since it doesn't track
-    which objects were "invalid").
+    - Objects are prefetched in chunks of :attr:`PREFETCH_CHUNK_SIZE`
+      using a :class:`CatalogPrefetchIterator` when iterating, instead
+      of being loaded one at a time.
+    - It can be indexed and sliced (by position in *uids*) and
+      paged with :meth:`page`. A slice is another lazy result set;
+      only the objects that are actually iterated are loaded.
+    - It offers the dubious feature of ignoring broken objects (which
+      is a footgun if ever there was). If you have such objects, your
+      code or deployment is broken. That feature might be useful for
+      recovery, but even that's doubtful since it doesn't track which
+      objects were "invalid".
+
+    .. versionchanged:: 4.3.0
+       Prefetch objects, and add indexing, slicing and :meth:`page`.
     """
 
+    #: How many objects are prefetched at once when iterating.
+    #:
+    #: .. versionadded:: 4.3.0
+    PREFETCH_CHUNK_SIZE = 512
+
     def __init__(self, uids, uidutil, ignore_invalid=False):
         self.uids = uids
         self.uidutil = uidutil
@@ -58,21 +98,29 @@ class ResultSet(object):
 
     __length_hint__ = __len__
 
-    def get_object(self, uid):
+    def _lookup(self, uid):
+        # The object (perhaps a ghost), without checking it.
         if self.ignore_invalid:
-            obj = self.uidutil.queryObject(uid)
-            if isBroken(obj, uid):
-                obj = None
-        else:
-            obj = self.uidutil.getObject(uid)
+            return self.uidutil.queryObject(uid)
+        return self.uidutil.getObject(uid)
+
+    def _checked(self, uid, obj):
+        if self.ignore_invalid and isBroken(obj, uid):
+            obj = None
         if obj is None:
             logger.warning("Your database is corrupted. There is no object for id %d", uid)
         return obj
+
+    def get_object(self, uid):
+        return self._checked(uid, self._lookup(uid))
     getObject = get_object
 
     def items(self):
-        for uid in self.uids:
-            obj = self.get_object(uid)
+        # Checking whether an object is broken loads it, so that's
+        # done after its chunk has been prefetched.
+        pairs = ((uid, self._lookup(uid)) for uid in self.uids)
+        for uid, obj in CatalogPrefetchIterator(pairs, self.PREFETCH_CHUNK_SIZE):
+            obj = self._checked(uid, obj)
             if obj is not None:
                 yield uid, obj
     iter_pairs = items
@@ -80,6 +128,43 @@ class ResultSet(object):
     def __iter__(self):
         return (item[1] for item in self.items())
 
+    def _uid_sequence(self):
+        uids = self.uids
+        if hasattr(uids, 'keys'):
+            # BTrees sets and buckets aren't (all) sliceable, but
+            # their keys are, without copying a tree.
+            return uids.keys()
+        if isinstance(uids, (list, tuple, range)):
+            return uids
+        return list(uids)
+
+    def __getitem__(self, index):
+        """
+        Return the object at the position *index*, or, if *index* is
+        a slice, a result set of the objects in that slice.
+        """
+        uids = self._uid_sequence()
+        if not isinstance(index, slice):
+            return self.get_object(uids[index])
+
+        start, stop, step = index.indices(len(uids))
+        if step == 1:
+            uids = uids[start:stop]
+        else:
+            uids = [uids[i] for i in range(start, stop, step)]
+        result = copy.copy(self)
+        result.uids = uids
+        return result
+
+    def page(self, offset, limit=None):
+        """
+        Return a result set of at most *limit* objects, starting at
+        *offset*.
+
+        .. versionadded:: 4.3.0
+        """
+        return self[offset:None if limit is None else offset + limit]
+
     def count(self):
         """
         How many objects are there?
@@ -88,7 +173,12 @@ class ResultSet(object):
         len() of this object. This is only different if the database
         is corrupt and needs fixed. If you see this, this is a strong
         signal that your code is broken.
+
+        Unless invalid objects are being ignored, this is the number
+        of uids, and no objects are loaded.
         """
+        if not self.ignore_invalid:
+            return len(self.uids)
         return sum(1 for _ in self.items())
 
 
@@ -113,7 +203,7 @@ class CatalogPrefetchIterator(object):
     of a catalog, but may be useful in other cases.
 
     For example, one could enhance a standard :class:`zope.catalog.catalog.ResultSet`
-    like so (note this won't work for the :class:`ResultSet` defined here)::
+    like so (the :class:`ResultSet` defined here already does this)::
 
         from zope.catalog.catalog import ResultSet
         class PrefetchedResultSet(ResultSet, object):
@@ -123,18 +213,46 @@ class CatalogPrefetchIterator(object):
                     yield obj
 
 
+    If *read_ahead* is true, then while one chunk is being iterated,
+    the next chunk is prefetched by a background thread, so that the
+    time spent waiting on the storage overlaps with the time spent
+    processing objects. Because ZODB connections are not thread-safe,
+    the background thread uses a connection of its own (opened from the
+    database of the first object found), relying on the storage caches
+    shared between connections (as with ZEO and RelStorage). That
+    connection is closed when iteration finishes or when this object is
+    garbage collected. Read-ahead is most useful with storages that
+    have a high latency.
+
+    If *chunk_sizer* is given, it is an :class:`AdaptiveChunkSizer`
+    that chooses the size of each chunk based on measurements of the
+    previous one, and *chunk_size* is ignored.
+
     .. versionadded:: 3.0
+    .. versionchanged:: 4.3.0
+       Add the *read_ahead* and *chunk_sizer* arguments.
     """
 
-    def __init__(self, iterable, chunk_size):
+    def __init__(self, iterable, chunk_size, read_ahead=False, chunk_sizer=None):
         self.iterable = iter(iterable) # work if they pass a concrete collection
-        self.chunk_size = chunk_size
+        self.chunk_sizer = chunk_sizer
+        self.chunk_size = chunk_size if chunk_sizer is None else chunk_sizer.size
         self._chunk = None
+        # (objects, prefetch seconds, time handed out) for the chunk
+        # being iterated, when sizing adaptively.
+        self._measurement = None
         # The common case is that we only ever encounter one database;
         # the first time we see any jar, we'll know if we need to divy
         # objects between different jars or not.
         self._prefetch = self._prefetch_unknown
         self._single_jar = None
+        # The next chunk and the future prefetching it, when reading ahead.
+        self._next = None
+        self._read_ahead = None
+        if read_ahead:
+            self._read_ahead = read_ahead = _ReadAhead()
+            self._prefetch_jar = read_ahead.prefetch_jar
+            self._close_read_ahead = weakref.finalize(self, read_ahead.close)
 
     def __iter__(self):
         return self
@@ -149,19 +267,74 @@ class CatalogPrefetchIterator(object):
 
     next = __next__ # Python 2
 
-    def _get_next_chunk(self, _islice=itertools.islice):
-        if self.iterable is None:
+    def _read_chunk(self, _islice=itertools.islice):
+        raw_chunk = list(_islice(self.iterable, self.chunk_size))
+        if len(raw_chunk) < self.chunk_size:
+            self.iterable = None # We're done.
+        return raw_chunk
+
+    def _read_chunk_ahead(self):
+        raw_chunk = self._read_chunk()
+        return raw_chunk, self._read_ahead.submit(self._timed_prefetch, raw_chunk)
+
+    def _timed_prefetch(self, raw_chunk, _now=time.perf_counter):
+        # (seconds, round trips)
+        start = _now()
+        round_trips = self._prefetch(raw_chunk)
+        return _now() - start, round_trips
+
+    def _resize(self, _now=time.perf_counter):
+        objects, prefetch_seconds, handed_out = self._measurement
+        self._measurement = None
+        # Only objects that were loaded have a size.
+        nbytes = sum(getattr(obj, '_p_estimated_size', 0) for obj in objects)
+        self.chunk_size = self.chunk_sizer.next_size(
+            len(objects), prefetch_seconds, _now() - handed_out, nbytes)
+
+    def _get_next_chunk(self):
+        if self.iterable is None and self._next is None:
             self._chunk = None
             return
 
-        raw_chunk = list(_islice(self.iterable, self.chunk_size))
-        self._prefetch(raw_chunk)
+        if self._measurement is not None:
+            self._resize()
+
+        if self._read_ahead is None:
+            raw_chunk = self._read_chunk()
+            prefetch_seconds, round_trips = self._timed_prefetch(raw_chunk)
+        else:
+            raw_chunk, prefetching = self._next or self._read_chunk_ahead()
+            prefetch_seconds, round_trips = prefetching.result()
+            self._next = None
+            if self.iterable is not None:
+                # Start on the next one while the caller
+                # works on this one.
+                self._next = self._read_chunk_ahead()
+
+        # We pop from the end, but we want to preserve the order
+        # of the iterable (e.g., so that intids are visited in order).
+        raw_chunk.reverse()
         self._chunk = raw_chunk
-        if not raw_chunk or len(raw_chunk) < self.chunk_size:
-            # We're done.
-            self.iterable = None # Signal that to __next__
+        recorder = get_recorder()
+        if recorder is not None:
+            name = type(self).__name__
+            recorder.timed(name, 'prefetch', prefetch_seconds)
+            recorder.counted(name, 'prefetch_round_trips', round_trips)
+            recorder.counted(name, 'objects', len(raw_chunk))
+        if self.chunk_sizer is not None:
+            self._measurement = ([obj for _, obj in raw_chunk],
+                                 prefetch_seconds,
+                                 time.perf_counter())
+        if self.iterable is None and self._next is None:
             self._prefetch = None # break the cycle
             self._single_jar = None # why not
+            if self._read_ahead is not None:
+                self._close_read_ahead.detach()
+                self._read_ahead.close(wait=True)
+
+    @staticmethod
+    def _prefetch_jar(jar, oids):
+        jar.prefetch(oids)
 
     def _prefetch_unknown(self, raw_chunk):
         for _, obj in raw_chunk:
@@ -174,10 +347,10 @@ class CatalogPrefetchIterator(object):
                 else:
                     self._prefetch = self._prefetch_singledb
                     self._single_jar = jar
-                self._prefetch(raw_chunk)
                 # We have our answer we can quit now.
-                break
+                return self._prefetch(raw_chunk)
         # We never encountered a persistent object. How sad.
+        return 0
 
     def _prefetch_multidb(self, raw_chunk, _defaultdict=collections.defaultdict):
         by_jar = _defaultdict(set) # {jar: [oids]}
@@ -185,10 +358,11 @@ class CatalogPrefetchIterator(object):
             jar = getattr(obj, '_p_jar', None)
             by_jar[jar].add(getattr(obj, '_p_oid', None))
 
-        by_jar.pop(None) # lose the non-persistent objects
+        by_jar.pop(None, None) # lose the non-persistent objects
         for jar, oids in by_jar.items():
             oids.discard(None) # Lose persistent objects that aren't saved
-            jar.prefetch(oids)
+            self._prefetch_jar(jar, oids)
+        return len(by_jar)
 
     def _prefetch_singledb(self, raw_chunk):
         oids = {
@@ -197,7 +371,215 @@ class CatalogPrefetchIterator(object):
             in raw_chunk
         }
         oids.discard(None) # lose the non-persistent objects, and those not saved
-        self._single_jar.prefetch(oids)
+        self._prefetch_jar(self._single_jar, oids)
+        return 1
+
+
+class AdaptiveChunkSizer(object):
+    """
+    Chooses the size of the chunks of a :class:`CatalogPrefetchIterator`.
+
+    After each chunk, the time it took to prefetch and to process
+    (the time between the iterator handing out the chunk and being
+    asked for the next one) and the estimated size of the objects
+    that were loaded are used to pick a size that should take about
+    *target_seconds* and load no more than *max_bytes*. Each new size
+    is at most double or half the previous one, and always between
+    *minimum* and *maximum*.
+
+    Every size chosen is recorded in :attr:`sizes`, which is useful
+    when tuning the bounds or a fixed chunk size.
+
+    .. versionadded:: 4.3.0
+    """
+
+    minimum = 32
+    maximum = 8192
+    target_seconds = 0.5
+    max_bytes = 32 * 1024 * 1024
+
+    def __init__(self, initial=512, minimum=None, maximum=None,
+                 target_seconds=None, max_bytes=None):
+        if minimum is not None:
+            self.minimum = minimum
+        if maximum is not None:
+            self.maximum = maximum
+        if target_seconds is not None:
+            self.target_seconds = target_seconds
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        #: The sizes chosen, in order, starting with the initial size.
+        self.sizes = [self._bounded(initial)]
+
+    @property
+    def size(self):
+        "The current chunk size."
+        return self.sizes[-1]
+
+    def _bounded(self, size):
+        return max(self.minimum, min(self.maximum, int(size)))
+
+    def next_size(self, count, prefetch_seconds, process_seconds, nbytes):
+        """
+        Record that the last chunk of *count* objects took
+        *prefetch_seconds* to prefetch and *process_seconds* to
+        process, loading *nbytes* of object state, and return the
+        size of the next chunk.
+        """
+        size = self.size
+        if count:
+            seconds = prefetch_seconds + process_seconds
+            desired = self.target_seconds * count / seconds if seconds > 0 else size * 2
+            if nbytes:
+                desired = min(desired, self.max_bytes * count / nbytes)
+            # Don't swing too far on one measurement.
+            size = self._bounded(max(size // 2, min(size * 2, desired)))
+            if size != self.size:
+                logger.debug("Changing prefetch chunk size from %d to %d "
+                             "(%d objects, %d bytes, %.3fs prefetch, %.3fs process)",
+                             self.size, size, count, nbytes,
+                             prefetch_seconds, process_seconds)
+        self.sizes.append(size)
+        return size
+
+
+class _ReadAhead(object):
+    """
+    Prefetches for a :class:`CatalogPrefetchIterator` on a
+    background thread, using a connection private to that thread.
+    """
+
+    def __init__(self):
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix='CatalogPrefetchIterator')
+        self._conn = None
+
+    def submit(self, func, *args):
+        return self._executor.submit(func, *args)
+
+    def prefetch_jar(self, jar, oids):
+        # Only called in the background thread.
+        db = jar.db()
+        if self._conn is None:
+            self._conn = db.open(transaction_manager=transaction.TransactionManager())
+        self._conn.get_connection(db.database_name).prefetch(oids)
+
+    def _close_connection(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def close(self, wait=False):
+        try:
+            self._executor.submit(self._close_connection)
+        except RuntimeError: # pragma: no cover
+            # The interpreter is exiting and has already
+            # stopped the thread.
+            pass
+        self._executor.shutdown(wait=wait)
+
+
+class QueryCache(object):
+    """
+    A least-recently-used cache of query results, bounded by both the
+    number of entries and their approximate total size in bytes. See
+    :meth:`Catalog.apply`.
+
+    The number of :attr:`hits` and :attr:`misses` are counted.
+
+    .. versionadded:: 4.3.0
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, result):
+        nbytes = _result_bytes(result)
+        if nbytes > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= old[1]
+        self._entries[key] = (result, nbytes)
+        self.nbytes += nbytes
+        while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.nbytes -= evicted
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+
+def _result_bytes(result):
+    # Keys, plus weights for a mapping, and some overhead.
+    per_item = 16 if hasattr(result, 'items') else 8
+    return 64 + per_item * len(result)
+
+
+#: Values that can be part of a cached query as they are.
+_IMMUTABLE_QUERY_VALUES = (str, bytes, int, float, type(None),
+                           datetime.date, datetime.time, datetime.timedelta,
+                           decimal.Decimal)
+
+
+def _canonical_query(query):
+    """
+    Return a hashable equivalent of *query*, or None if it contains
+    something (such as an extent) that can't be cached.
+    """
+    try:
+        return _canonical(query)
+    except TypeError:
+        return None
+
+
+def _canonical(value):
+    if isinstance(value, _IMMUTABLE_QUERY_VALUES):
+        return value
+    if isinstance(value, Mapping):
+        items = ((_canonical(k), _canonical(v)) for k, v in value.items())
+        return (dict, tuple(sorted(items, key=repr)))
+    if isinstance(value, (list, tuple)):
+        # Some indexes treat lists and tuples differently.
+        return (type(value), tuple(_canonical(v) for v in value))
+    if isinstance(value, (set, frozenset)):
+        return (frozenset, frozenset(_canonical(v) for v in value))
+    raise TypeError("Cannot cache query value", value)
+
+
+class ResumeToken(Persistent):
+    """
+    Records the progress of a checkpointed update of
+    the indexes of a :class:`Catalog`.
+
+    .. versionadded:: 4.3.0
+    """
+
+    #: The last intid that was indexed.
+    last_uid = None
+
+    def __init__(self, index_names):
+        #: The sorted names of the indexes being updated.
+        self.index_names = index_names
 
 
 class Catalog(_ZCatalog):
@@ -223,10 +605,145 @@ class Catalog(_ZCatalog):
 
     PREFETCH_CHUNK_SIZE = 512
 
+    #: Whether to prefetch the next chunk of objects on a background
+    #: thread while the current chunk is indexed. See
+    #: :class:`CatalogPrefetchIterator`.
+    #:
+    #: .. versionadded:: 4.3.0
+    PREFETCH_READ_AHEAD = False
+
+    #: If not None, a callable taking :attr:`PREFETCH_CHUNK_SIZE` and
+    #: returning an :class:`AdaptiveChunkSizer` (such as that class
+    #: itself) used to adjust the chunk size while visiting objects.
+    #:
+    #: .. versionadded:: 4.3.0
+    PREFETCH_CHUNK_SIZER = None
+
+    #: When applying a query, an index with an ``apply_filtered``
+    #: method is only given the candidate documents found so far if
+    #: there are no more than this fraction of its estimated results.
+    #: See :meth:`apply`.
+    #:
+    #: .. versionadded:: 4.3.0
+    PLAN_FILTER_RATIO = 0.25
+
+    #: The maximum number of query results :meth:`apply` keeps in a
+    #: :class:`QueryCache`. The default, zero, disables caching.
+    #:
+    #: .. versionadded:: 4.3.0
+    QUERY_CACHE_SIZE = 0
+
+    #: The approximate maximum size, in bytes, of the query results
+    #: kept in the cache.
+    #:
+    #: .. versionadded:: 4.3.0
+    QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+    #: If true, updating indexes decides from the class of each object
+    #: (without loading it) whether each attribute index with an
+    #: ``interface`` could apply to it: only if the class implements
+    #: the interface, or an adapter to it is registered for the class,
+    #: or the class defines ``__conform__``. Indexes are only given
+    #: the objects they could apply to, and objects no index could
+    #: apply to are never loaded. Only enable this if objects don't get
+    #: those interfaces by direct declaration (e.g., ``alsoProvides``),
+    #: which can't be seen without loading them.
+    #:
+    #: .. versionadded:: 4.3.0
+    SKIP_INAPPLICABLE_CLASSES = False
+
+    #: A BTree mapping index names to :class:`BTrees.Length.Length`
+    #: counters of changes, once query caching is used.
+    _query_cache_counters = None
+
+    def _sublocationScope(self):
+        """
+        Return the :class:`~zope.intid.interfaces.IIntIds` utility
+        holding the objects this catalog indexes, and the site they
+        must be inside, or None if the utility is local to the
+        nearest site, as zope.catalog decides.
+        """
+        locatable = ILocationInfo(self, None)
+        if locatable is not None:
+            site = locatable.getNearestSite()
+            sm = site.getSiteManager()
+            uidutil = sm.queryUtility(IIntIds)
+            if uidutil in [c.component for c in sm.registeredUtilities()]:
+                return uidutil, None
+            # We do not have a local intids utility
+            return component.getUtility(IIntIds, context=self), site
+        return component.getUtility(IIntIds), None
+
     def _visitAllSublocations(self):
-        return super()._visitSublocations()
+        """
+        Yield the ``(uid, object)`` pairs of all the objects within the
+        nearest site, like zope.catalog's ``_visitSublocations``.
+
+        Subclasses may override this to visit other objects.
+        """
+        return self._visitSublocationsBetween(None, None)
 
-    def _visitSublocations(self):
+    def _visitSublocationsBetween(self, min_uid, max_uid):
+        """
+        Like :meth:`_visitAllSublocations`, limited to intids from
+        *min_uid* to *max_uid* (inclusive, None meaning unbounded).
+
+        Only the intids in the range are visited (if the utility
+        keeps them in a ``refs`` BTree, like zope.intid), so objects
+        outside it are not loaded.
+        """
+        uidutil, site = self._sublocationScope()
+        refs = getattr(uidutil, 'refs', None)
+        if refs is not None:
+            uids = refs.keys(min_uid, max_uid)
+        else:
+            uids = (
+                uid
+                for uid in uidutil
+                if (min_uid is None or uid >= min_uid)
+                and (max_uid is None or uid <= max_uid)
+            )
+        yield from self._visitUids(uids, uidutil, site)
+
+    @staticmethod
+    def _visitUids(uids, uidutil, site):
+        for uid in uids:
+            obj = uidutil.getObject(uid)
+            if site is None or location.inside(obj, site):
+                yield uid, obj
+
+    def _visitSublocations(self, min_uid=None, max_uid=None, applicable=None):
+        # Restricting to a range of intids is how parallel workers
+        # divide up the catalog and how updates resume.
+        if min_uid is None and max_uid is None:
+            sublocations = self._visitAllSublocations()
+        elif getattr(self._visitAllSublocations, '__func__', None) is Catalog._visitAllSublocations:
+            sublocations = self._visitSublocationsBetween(min_uid, max_uid)
+        else:
+            # Overridden, so we can only filter what it visits.
+            sublocations = (
+                x
+                for x in self._visitAllSublocations()
+                if (min_uid is None or x[0] >= min_uid)
+                and (max_uid is None or x[0] <= max_uid)
+            )
+        return self._filterSublocations(sublocations, applicable)
+
+    def _visitChangedSublocations(self, since, min_uid=None, applicable=None):
+        uidutil, site = self._sublocationScope()
+        uids = self.changedDocidsSince(since)
+        if min_uid is not None:
+            uids = uids.keys(min_uid)
+        return self._filterSublocations(self._visitUids(uids, uidutil, site),
+                                        applicable)
+
+    def _filterSublocations(self, sublocations, applicable=None):
+        """
+        Prefetch and yield the ``(uid, object)`` pairs of *sublocations*
+        that should be indexed. If *applicable* is given, it is a
+        :class:`_ClassApplicability`, and objects of classes that no
+        index could apply to are skipped.
+        """
         no_auto_inst = INoAutoIndex.providedBy
         no_auto_class = INoAutoIndex.implementedBy
         # Try to avoid activating the object if not necessary
@@ -234,17 +751,340 @@ class Catalog(_ZCatalog):
         # We'll just need to check instances down below.
         no_auto_class_sublocations = (
             x
-            for x in self._visitAllSublocations()
+            for x in sublocations
             if not no_auto_class(type(x[1])) # pylint:disable=no-value-for-parameter
+            and (applicable is None or any(applicable(type(x[1]))))
         )
+        chunk_sizer = None
+        if self.PREFETCH_CHUNK_SIZER is not None:
+            chunk_sizer = self.PREFETCH_CHUNK_SIZER(self.PREFETCH_CHUNK_SIZE)
         prefetched = CatalogPrefetchIterator(no_auto_class_sublocations,
-                                             self.PREFETCH_CHUNK_SIZE)
+                                             self.PREFETCH_CHUNK_SIZE,
+                                             self.PREFETCH_READ_AHEAD,
+                                             chunk_sizer)
 
         for uid, obj in prefetched:
             if no_auto_inst(obj): # pylint:disable=no-value-for-parameter
                 continue
             yield uid, obj
 
+    def index_docs(self, pairs):
+        """
+        Index each ``(docid, object)`` pair in *pairs* in all
+        the indexes of this catalog.
+
+        Indexes that have an ``index_docs`` method (see
+        :class:`~.BatchIndexMixin`) are given the whole batch at once.
+
+        .. versionadded:: 4.3.0
+        """
+        pairs = list(pairs)
+        self.invalidateQueryCache()
+        for index in self.values():
+            _index_docs(index, pairs)
+
+    def unindex_docs(self, docids):
+        """
+        Remove each docid in *docids* from all the indexes of this
+        catalog.
+
+        .. versionadded:: 4.3.0
+        """
+        docids = list(docids)
+        self.invalidateQueryCache()
+        for index in self.values():
+            unindex_docs = getattr(index, 'unindex_docs', None)
+            if unindex_docs is not None:
+                unindex_docs(docids)
+            else:
+                for docid in docids:
+                    index.unindex_doc(docid)
+
+    def apply(self, query):
+        """
+        Return the docids matching *query*, a mapping from index
+        names to the query for that index, or None if no index
+        applies.
+
+        Unlike :mod:`zope.catalog`, which applies every index and
+        then intersects the results, this plans the query. Indexes
+        with an ``estimate(query)`` method (all the value, set, field
+        and keyword indexes in this package) are asked for a cheap
+        upper bound on their number of results; if one is zero, there
+        are no results. The indexes are then applied in order of
+        increasing estimate, followed by those that can't estimate
+        (in the order given), stopping as soon as the intersection is
+        empty. Once the intersection is small enough (see
+        :attr:`PLAN_FILTER_RATIO`), indexes with an
+        ``apply_filtered(query, docids)`` method only check those
+        candidates.
+
+        If :attr:`QUERY_CACHE_SIZE` is set, results are cached (see
+        :meth:`invalidateQueryCache`). The results returned are
+        always new objects.
+
+        .. versionadded:: 4.3.0
+        """
+        cache = self._queryCache()
+        key = self._queryCacheKey(query) if cache is not None else None
+        if key is not None:
+            result = cache.get(key)
+            if result is not None:
+                return self._copyResult(result)
+
+        result = self._applyPlanned(query)
+        if key is not None and result is not None:
+            cache.put(key, self._copyResult(result))
+        return result
+
+    def _applyPlanned(self, query, filter_ratio=None):
+        if filter_ratio is None:
+            filter_ratio = self.PLAN_FILTER_RATIO
+        plan = []
+        for order, (index_name, index_query) in enumerate(query.items()):
+            index = self[index_name]
+            estimate = getattr(index, 'estimate', None)
+            if estimate is not None:
+                estimate = estimate(index_query)
+            if estimate == 0:
+                return self.family.IF.Set()
+            plan.append((estimate is None, estimate or 0, order, index, index_query))
+        plan.sort(key=lambda step: step[:3])
+
+        result = None
+        for _, estimate, _, index, index_query in plan:
+            apply_filtered = getattr(index, 'apply_filtered', None)
+            if (result is not None
+                    and apply_filtered is not None
+                    and len(result) <= estimate * filter_ratio):
+                r = apply_filtered(index_query, result)
+            else:
+                r = index.apply(index_query)
+            if r is None:
+                continue
+            if not r:
+                return r
+            if result is None:
+                result = r
+            else:
+                _, result = self.family.IF.weightedIntersection(result, r)
+                if not result:
+                    break
+        return result
+
+    def count(self, query):
+        """
+        Return the number of documents matching *query*, as
+        ``len(self.apply(query))`` would, or None if no index
+        applies.
+
+        When *query* involves a single index with a ``count(query)``
+        method (all the value, set, field and keyword indexes in this
+        package), that is used; for single-valued indexes, the count
+        comes from the lengths of postings without building any set
+        of docids. Otherwise, the query is planned as for
+        :meth:`apply`, but after the first (most selective) index, each
+        index with an ``apply_filtered`` method only checks the
+        candidates found so far, so large results are never built.
+
+        .. versionadded:: 4.3.0
+        """
+        if len(query) == 1:
+            (index_name, index_query), = query.items()
+            index_count = getattr(self[index_name], 'count', None)
+            if index_count is not None:
+                return index_count(index_query)
+        result = self._applyPlanned(query, filter_ratio=float('inf'))
+        return len(result) if result is not None else None
+
+    def _queryCache(self):
+        if not self.QUERY_CACHE_SIZE:
+            return None
+        # Volatile, so it's private to this connection and
+        # discarded with the catalog's state.
+        cache = getattr(self, '_v_query_cache', None)
+        if cache is None:
+            cache = self._v_query_cache = QueryCache(self.QUERY_CACHE_SIZE,
+                                                     self.QUERY_CACHE_MAX_BYTES)
+        return cache
+
+    def _queryCacheKey(self, query):
+        canonical = _canonical_query(query)
+        if canonical is None:
+            return None
+        counters = self._query_cache_counters
+        versions = []
+        for name in sorted(query):
+            counter = counters.get(name) if counters is not None else None
+            if counter is None:
+                version = 0
+            elif self._p_jar is not None and (counter._p_oid is None or counter._p_changed):
+                # The index has been changed in this transaction, which
+                # may yet be aborted.
+                return None
+            else:
+                version = counter.value
+            versions.append(version)
+        return canonical, tuple(versions)
+
+    def _copyResult(self, result):
+        if hasattr(result, 'items'):
+            return self.family.IF.Bucket(result)
+        return self.family.IF.Set(result)
+
+    def invalidateQueryCache(self, index_names=None):
+        """
+        Record that the indexes named in *index_names* (by default,
+        all of them) have changed, so that query results involving
+        them that were cached before are no longer used.
+
+        This is done automatically by the methods of this catalog
+        that change indexes, such as :meth:`index_doc`,
+        :meth:`unindex_doc` and :meth:`updateIndexes`, but must be
+        called if an index is changed directly. It does nothing
+        unless :attr:`QUERY_CACHE_SIZE` is set.
+
+        The changes are counted persistently, using
+        :class:`BTrees.Length.Length` objects (which resolve
+        conflicting changes), so each process caching results notices
+        changes committed by any other once it sees that transaction.
+        All processes using the catalog must therefore agree on
+        whether caching is enabled. Results aren't cached or found in
+        the cache for indexes changed in the current transaction.
+
+        .. versionadded:: 4.3.0
+        """
+        if not self.QUERY_CACHE_SIZE:
+            return
+        counters = self._query_cache_counters
+        if counters is None:
+            counters = self._query_cache_counters = self.family.OO.BTree()
+        for name in (self.keys() if index_names is None else index_names):
+            counter = counters.get(name)
+            if counter is None:
+                counter = counters[name] = Length()
+            counter.change(1)
+
+    def index_doc(self, docid, texts):
+        self.invalidateQueryCache()
+        super().index_doc(docid, texts)
+
+    def unindex_doc(self, docid):
+        self.invalidateQueryCache()
+        super().unindex_doc(docid)
+
+    def clear(self):
+        self.invalidateQueryCache()
+        super().clear()
+
+    def __delitem__(self, name):
+        self.invalidateQueryCache((name,))
+        super().__delitem__(name)
+
+    def searchResults(self, **searchterms):
+        """
+        Search the catalog, returning a :class:`ResultSet` (or None if
+        no index applied to the query).
+
+        As with :mod:`zope.catalog`, the special terms ``_sort_index``,
+        ``_limit`` and ``_reverse`` sort the results by the value in
+        the named index, which must provide
+        :class:`zope.index.interfaces.IIndexSort`, and keep only the
+        first *_limit* of them. Sorting is done by the index using
+        only its stored values, so no objects are loaded. The indexes
+        in this package walk their forward index in key order when
+        that's cheaper than looking up the value of each result.
+
+        If only a ``_sort_index`` from this package is given, with no
+        other terms, every document in that index is returned, in
+        order.
+
+        .. versionchanged:: 4.3.0
+           Return our own :class:`ResultSet`, and allow sorting
+           without a query.
+        """
+        sort_index = searchterms.pop('_sort_index', None)
+        limit = searchterms.pop('_limit', None)
+        reverse = searchterms.pop('_reverse', False)
+        if searchterms or sort_index is None:
+            results = self.apply(searchterms)
+            if results is None:
+                return None
+        else:
+            results = None
+
+        if sort_index is not None:
+            index = self[sort_index]
+            if not IIndexSort.providedBy(index):
+                raise ValueError('Index %s does not support sorting.' % sort_index)
+            if results is None and not isinstance(index, _SortMixin):
+                raise ValueError('Index %s cannot sort without a query.' % sort_index)
+            results = list(index.sort(results, limit=limit, reverse=reverse))
+        else:
+            if reverse or limit:
+                results = list(results)
+            if reverse:
+                results.reverse()
+            if limit:
+                del results[limit:]
+        uidutil = component.getUtility(IIntIds)
+        return ResultSet(results, uidutil)
+
+    def changedDocidsSince(self, tid):
+        """
+        Find the intids of objects modified after a transaction.
+
+        This iterates the transactions committed to the storage of
+        the database holding this catalog after the transaction
+        *tid* and returns the intids (in a tree set) of the objects
+        they stored. Only the records of the objects themselves are
+        considered: a change made only to a persistent sub-object
+        (such as an annotation) is not found. Objects that have been
+        removed are ignored.
+
+        No objects are loaded. The records of BTree internals (such as
+        buckets and lengths) are skipped, judging by the class in the
+        record. Each other object is looked up in the intid utility by
+        its key reference, which (for a zope.intid utility) needs only
+        its oid; objects without an intid are ignored. So the cost
+        depends on the number of changes, not on the size of the
+        catalog.
+
+        :param bytes tid: An 8-byte transaction id, such as
+            ``conn.db().lastTransaction()``.
+        :raises TypeError: If the storage does not support iteration.
+
+        .. versionadded:: 4.3.0
+        """
+        jar = self._p_jar
+        storage = jar.db().storage
+        if not IStorageIteration.providedBy(storage): # pylint:disable=no-value-for-parameter
+            raise TypeError("Storage does not support iteration", storage)
+
+        oids = set()
+        for txn in storage.iterator(p64(u64(tid) + 1)):
+            for record in txn:
+                # Removed objects have no data.
+                if record.data and not get_pickle_metadata(record.data)[0].startswith('BTrees.'):
+                    oids.add(record.oid)
+
+        uids = self.family.IF.TreeSet()
+        if oids:
+            uidutil, _ = self._sublocationScope()
+            ids = getattr(uidutil, 'ids', None)
+            for oid in oids:
+                # A ghost, which knows its jar and oid.
+                obj = jar.get(oid)
+                if ids is not None:
+                    # As zope.intid's queryId, without adapting the
+                    # object (which would load it).
+                    uid = ids.get(KeyReferenceToPersistent(obj))
+                else:
+                    uid = uidutil.queryId(obj)
+                if uid is not None:
+                    uids.add(uid)
+        return uids
+
     # we may get TypeError: __setstate__() takes exactly 2 arguments (1 given)
     # error or creator cannot be resolved (if a user has been deleted)
     # catch and continue
@@ -252,32 +1092,427 @@ class Catalog(_ZCatalog):
 
     # disable warning about different number of arguments than superclass
     # pylint: disable=I0011,W0221
-    def updateIndex(self, index, ignore_persistence_exceptions=True):
+    def updateIndex(self, index, ignore_persistence_exceptions=True,
+                    checkpoint_documents=None, checkpoint_seconds=None,
+                    transaction_manager=None, since=None):
         """
         Update a single index.
+
+        See :meth:`updateIndexes` for the remaining arguments.
         """
-        to_catch = self._PERSISTENCE_EXCEPTIONS if ignore_persistence_exceptions else ()
-        for uid, obj in self._visitSublocations():
-            try:
-                index.index_doc(uid, obj)
-            except to_catch as e:
-                logger.error("Error indexing object %s(%s); %s",
-                             type(obj), uid, e)
+        self._updateIndexes([index], ignore_persistence_exceptions,
+                            checkpoint_documents, checkpoint_seconds,
+                            transaction_manager, since)
 
-    def updateIndexes(self, ignore_persistence_exceptions=False):
+    def updateIndexes(self, ignore_persistence_exceptions=False,
+                      checkpoint_documents=None, checkpoint_seconds=None,
+                      transaction_manager=None, since=None):
         """
         Update all indexes in this catalog.
+
+        Normally this happens in the current transaction. If either
+        *checkpoint_documents* or *checkpoint_seconds* is given, the
+        update is *checkpointed*: the transaction is committed after
+        that many documents have been indexed or that many seconds
+        have elapsed, whichever comes first, and once more at the end.
+        The intid of the last document indexed is kept in a persistent
+        :class:`ResumeToken` that is committed along with the indexes,
+        so if the process dies, calling this method again with the
+        same indexes will pick up where the last checkpoint left off
+        instead of starting over; the objects before that point are
+        not visited again. The token is removed when the update
+        completes.
+
+        :keyword transaction_manager: The transaction manager to
+            commit when checkpointing. Defaults to that of this
+            catalog's connection, or the thread-local manager.
+        :keyword bytes since: If given, a transaction id. Instead of
+            visiting every object, only those found by
+            :meth:`changedDocidsSince` (and, as always, within the
+            nearest site) are indexed. This turns a periodic repair of
+            the whole catalog into loading only the changed objects.
+
+        Indexes that are empty, such as those just added to the
+        catalog or cleared, are built with their ``bulk_loader``, if
+        they have one, unless the update is checkpointed.
+
+        An index can declare which objects it applies to with an
+        ``applies_to`` attribute: a sequence of classes and
+        interfaces. It is then only given objects that are instances
+        of one of the classes or whose class implements one of the
+        interfaces (judged by the class alone), and objects that no
+        index applies to are skipped before they are loaded. See also
+        :attr:`SKIP_INAPPLICABLE_CLASSES`.
+
+        .. versionchanged:: 4.3.0
+           Add the checkpoint arguments and *since*, use bulk
+           loading, and support ``applies_to``.
         """
         # avoid the btree iterator for each object
-        indexes = list(self.values())
+        self._updateIndexes(list(self.values()), ignore_persistence_exceptions,
+                            checkpoint_documents, checkpoint_seconds,
+                            transaction_manager, since)
+
+    #: The :class:`ResumeToken` of an unfinished checkpointed
+    #: update, if any.
+    _resume_token = None
+
+    def _updateIndexes(self, indexes, ignore_persistence_exceptions,
+                       checkpoint_documents=None, checkpoint_seconds=None,
+                       transaction_manager=None, since=None):
+        to_catch = self._PERSISTENCE_EXCEPTIONS if ignore_persistence_exceptions else ()
+        if self.QUERY_CACHE_SIZE:
+            self.invalidateQueryCache([index.__name__ for index in indexes])
+        checkpointed = checkpoint_documents is not None or checkpoint_seconds is not None
+        min_uid = None
+        if checkpointed:
+            token = self._resumeToken(indexes)
+            if token.last_uid is not None:
+                min_uid = token.last_uid + 1
+                logger.info("Resuming update of %s after intid %s",
+                            token.index_names, token.last_uid)
+            if transaction_manager is None:
+                transaction_manager = getattr(self._p_jar, 'transaction_manager', None)
+            if transaction_manager is None:
+                transaction_manager = transaction.manager
+            documents = 0
+            last_checkpoint = time.monotonic()
+
+        applicable = self._classApplicability(indexes)
+        # Only passed when used, for subclasses that override these.
+        visit_kwargs = {} if applicable is None else {'applicable': applicable}
+        if since is None:
+            sublocations = self._visitSublocations(min_uid, **visit_kwargs)
+        else:
+            sublocations = self._visitChangedSublocations(since, min_uid, **visit_kwargs)
+
+        batch_size = self.PREFETCH_CHUNK_SIZE
+        if checkpoint_documents is not None:
+            batch_size = max(1, min(batch_size, checkpoint_documents))
+
+        # Empty indexes that can be bulk loaded collect everything
+        # and build their trees at the end. That can't be checkpointed.
+        loaders = []
+        indexers = []
+        for index in indexes:
+            loader = None if checkpointed else _bulk_loader(index)
+            if loader is not None:
+                loaders.append(loader)
+                indexers.append(loader.add)
+            else:
+                indexers.append(functools.partial(_index_docs, index))
+
+        while True:
+            batch = list(itertools.islice(sublocations, batch_size))
+            if not batch:
+                break
+            recorder = get_recorder()
+            if recorder is not None:
+                recorder.counted(self.__name__ or type(self).__name__,
+                                 'documents_visited', len(batch))
+            for number, index_docs in enumerate(indexers):
+                docs = batch
+                if applicable is not None:
+                    docs = [x for x in batch if applicable(type(x[1]))[number]]
+                    if not docs:
+                        continue
+                try:
+                    index_docs(docs)
+                except to_catch:
+                    # Go back and find the problem documents, indexing the
+                    # rest.
+                    for uid, obj in docs:
+                        try:
+                            index_docs([(uid, obj)])
+                        except to_catch as e:
+                            logger.error("Error indexing object %s(%s); %s",
+                                         type(obj), uid, e)
+            if checkpointed:
+                token.last_uid = batch[-1][0]
+                documents += len(batch)
+                now = time.monotonic()
+                if ((checkpoint_documents is not None and documents >= checkpoint_documents)
+                        or (checkpoint_seconds is not None
+                            and now - last_checkpoint >= checkpoint_seconds)):
+                    transaction_manager.commit()
+                    documents = 0
+                    last_checkpoint = now
+
+        for loader in loaders:
+            loader.finish()
+
+        if checkpointed:
+            del self._resume_token
+            transaction_manager.commit()
+
+    def _classApplicability(self, indexes):
+        """
+        Return a :class:`_ClassApplicability` for *indexes*, or None
+        if every index applies to everything.
+        """
+        if (self.SKIP_INAPPLICABLE_CLASSES
+                or any(getattr(index, 'applies_to', None) is not None for index in indexes)):
+            return _ClassApplicability(indexes, self.SKIP_INAPPLICABLE_CLASSES)
+        return None
+
+    def _resumeToken(self, indexes):
+        index_names = tuple(sorted(index.__name__ for index in indexes))
+        token = self._resume_token
+        if token is None or token.index_names != index_names:
+            token = self._resume_token = ResumeToken(index_names)
+        return token
+
+    def updateIndexesInParallel(self, db_factory, workers=None,
+                                ignore_persistence_exceptions=False,
+                                executor=None):
+        """
+        Update all indexes in this catalog, using multiple processes.
+
+        The intid space is divided into *workers* contiguous ranges.
+        Each range is visited (using the same filtering as
+        :meth:`updateIndexes`) in a worker process that opens its own
+        database by calling *db_factory* and loads this catalog from
+        it. The worker computes the value each attribute index would
+        store for each object in its range; the values are then merged
+        into the indexes of this catalog in this process, in intid
+        order.
+
+        Only indexes extending
+        :class:`zope.catalog.attribute.AttributeIndex` can be
+        computed by the workers. Any other index (for example, a
+        :class:`~.TopicIndex`) must see the whole object and is
+        updated in this process as with :meth:`updateIndexes`. So is
+        every index if the ``IIntIds`` utility of this catalog doesn't
+        keep its intids in a ``refs`` BTree (as zope.intid does),
+        because then the intids can't be divided up.
+
+        Workers only see committed data, so this catalog and its
+        indexes must already have been committed. The values computed
+        by the workers must be picklable.
+
+        :param db_factory: A picklable callable of no arguments
+            returning a :class:`ZODB.DB` for the database this catalog
+            lives in. A worker closes the database when it is done.
+        :keyword int workers: The number of ranges (and, if no *executor*
+            is given, processes) to use. Defaults to the number of CPUs.
+        :keyword executor: If given, a :class:`concurrent.futures.Executor`
+            to run the workers. Otherwise, a
+            :class:`concurrent.futures.ProcessPoolExecutor` is used. Note that
+            workers may need the component registry (e.g., to find the
+            :class:`~zope.intid.interfaces.IIntIds` utility) to be
+            configured, which is automatic only when processes are forked.
+
+        .. versionadded:: 4.3.0
+        """
+        if self._p_oid is None:
+            raise ValueError("Catalog must be committed to a database", self)
+        workers = workers or os.cpu_count() or 1
+
+        by_name = list(self.items())
+        attribute_names = [
+            name for name, index in by_name
+            # Note that some interfaces, such as IFieldIndex, extend
+            # IAttributeIndex, even if the object isn't one.
+            if isinstance(index, AttributeIndex)
+        ]
+        others = [index for name, index in by_name if name not in attribute_names]
+
+        bounds = self._uidBounds() if attribute_names else None
+        if bounds is None and attribute_names:
+            # There's no range of intids to divide up (the utility
+            # doesn't keep them in ``refs``), so do it all here.
+            logger.info("Cannot divide intids between workers; updating %s serially",
+                        attribute_names)
+            attribute_names = []
+            others = [index for _, index in by_name]
+        if attribute_names:
+            own_executor = executor is None
+            if own_executor:
+                executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+            try:
+                database_name = self._p_jar.db().database_name
+                futures = [
+                    executor.submit(_update_indexes_worker,
+                                    db_factory, database_name, self._p_oid,
+                                    attribute_names, min_uid, max_uid,
+                                    ignore_persistence_exceptions)
+                    for min_uid, max_uid in _split_uid_range(bounds[0], bounds[1], workers)
+                ]
+                # The ranges are in order, so merging the results
+                # in the order we submitted them touches each index
+                # in intid order.
+                for future in futures:
+                    self._mergeIndexValues(future.result())
+            finally:
+                if own_executor:
+                    executor.shutdown()
+
+        if others:
+            self._updateIndexes(others, ignore_persistence_exceptions)
+
+    def _uidBounds(self):
+        """
+        Return a tuple ``(min_uid, max_uid)`` giving the range of
+        intids that could be visited, or None if there are none or
+        the utility (as found by :meth:`_sublocationScope`) doesn't
+        keep them in ``refs``.
+        """
+        try:
+            uidutil, _ = self._sublocationScope()
+        except component.ComponentLookupError:
+            return None
+        refs = getattr(uidutil, 'refs', None)
+        if not refs:
+            return None
+        return refs.minKey(), refs.maxKey()
+
+    def _extractIndexValues(self, index_names, min_uid, max_uid,
+                            ignore_persistence_exceptions):
+        """
+        Called in a worker process. Returns a dictionary mapping
+        index name to a list of ``(uid, value)`` pairs.
+        """
+        indexes = [(name, self[name]) for name in index_names]
+        results = {name: [] for name in index_names}
         to_catch = self._PERSISTENCE_EXCEPTIONS if ignore_persistence_exceptions else ()
-        for uid, obj in self._visitSublocations():
-            for index in indexes:
+        applicable = self._classApplicability([index for _, index in indexes])
+        visit_kwargs = {} if applicable is None else {'applicable': applicable}
+        for uid, obj in self._visitSublocations(min_uid, max_uid, **visit_kwargs):
+            applies = applicable(type(obj)) if applicable is not None else None
+            for number, (name, index) in enumerate(indexes):
+                if applies is not None and not applies[number]:
+                    continue
                 try:
-                    index.index_doc(uid, obj)
+                    value = attribute_index_value(index, obj)
                 except to_catch as e:
                     logger.error("Error indexing object %s(%s); %s",
                                  type(obj), uid, e)
+                    continue
+                if value is not _NOT_APPLICABLE:
+                    results[name].append((uid, value))
+        return results
+
+    def _mergeIndexValues(self, results):
+        self.invalidateQueryCache(list(results))
+        for name, values in results.items():
+            index = self[name]
+            # Go through the normal ``index_doc`` path so that
+            # normalizers and subclasses see the value.
+            _index_docs(index, [
+                (uid, _ExtractedValue(index, value))
+                for uid, value in values
+            ])
+
+
+class _ClassApplicability(object):
+    """
+    Called with a class, returns a tuple of booleans telling whether
+    each of *indexes* could apply to instances of the class, judging
+    only by the class. The results are cached, for the duration of
+    one update, by class, making a dispatch table from classes to
+    indexes.
+
+    An index that declares ``applies_to`` (see
+    :meth:`Catalog.updateIndexes`) applies to subclasses of the
+    classes and implementers of the interfaces in it. Otherwise, if
+    *infer* is true, an attribute index with an ``interface`` applies
+    if instances could be adapted to it (see
+    :attr:`Catalog.SKIP_INAPPLICABLE_CLASSES`). Any other index
+    applies to everything.
+    """
+
+    def __init__(self, indexes, infer=False):
+        self._rules = [self._rule(index, infer) for index in indexes]
+        self._lookup = component.getSiteManager().adapters.lookup
+        self._cache = {}
+
+    @staticmethod
+    def _rule(index, infer):
+        applies_to = getattr(index, 'applies_to', None)
+        if applies_to is not None:
+            classes = tuple(x for x in applies_to if isinstance(x, type))
+            ifaces = tuple(x for x in applies_to if not isinstance(x, type))
+            return classes, ifaces
+        # Note that some interfaces, such as IFieldIndex, extend
+        # IAttributeIndex, even if the object isn't one.
+        if infer and isinstance(index, AttributeIndex) and index.interface is not None:
+            return index.interface
+        return None
+
+    def __call__(self, cls):
+        try:
+            return self._cache[cls]
+        except KeyError:
+            pass
+        result = self._cache[cls] = tuple(self._applies(rule, cls) for rule in self._rules)
+        return result
+
+    def _applies(self, rule, cls):
+        if rule is None:
+            return True
+        if isinstance(rule, tuple):
+            classes, ifaces = rule
+            return issubclass(cls, classes) or any(iface.implementedBy(cls) for iface in ifaces)
+        return self._may_adapt(cls, rule)
+
+    def _may_adapt(self, cls, iface):
+        if iface.implementedBy(cls) or hasattr(cls, '__conform__'):
+            return True
+        return self._lookup((interface.implementedBy(cls),), iface) is not None
+
+
+def _bulk_loader(index):
+    bulk_loader = getattr(index, 'bulk_loader', None)
+    return bulk_loader() if bulk_loader is not None else None
+
+
+def _index_docs(index, pairs):
+    index_docs = getattr(index, 'index_docs', None)
+    if index_docs is not None:
+        index_docs(pairs)
+    else:
+        for docid, value in pairs:
+            index.index_doc(docid, value)
+
+
+def _split_uid_range(min_uid, max_uid, count):
+    """
+    Divide the inclusive range from *min_uid* to *max_uid* into
+    at most *count* contiguous, inclusive, ranges.
+    """
+    step = max(1, (max_uid - min_uid + 1) // count)
+    ranges = []
+    low = min_uid
+    while low <= max_uid:
+        high = low + step - 1
+        if len(ranges) == count - 1 or high > max_uid:
+            high = max_uid
+        ranges.append((low, high))
+        low = high + 1
+    return ranges
+
+
+def _update_indexes_worker(db_factory, database_name, catalog_oid,
+                           index_names, min_uid, max_uid,
+                           ignore_persistence_exceptions):
+    """
+    The function run by each worker of :meth:`Catalog.updateIndexesInParallel`.
+    """
+    db = db_factory()
+    try:
+        conn = db.open()
+        try:
+            catalog_conn = conn
+            if database_name != conn.db().database_name:
+                catalog_conn = conn.get_connection(database_name)
+            catalog = catalog_conn.get(catalog_oid)
+            return catalog._extractIndexValues(index_names, min_uid, max_uid,
+                                               ignore_persistence_exceptions)
+        finally:
+            conn.close()
+    finally:
+        db.close()
+
 
 class DeferredCatalog(Catalog):
     """
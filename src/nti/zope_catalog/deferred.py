@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Deferred indexing for :class:`~.IDeferredCatalog` objects.
+
+The event subscribers in this module don't index anything. They only
+append ``(docid, operation)`` entries to the
+:class:`~.IDeferredIndexingQueue` utility, if there is one; if there
+isn't, they do nothing. Later, a worker (typically in a separate
+process, looping or run periodically) calls :func:`process_queue`,
+which applies the queued entries to every registered
+:class:`~.IDeferredCatalog` in large batches.
+
+To use it, include ``deferred.zcml`` from this package, which
+registers the subscribers (``configure.zcml`` doesn't), and register
+an :class:`IndexingQueue` as a (persistent, local) utility providing
+:class:`~.IDeferredIndexingQueue` next to the ``IIntIds`` utility.
+
+.. versionadded:: 4.3.0
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from itertools import islice
+import random
+import time
+
+import BTrees
+from persistent import Persistent
+import transaction
+from ZODB.POSException import ConflictError
+from zope import component
+from zope import interface
+from zope.catalog.interfaces import INoAutoIndex
+from zope.catalog.interfaces import INoAutoReindex
+from zope.container.contained import Contained
+from zope.intid.interfaces import IIntIdAddedEvent
+from zope.intid.interfaces import IIntIdRemovedEvent
+from zope.intid.interfaces import IIntIds
+from zope.lifecycleevent.interfaces import IObjectModifiedEvent
+
+from .catalog import CatalogPrefetchIterator
+from .interfaces import IDeferredCatalog
+from .interfaces import IDeferredIndexingQueue
+
+__docformat__ = "restructuredtext en"
+
+logger = __import__('logging').getLogger(__name__)
+
+#: The operation queued when an object gets an intid.
+ADDED = 'add'
+#: The operation queued when an object is modified.
+MODIFIED = 'modify'
+#: The operation queued when an object loses its intid.
+REMOVED = 'remove'
+
+
+def _coalesce(operations):
+    # The single operation with the same effect as *operations*, in
+    # order, or None if they cancel out. Only the first (was the
+    # document indexed before?) and the last (should it be indexed
+    # after?) matter.
+    indexed_before = operations[0] != ADDED
+    indexed_after = operations[-1] != REMOVED
+    if indexed_after:
+        return MODIFIED if indexed_before else ADDED
+    return REMOVED if indexed_before else None
+
+
+def _merge_items(old_items, committed_items, new_items):
+    # Merge three bucket states, each a flat tuple of
+    # (docid, entries, docid, entries, ...). Each entry is unique, so
+    # both sides' changes can be merged as sets: entries that either
+    # side added are kept, and entries that either side removed are
+    # dropped.
+    old, committed, new = (dict(zip(items[::2], items[1::2]))
+                           for items in (old_items, committed_items, new_items))
+    result = []
+    for docid in sorted(set(old).union(committed, new)):
+        old_entries = set(old.get(docid, ()))
+        committed_entries = set(committed.get(docid, ()))
+        new_entries = set(new.get(docid, ()))
+        entries = ((old_entries & committed_entries & new_entries)
+                   | (committed_entries - old_entries)
+                   | (new_entries - old_entries))
+        if entries:
+            result.extend((docid, tuple(sorted(entries))))
+    return tuple(result)
+
+
+class _EntriesBucket(BTrees.family64.IO.Bucket):
+    # A bucket of a _QueueBucket, resolving conflicts by merging
+    # entries.
+
+    def _p_resolveConflict(self, old_state, committed_state, new_state):
+        # As BTrees does, give up if the bucket was split or emptied
+        # (in which case the tree may have dropped it): only the
+        # contents of a bucket that stays where it is can be merged.
+        if not old_state[1:] == committed_state[1:] == new_state[1:]:
+            raise ConflictError("Queue bucket split concurrently")
+        if not committed_state[0] or not new_state[0]:
+            raise ConflictError("Queue bucket emptied concurrently")
+        items = _merge_items(old_state[0], committed_state[0], new_state[0])
+        if not items:
+            raise ConflictError("Queue bucket emptied concurrently")
+        return (items,) + new_state[1:]
+
+
+def _small_tree_items(state):
+    # The items of a tree small enough to hold them itself (as BTrees
+    # stores it), or None if it's larger.
+    if state is None:
+        return ()
+    if len(state) != 1:
+        return None
+    return state[0][0][0]
+
+
+class _QueueBucket(BTrees.family64.IO.BTree):
+    # Holds the entries for some of the docids, as
+    # {docid: ((stamp, operation), ...)}, with the entries for each
+    # docid in the order they were added. Each put replaces the
+    # entries of its docid with a new one for their combined
+    # operation, so there's usually only one; more can result from
+    # resolving conflicts. Being a BTree, a put only writes the small
+    # bucket holding its docid.
+
+    _bucket_type = _EntriesBucket
+
+    def put(self, docid, stamp, operation):
+        # If earlier entries cancel out, we still queue a removal: a
+        # worker may be indexing the document right now, and only new
+        # entries survive resolving a conflict with it.
+        operations = [op for _, op in self.get(docid, ())]
+        operations.append(operation)
+        self[docid] = ((stamp, _coalesce(operations) or REMOVED),)
+
+    def pull(self, limit):
+        # A worker sees all the entries of a docid at once, so here
+        # they can cancel out.
+        result = []
+        for docid, entries in list(islice(self.items(), limit)):
+            del self[docid]
+            operation = _coalesce([op for _, op in entries])
+            if operation is not None:
+                result.append((docid, operation))
+        return result
+
+    def _p_resolveConflict(self, old_state, committed_state, new_state):
+        # BTrees resolves conflicts in a small tree as in any bucket;
+        # merge its entries like those of our buckets instead.
+        states = [_small_tree_items(state)
+                  for state in (old_state, committed_state, new_state)]
+        if None in states:
+            raise ConflictError("Queue bucket split concurrently")
+        items = _merge_items(*states)
+        return (((items,),),) if items else None
+
+
+@interface.implementer(IDeferredIndexingQueue)
+class IndexingQueue(Persistent, Contained):
+    """
+    A persistent queue of ``(docid, operation)`` entries.
+
+    The entries are spread by docid over a number of BTrees, whose
+    buckets resolve conflicting changes by merging them, so
+    concurrent transactions adding entries don't conflict with each
+    other or with a worker pulling entries. Different docids may be
+    pulled in any order.
+
+    The entries for each docid are coalesced into a single operation
+    with the same effect: any number of modifications become one, an
+    addition followed by modifications remains an addition, and an
+    addition followed by a removal cancels out (except that, to be
+    safe with concurrent workers, the removal may still be applied,
+    which doesn't need the object). Thus a document changed many times
+    before the worker gets to it is loaded and indexed only once.
+    """
+
+    #: The default number of buckets.
+    BUCKETS = 64
+
+    #: How many low bits of each timestamp are random, to keep
+    #: entries made at the same time distinct.
+    _RANDOM_BITS = 16
+
+    def __init__(self, buckets=None):
+        self._buckets = tuple(_QueueBucket() for _ in range(buckets or self.BUCKETS))
+
+    def __len__(self):
+        return sum(len(entries)
+                   for bucket in self._buckets
+                   for entries in bucket.values())
+
+    def _new_stamp(self, _now=time.time, _randbits=random.getrandbits):
+        return (int(_now() * 1000000) << self._RANDOM_BITS) | _randbits(self._RANDOM_BITS)
+
+    def put(self, docid, operation):
+        buckets = self._buckets
+        buckets[docid % len(buckets)].put(docid, self._new_stamp(), operation)
+
+    def pull(self, limit=None):
+        buckets = self._buckets
+        # Start where the last pull stopped, so that no bucket waits
+        # forever behind busier ones.
+        start = getattr(self, '_v_next_bucket', 0)
+        result = []
+        for i in range(len(buckets)):
+            if limit is not None and len(result) >= limit:
+                break
+            index = (start + i) % len(buckets)
+            result.extend(buckets[index].pull(
+                None if limit is None else limit - len(result)))
+            self._v_next_bucket = index + 1
+        return result
+
+
+def _queue_for(ob):
+    return component.queryUtility(IDeferredIndexingQueue, context=ob)
+
+
+def _queue(ob, operation):
+    queue = _queue_for(ob)
+    if queue is None:
+        return
+    intids = component.queryUtility(IIntIds, context=queue)
+    docid = intids.queryId(ob) if intids is not None else None
+    if docid is not None:
+        queue.put(docid, operation)
+
+
+@component.adapter(IIntIdAddedEvent)
+def queueIndexDocSubscriber(event):
+    """
+    Queue indexing of an object that got an intid.
+    """
+    ob = event.object
+    if INoAutoIndex.providedBy(ob): # pylint:disable=no-value-for-parameter
+        return
+    _queue(ob, ADDED)
+
+
+@component.adapter(IObjectModifiedEvent)
+def queueReindexDocSubscriber(event):
+    """
+    Queue reindexing of a modified object.
+    """
+    ob = event.object
+    if INoAutoReindex.providedBy(ob): # pylint:disable=no-value-for-parameter
+        return
+    _queue(ob, MODIFIED)
+
+
+@component.adapter(IIntIdRemovedEvent)
+def queueUnindexDocSubscriber(event):
+    """
+    Queue unindexing of an object that is losing its intid.
+    """
+    _queue(event.object, REMOVED)
+
+
+def _apply_entries(entries, catalogs, intids, chunk_size):
+    to_unindex = []
+    to_index = []
+    for docid, operation in entries:
+        if operation == REMOVED:
+            to_unindex.append(docid)
+        else:
+            obj = intids.queryObject(docid)
+            if obj is None:
+                # Gone before we got to it.
+                to_unindex.append(docid)
+            else:
+                to_index.append((docid, obj))
+
+    if to_index:
+        to_index = list(CatalogPrefetchIterator(to_index, chunk_size))
+    for catalog in catalogs:
+        if to_unindex:
+            catalog.unindex_docs(to_unindex)
+        if to_index:
+            catalog.index_docs(to_index)
+
+
+def process_queue(queue=None, catalogs=None, intids=None,
+                  batch_size=1000, max_batches=None,
+                  transaction_manager=None, max_conflict_retries=5):
+    """
+    Apply the entries of *queue* to *catalogs*, committing after each
+    batch of at most *batch_size* entries, until the queue is empty or
+    *max_batches* batches have been committed. Returns the number of
+    entries processed.
+
+    Because entries are removed from the queue in the same transaction
+    that indexes them, a batch that fails is left in the queue. A batch
+    that raises a :class:`~ZODB.POSException.ConflictError` is retried
+    up to *max_conflict_retries* times in a row.
+
+    :keyword queue: The :class:`~.IDeferredIndexingQueue`. By default,
+        the registered utility.
+    :keyword catalogs: The catalogs to update. By default, all the
+        :class:`~.IDeferredCatalog` utilities registered in the context
+        of the queue.
+    :keyword intids: Used to find the objects. By default, the
+        ``IIntIds`` utility for the queue.
+    :keyword transaction_manager: The transaction manager to commit
+        with. By default, the one for the connection of the queue.
+    """
+    if queue is None:
+        queue = component.getUtility(IDeferredIndexingQueue)
+    if catalogs is None:
+        catalogs = list(component.getAllUtilitiesRegisteredFor(IDeferredCatalog,
+                                                               context=queue))
+    if intids is None:
+        intids = component.getUtility(IIntIds, context=queue)
+    if transaction_manager is None:
+        transaction_manager = getattr(queue._p_jar, 'transaction_manager', None)
+    if transaction_manager is None:
+        transaction_manager = transaction.manager
+
+    chunk_size = max((getattr(catalog, 'PREFETCH_CHUNK_SIZE', 0) for catalog in catalogs),
+                     default=0) or batch_size
+
+    processed = 0
+    batches = 0
+    conflicts = 0
+    while max_batches is None or batches < max_batches:
+        entries = queue.pull(batch_size)
+        if not entries:
+            break
+        try:
+            _apply_entries(entries, catalogs, intids, chunk_size)
+            transaction_manager.commit()
+        except ConflictError:
+            transaction_manager.abort()
+            conflicts += 1
+            if conflicts > max_conflict_retries:
+                raise
+            logger.info("Conflict processing %d queued entries; retrying", len(entries))
+            continue
+        conflicts = 0
+        batches += 1
+        processed += len(entries)
+        logger.debug("Processed %d queued entries", len(entries))
+    return processed
@@ -8,14 +8,23 @@ All of the indexes we define are compatible with both
 syntax (and public attributes).
 """
 
+import builtins
+import collections
+import heapq
+import itertools
 import logging
+import operator
+import random
+from collections import defaultdict
 from collections.abc import Mapping
 from collections.abc import Iterable
 
 import BTrees
+import persistent
 import six
 import zc.catalog.catalogindex
 import zc.catalog.index
+import zc.catalog.interfaces
 import zc.catalog.stemmer
 from zope.interface import implementer
 from zope.catalog.attribute import AttributeIndex
@@ -23,16 +32,24 @@ from zope.catalog.interfaces import ICatalogIndex
 from zope.catalog.text import TextIndex
 from zope.container.contained import Contained
 import zope.index.field
+import zope.index.interfaces
 import zope.index.keyword
 from zope.index.text import lexicon
 
 from nti.property.property import alias
+from nti.zope_catalog.bulk import ExternalSorter
+from nti.zope_catalog.bulk import bucket_items
+from nti.zope_catalog.bulk import fill_tree
+from nti.zope_catalog.instrumentation import get_recorder
 from nti.zope_catalog.interfaces import IFieldIndex
+from nti.zope_catalog.interfaces import IIndexStatistics
 from nti.zope_catalog.interfaces import IIntegerValueIndex
 from nti.zope_catalog.interfaces import IKeywordIndex
 from nti.zope_catalog.interfaces import ISetIndex
 from nti.zope_catalog.interfaces import ITextIndex
 from nti.zope_catalog.interfaces import IValueIndex
+from nti.zope_catalog.mixin import BatchIndexMixin
+from nti.zope_catalog.sortedarrays import SortedRangeArrays
 
 __docformat__ = "restructuredtext en"
 
@@ -56,6 +73,503 @@ def convertQuery(query):
     return query
 
 
+#: Returned by :func:`attribute_index_value` when the index
+#: would ignore the object entirely.
+_NOT_APPLICABLE = object()
+
+_MARKER = object()
+
+_first = operator.itemgetter(0)
+
+
+def attribute_index_value(index, obj):
+    """
+    Return the value that the
+    :class:`~zope.catalog.interfaces.IAttributeIndex` *index* would
+    index for *obj*.
+
+    This duplicates the logic of
+    :meth:`zope.catalog.attribute.AttributeIndex.index_doc`. A
+    return value of None means the document would be unindexed.
+
+    .. versionadded:: 4.3.0
+    """
+    if index.interface is not None:
+        obj = index.interface(obj, None)
+        if obj is None:
+            return _NOT_APPLICABLE
+    value = getattr(obj, index.field_name, None)
+    if value is not None and index.field_callable:
+        value = value()
+    return value
+
+
+class _ExtractedValue(object):
+    """
+    Stands in for a document whose indexed value has already been
+    computed by :func:`~.attribute_index_value`, so that it can be
+    passed back through an attribute index's ``index_doc``.
+    """
+
+    __slots__ = ('_field_name', '_value')
+
+    def __init__(self, index, value):
+        self._field_name = index.field_name
+        if value is not None and index.field_callable:
+            value = _ConstantCallable(value)
+        self._value = value
+
+    def __conform__(self, iface):
+        return self
+
+    def __getattr__(self, name):
+        if name == self._field_name:
+            return self._value
+        raise AttributeError(name)
+
+
+class _ConstantCallable(object):
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __call__(self):
+        return self.value
+
+
+def _count_skipped_writes(index, count):
+    # Reported to the enabled instrumentation recorder, if any.
+    recorder = get_recorder()
+    if recorder is not None and count:
+        recorder.counted(getattr(index, '__name__', None) or type(index).__name__,
+                         'skipped_writes', count)
+
+
+def _sorted_keys(mapping):
+    # Values stored in a single BTree are mutually orderable,
+    # but Python may not agree (e.g., None and strings in an OOBTree).
+    try:
+        return sorted(mapping)
+    except TypeError:
+        return list(mapping)
+
+
+def _btree_key(value):
+    # Order as a BTree would: None before anything else.
+    return (value is not None, value)
+
+
+def _value_sort_key(pair):
+    return _btree_key(pair[0])
+
+
+class _BulkLoader(object):
+    """
+    Collects documents for an empty index and then builds its trees
+    with :func:`~nti.zope_catalog.bulk.fill_tree`.
+
+    Documents are added in batches with :meth:`add`, just as with
+    ``index_docs``; nothing is stored in the index until
+    :meth:`finish` is called. Once more than ``MAX_IN_MEMORY``
+    documents have been added, they are spilled to disk.
+    """
+
+    MAX_IN_MEMORY = ExternalSorter.MAX_IN_MEMORY
+
+    def __init__(self, index):
+        self._index = index
+        self._docs = {}
+        # Docids unindexed after being added; only matters
+        # once we've spilled.
+        self._removed = set()
+        self._spilled = None
+
+    def add(self, pairs):
+        index = self._index
+        values, to_unindex = index._batch_values(pairs)
+        docs = self._docs
+        removed = self._removed
+        for docid, value in values.items():
+            value = index._bulk_value(value)
+            if value is _NOT_APPLICABLE:
+                to_unindex.append(docid)
+            else:
+                docs[docid] = value
+                removed.discard(docid)
+        for docid in to_unindex:
+            docs.pop(docid, None)
+            removed.add(docid)
+        if len(docs) >= self.MAX_IN_MEMORY:
+            if self._spilled is None:
+                self._spilled = ExternalSorter(key=_first,
+                                               max_in_memory=self.MAX_IN_MEMORY)
+            self._spilled.extend(docs.items())
+            self._docs = {}
+
+    def _sorted_docs(self):
+        if self._spilled is None:
+            # Docids are unique, so values are never compared.
+            return sorted(self._docs.items())
+        self._spilled.extend(self._docs.items())
+        return self._latest_docs(self._spilled, self._removed)
+
+    @staticmethod
+    def _latest_docs(docs, removed):
+        # The sort is stable, so the last of equal docids is the
+        # most recent.
+        docs = iter(docs)
+        pending = next(docs)
+        for item in docs:
+            if item[0] != pending[0] and pending[0] not in removed:
+                yield pending
+            pending = item
+        if pending[0] not in removed:
+            yield pending
+
+    def finish(self):
+        index = self._index
+        if self._spilled is None:
+            postings = []
+            add_posting = postings.append
+        else:
+            postings = ExternalSorter(key=_value_sort_key,
+                                      max_in_memory=self.MAX_IN_MEMORY)
+            add_posting = postings.add
+
+        docs = self._sorted_docs()
+        if not docs:
+            return
+
+        fill_tree(index._rev_index, index._bulk_rev_items(docs, add_posting))
+        if self._spilled is None:
+            try:
+                postings.sort()
+            except TypeError:
+                postings.sort(key=_value_sort_key)
+
+        bulk_posting = index._bulk_posting
+        fill_tree(index._fwd_index,
+                  ((value, bulk_posting([docid for _, docid in group]))
+                   for value, group in itertools.groupby(postings, key=_first)))
+
+        index._num_docs.change(len(index._rev_index))
+        index._change_word_count(len(index._fwd_index))
+        index._bulk_loaded()
+
+
+class _BatchMixin(BatchIndexMixin):
+    """
+    Shared parts of the efficient batch implementations. These work
+    with the ``_fwd_index``, ``_rev_index`` and ``_num_docs`` attributes
+    shared by zope.index and (through aliases) zc.catalog indexes.
+
+    The forward index is updated only after the reverse index for the
+    whole batch has been, once per distinct value, and the
+    ``_num_docs`` length is changed once per batch.
+    """
+
+    #: Does indexing a value of None unindex the document? This
+    #: is always true for attribute indexes.
+    _none_unindexes = True
+
+    def _batch_values(self, pairs):
+        """
+        Return a dictionary of ``{docid: value}`` to index
+        and a list of docids to unindex.
+        """
+        # Note that some interfaces, such as IFieldIndex, extend
+        # IAttributeIndex, even if the object isn't one.
+        if isinstance(self, AttributeIndex):
+            values = {}
+            for docid, obj in pairs:
+                value = attribute_index_value(self, obj)
+                if value is not _NOT_APPLICABLE:
+                    values[docid] = value
+            none_unindexes = True
+        else:
+            values = dict(pairs)
+            none_unindexes = self._none_unindexes
+        to_unindex = []
+        if none_unindexes:
+            to_unindex = [docid for docid, value in values.items() if value is None]
+            for docid in to_unindex:
+                del values[docid]
+        return values, to_unindex
+
+    def _change_word_count(self, delta):
+        "Subclasses that keep a word count ``Length`` override this."
+
+    def _bulk_loaded(self):
+        "Called when a :meth:`bulk_loader` has filled the empty trees."
+
+    def _is_stored(self, docid, value):
+        "Is *docid* indexed with *value*, as returned by ``_bulk_value``?"
+        raise NotImplementedError()
+
+    def _skip_write(self, docid, value):
+        """
+        If *docid* is already indexed with *value* (as returned by
+        ``_bulk_value``), count a skipped write and return True.
+        Indexing it again would only dirty the persistent objects
+        involved.
+        """
+        if self._is_stored(docid, value):
+            _count_skipped_writes(self, 1)
+            return True
+        return False
+
+    def _new_posting(self, docids):
+        return self.family.IF.TreeSet(docids)
+
+    def _add_to_fwd(self, added):
+        fwd = self._fwd_index
+        words = 0
+        for value in _sorted_keys(added):
+            docids = added[value]
+            docs = fwd.get(value)
+            if docs is None:
+                fwd[value] = self._new_posting(docids)
+                words += 1
+            else:
+                docs.update(docids)
+                self._posting_updated(value, docs)
+        if words:
+            self._change_word_count(words)
+
+    def _posting_updated(self, value, docs):
+        "Called when an existing posting has documents added."
+
+    def _remove_from_fwd(self, removed):
+        fwd = self._fwd_index
+        words = 0
+        for value in _sorted_keys(removed):
+            docs = fwd[value]
+            for docid in removed[value]:
+                docs.remove(docid)
+            if not docs:
+                del fwd[value]
+                words -= 1
+        if words:
+            self._change_word_count(words)
+
+    def _bulk_posting(self, docids):
+        return fill_tree(self.family.IF.TreeSet(), docids)
+
+    def bulk_loader(self):
+        """
+        If this index is empty, return an object with the methods
+        ``add(pairs)``, taking the same argument as :meth:`index_docs`,
+        and ``finish()``, which builds the index from everything
+        that was added using completely full BTree buckets (see
+        :mod:`nti.zope_catalog.bulk`). Documents are sorted in bounded
+        memory, spilling to temporary files as needed.
+
+        If the index is not empty, returns None.
+
+        .. versionadded:: 4.3.0
+        """
+        if self._rev_index or self._fwd_index:
+            return None
+        return _BulkLoader(self)
+
+    def bulk_load(self, pairs):
+        """
+        Index each ``(docid, value)`` pair in the iterable *pairs* into
+        this empty index using a :meth:`bulk_loader`. This is faster
+        than indexing them one at a time and results in fewer, smaller,
+        persistent objects.
+
+        :raises ValueError: If the index is not empty.
+
+        .. versionadded:: 4.3.0
+        """
+        loader = self.bulk_loader()
+        if loader is None:
+            raise ValueError("Can only bulk load an empty index", self)
+        loader.add(pairs)
+        loader.finish()
+
+    def index_docs(self, pairs):
+        """
+        Index each ``(docid, value)`` pair in the iterable *pairs*.
+
+        If the index is empty, this uses :meth:`bulk_load`.
+        """
+        loader = self.bulk_loader()
+        if loader is not None:
+            loader.add(pairs)
+            loader.finish()
+        else:
+            self._update_docs(pairs)
+
+
+class _SingleValueBatchMixin(_BatchMixin):
+    """
+    Batch indexing for indexes that store one value per document.
+    """
+
+    # See _PlanMixin
+    _postings_disjoint = True
+
+    def _normalize_batch_value(self, value):
+        return value
+
+    def _bulk_value(self, value):
+        return self._normalize_batch_value(value)
+
+    def _document_values(self, stored):
+        return (stored,)
+
+    def _bulk_rev_items(self, docs, add_posting):
+        for docid, value in docs:
+            add_posting((value, docid))
+            yield docid, value
+
+    def _is_stored(self, docid, value):
+        return self._rev_index.get(docid, _MARKER) == value
+
+    def _update_docs(self, pairs):
+        values, to_unindex = self._batch_values(pairs)
+        # Normalize everything first, so that a value that can't be
+        # normalized leaves the index unchanged.
+        normalize = self._normalize_batch_value
+        items = [(docid, normalize(value))
+                 for docid, value in sorted(values.items(), key=_first)]
+        self.unindex_docs(to_unindex)
+        self._index_batch(items)
+
+    def _index_batch(self, items):
+        rev = self._rev_index
+        added = defaultdict(list)
+        removed = defaultdict(list)
+        new_docs = 0
+        skipped = 0
+        for docid, value in items:
+            old = rev.get(docid, _MARKER)
+            if old is _MARKER:
+                new_docs += 1
+            elif old == value:
+                skipped += 1
+                continue
+            else:
+                removed[old].append(docid)
+            rev[docid] = value
+            added[value].append(docid)
+        self._remove_from_fwd(removed)
+        self._add_to_fwd(added)
+        if new_docs:
+            self._num_docs.change(new_docs)
+        _count_skipped_writes(self, skipped)
+
+    def unindex_docs(self, docids):
+        rev = self._rev_index
+        removed = defaultdict(list)
+        for docid in sorted(set(docids)):
+            old = rev.get(docid, _MARKER)
+            if old is not _MARKER:
+                del rev[docid]
+                removed[old].append(docid)
+        self._remove_from_fwd(removed)
+        count = sum(len(v) for v in removed.values())
+        if count:
+            self._num_docs.change(-count)
+
+
+class _MultiValueBatchMixin(_BatchMixin):
+    """
+    Batch indexing for indexes that store a set of values per document.
+    """
+
+    def _batch_value_set(self, value):
+        """
+        Return the set of values to store for *value*, or None if the
+        document should be unindexed.
+        """
+        raise NotImplementedError()
+
+    def _store_values(self, docid, old, new, added, removed):
+        raise NotImplementedError()
+
+    def _bulk_value(self, value):
+        new = self._batch_value_set(value)
+        return new if new is not None else _NOT_APPLICABLE
+
+    def _document_values(self, stored):
+        return stored
+
+    def _bulk_rev_items(self, docs, add_posting):
+        for item in docs:
+            docid = item[0]
+            for value in item[1]:
+                add_posting((value, docid))
+            yield item
+
+    def _is_stored(self, docid, value):
+        old = self._rev_index.get(docid)
+        if old is None or value is _NOT_APPLICABLE:
+            return False
+        difference = self.family.OO.difference
+        return not difference(value, old) and not difference(old, value)
+
+    def _update_docs(self, pairs):
+        values, to_unindex = self._batch_values(pairs)
+        items = []
+        for docid, value in sorted(values.items(), key=_first):
+            new = self._batch_value_set(value)
+            if new is None:
+                to_unindex.append(docid)
+            else:
+                items.append((docid, new))
+        self.unindex_docs(to_unindex)
+        self._index_batch(items)
+
+    def _index_batch(self, items):
+        rev = self._rev_index
+        difference = self.family.OO.difference
+        added = defaultdict(list)
+        removed = defaultdict(list)
+        new_docs = 0
+        skipped = 0
+        for docid, new in items:
+            old = rev.get(docid)
+            if old is None:
+                new_docs += 1
+                added_values = new
+                removed_values = ()
+            else:
+                added_values = difference(new, old)
+                removed_values = difference(old, new)
+                if not added_values and not removed_values:
+                    skipped += 1
+                    continue
+            for value in added_values:
+                added[value].append(docid)
+            for value in removed_values:
+                removed[value].append(docid)
+            self._store_values(docid, old, new, added_values, removed_values)
+        self._remove_from_fwd(removed)
+        self._add_to_fwd(added)
+        if new_docs:
+            self._num_docs.change(new_docs)
+        _count_skipped_writes(self, skipped)
+
+    def unindex_docs(self, docids):
+        rev = self._rev_index
+        removed = defaultdict(list)
+        count = 0
+        for docid in sorted(set(docids)):
+            old = rev.get(docid)
+            if old is not None:
+                del rev[docid]
+                count += 1
+                for value in old:
+                    removed[value].append(docid)
+        self._remove_from_fwd(removed)
+        if count:
+            self._num_docs.change(-count)
+
+
 class _ZCApplyMixin(object):
     """
     Convert zope.index style two-tuple query to new style.
@@ -77,6 +591,84 @@ class _ZCAbstractIndexMixin(object):
     _fwd_index = alias('values_to_documents')
     _rev_index = alias('documents_to_values')
 
+    def _change_word_count(self, delta):
+        self.wordCount.change(delta)
+
+    def _distinct_value_count(self):
+        return self.wordCount.value
+
+    def index_doc(self, doc_id, value):
+        base = super()
+        if isinstance(self, AttributeIndex):
+            # In our attribute indexes, this comes before AttributeIndex
+            # in the MRO, so we're given the object (see _batch_values).
+            # Extract the value just once, as AttributeIndex would, and
+            # pass it to the index beyond.
+            value = attribute_index_value(self, value)
+            if value is _NOT_APPLICABLE:
+                return None
+            base = super(AttributeIndex, self) # pylint:disable=bad-super-call
+            if value is None:
+                return base.unindex_doc(doc_id)
+        # zc.catalog writes the stored value even if it's unchanged.
+        # We index the normalized value, so that an iterable is only
+        # consumed once.
+        new = self._bulk_value(value)
+        if new is _NOT_APPLICABLE:
+            new = ()
+        elif self._skip_write(doc_id, new):
+            return None
+        return base.index_doc(doc_id, new)
+
+    def estimate(self, query):
+        query_type, query = zc.catalog.index.parseQuery(convertQuery(query))
+        try:
+            if query_type == 'any_of':
+                return self._estimate_postings(query)
+            if query_type == 'all_of':
+                return self._estimate_postings(query, all_of=True)
+            if query_type == 'between':
+                return self._estimate_postings(self._fwd_index.keys(*query))
+        except TypeError:
+            # apply finds nothing.
+            return 0
+        if query_type == 'any' and query is None:
+            return self._num_docs.value
+        return None
+
+    def count(self, query):
+        query_type, values = zc.catalog.index.parseQuery(convertQuery(query))
+        try:
+            if query_type == 'any_of':
+                values = _distinct(values)
+                if self._postings_disjoint or len(values) == 1:
+                    return self._count_postings(values)
+            elif query_type == 'all_of':
+                values = _distinct(values)
+                if len(values) == 1:
+                    return self._count_postings(values)
+            elif query_type == 'between' and self._postings_disjoint:
+                return self._count_postings(self._fwd_index.keys(*values))
+        except TypeError:
+            # apply finds nothing.
+            return 0
+        if query_type == 'any' and values is None:
+            return self._num_docs.value
+        return super().count(query)
+
+    def _query_filter(self, query):
+        # For single values; SetIndex overrides.
+        query_type, query = zc.catalog.index.parseQuery(convertQuery(query))
+        if query_type == 'any_of':
+            try:
+                values = frozenset(query)
+            except TypeError:
+                values = list(query)
+            return (lambda value: value in values), False
+        if query_type == 'between':
+            return _range_filter(*query), False
+        return None
+
 
 class _ZipMixin(object):
 
@@ -94,8 +686,492 @@ class _SetZipMixin(_ZipMixin):
             # friendly
             yield d, set(v) if v is not None else None
 
+
+class _SortMixin(object):
+    """
+    Replaces the ``sort`` method of :class:`zope.index.interfaces.IIndexSort`
+    for single-valued indexes.
+
+    Documents are ordered by their value, and then by docid, so that a
+    reverse sort is exactly the reverse of a forward sort. Either the
+    value of each docid is looked up and the results sorted (using a
+    heap when *limit* is small), or, when the docids are a large
+    enough part of the index that the first *limit* of them are
+    likely to be found early, the forward index is walked in key
+    order, stopping once enough have been found. Reverse walks are
+    supported for indexes whose keys are integers (see
+    :attr:`_sort_integer_keys`). No objects are loaded either way.
+
+    The *docids* may also be None, meaning every document in the
+    index.
+    """
+
+    #: Whether every key of the forward index is an integer, so that
+    #: the forward index can be walked backwards with ``maxKey``.
+    _sort_integer_keys = False
+
+    def sort(self, docids, reverse=False, limit=None):
+        if limit is not None and limit < 1:
+            raise ValueError('limit value must be 1 or greater')
+
+        if docids is not None:
+            if not isinstance(docids, (self.family.IF.Set, self.family.IF.TreeSet)):
+                docids = self.family.IF.Set(docids)
+            if not self._sort_by_walking(docids, reverse, limit):
+                yield from self._sort_by_value(docids, reverse, limit)
+                return
+
+        fwd_index = getattr(self, self._sorting_fwd_index_attr)
+        if not reverse:
+            postings = fwd_index.values()
+        elif self._sort_integer_keys:
+            postings = _reversed_integer_values(fwd_index)
+        else:
+            # Only happens for all the documents; we have to
+            # load every posting anyway.
+            postings = reversed(list(fwd_index.values()))
+
+        count = 0
+        for posting in postings:
+            if reverse:
+                posting = reversed(list(posting))
+            for docid in posting:
+                if docids is not None and docid not in docids:
+                    continue
+                yield docid
+                count += 1
+                if count == limit:
+                    return
+
+    def _sort_by_walking(self, docids, reverse, limit):
+        if reverse and not self._sort_integer_keys:
+            return False
+        numdocs = getattr(self, self._sorting_num_docs_attr).value
+        rlen = len(docids)
+        if not rlen or not numdocs:
+            return False
+        if limit:
+            # If the docids are spread evenly, we expect to check
+            # ``limit * numdocs / rlen`` documents while walking,
+            # compared to looking up the value of all ``rlen``.
+            return limit * numdocs < rlen * rlen
+        # Sorting everything; walking checks every document in
+        # the index, but doesn't have to sort.
+        return numdocs <= 2 * rlen
+
+    def _sort_by_value(self, docids, reverse, limit):
+        rev_index = getattr(self, self._sorting_rev_index_attr)
+        get = rev_index.get
+        pairs = []
+        for docid in docids:
+            value = get(docid, _MARKER)
+            if value is not _MARKER:
+                pairs.append((value, docid))
+        try:
+            pairs = _sorted_pairs(pairs, reverse, limit)
+        except TypeError:
+            # Values stored in the same BTree are mutually
+            # orderable, but None may not be to Python.
+            pairs = _sorted_pairs(pairs, reverse, limit, _pair_sort_key)
+        return [docid for _, docid in pairs]
+
+
+def _pair_sort_key(pair):
+    return (_btree_key(pair[0]), pair[1])
+
+
+def _sorted_pairs(pairs, reverse, limit, key=None):
+    if limit and limit * 4 < len(pairs):
+        nbest = heapq.nlargest if reverse else heapq.nsmallest
+        return nbest(limit, pairs, key=key)
+    pairs.sort(key=key, reverse=reverse)
+    return pairs[:limit] if limit else pairs
+
+
+def _reversed_integer_values(tree):
+    if not tree:
+        return
+    min_key = tree.minKey()
+    key = tree.maxKey()
+    while True:
+        yield tree[key]
+        if key == min_key:
+            break
+        key = tree.maxKey(key - 1)
+
+
+class _PlanMixin(object):
+    """
+    Support for planning catalog queries (see
+    :meth:`nti.zope_catalog.catalog.Catalog.apply`).
+
+    Subclasses implement :meth:`estimate` and ``_query_filter``.
+    """
+
+    #: How many postings :meth:`estimate` will look at. If a query
+    #: involves more, the number of documents in the index is used
+    #: instead.
+    _ESTIMATE_MAX_POSTINGS = 64
+
+    def estimate(self, query):
+        """
+        Return an upper bound on the number of documents that
+        ``apply(query)`` would return, or None if it can't be found
+        cheaply. This uses the lengths of postings in the forward
+        index, and the number of documents, without applying the
+        query.
+
+        .. versionadded:: 4.3.0
+        """
+        return None
+
+    #: Whether each document is in at most one posting of the forward
+    #: index, so that the lengths of postings can be added to count
+    #: documents.
+    _postings_disjoint = False
+
+    def count(self, query):
+        """
+        Return the number of documents that ``apply(query)`` would
+        return, or None if the query isn't applicable.
+
+        Where possible, this is found from the lengths of postings
+        and the number of documents, without building the result.
+
+        .. versionadded:: 4.3.0
+        """
+        result = self.apply(query)
+        return len(result) if result is not None else None
+
+    def _count_postings(self, values):
+        # Exact for distinct values when postings are disjoint.
+        fwd_index = self._fwd_index
+        total = 0
+        for value in values:
+            posting = fwd_index.get(value)
+            if posting is not None:
+                total += len(posting)
+        return total
+
+    def _estimate_postings(self, values, all_of=False):
+        fwd_index = self._fwd_index
+        numdocs = self._num_docs.value
+        lengths = []
+        try:
+            for value in values:
+                if len(lengths) == self._ESTIMATE_MAX_POSTINGS:
+                    return numdocs
+                posting = fwd_index.get(value)
+                lengths.append(len(posting) if posting is not None else 0)
+        except TypeError:
+            # Like apply, ignore values of the wrong type.
+            pass
+        if all_of:
+            return min(lengths) if lengths else 0
+        return min(sum(lengths), numdocs)
+
+    def _query_filter(self, query):
+        """
+        Return a function taking a stored value and returning the
+        weight of the document in the results of *query* (zero if it
+        doesn't match) and whether the results are weighted, or None
+        if that's not supported for the query.
+        """
+        return None
+
+    def apply_filtered(self, query, docids):
+        """
+        Return the same results as ``apply(query)`` (including the
+        weights, if any) but only for documents in *docids*.
+
+        When *docids* is small this is much cheaper than applying the
+        query, because only the stored values for *docids* are
+        examined.
+
+        .. versionadded:: 4.3.0
+        """
+        query_filter = self._query_filter(query)
+        if query_filter is None:
+            result = self.apply(query)
+            if result is None:
+                return None
+            # A weight of zero for docids keeps the weights of result.
+            return self.family.IF.weightedIntersection(result, docids, 1, 0)[1]
+
+        match, weighted = query_filter
+        get = self._rev_index.get
+        result = self.family.IF.Bucket() if weighted else self.family.IF.Set()
+        for docid in docids:
+            value = get(docid, _MARKER)
+            if value is _MARKER:
+                continue
+            weight = match(value)
+            if not weight:
+                continue
+            if weighted:
+                result[docid] = weight
+            else:
+                result.add(docid)
+        return result
+
+
+@implementer(IIndexStatistics)
+class IndexStatistics(object):
+    """
+    The distribution of the values of an index, as returned by
+    ``statistics()``.
+
+    Counts are numbers of documents. When only a sample of the
+    documents was examined, the counts are scaled up from the sample,
+    and so are estimates.
+
+    .. versionadded:: 4.3.0
+    """
+
+    def __init__(self, documents, distinct_values, heavy_hitters, histogram,
+                 values_per_document, sampled_documents):
+        self.documents = documents
+        self.distinct_values = distinct_values
+        self.heavy_hitters = heavy_hitters
+        self.histogram = histogram
+        self.values_per_document = values_per_document
+        self.sampled_documents = sampled_documents
+
+    @property
+    def exact(self):
+        return self.sampled_documents == self.documents
+
+    @classmethod
+    def from_counts(cls, documents, distinct_values, counts, sampled_documents,
+                    top=10, buckets=10):
+        """
+        Compute the statistics from *counts*, a
+        :class:`collections.Counter` of the number of documents having
+        each value among *sampled_documents* of the *documents*.
+        """
+        scale = documents / sampled_documents if sampled_documents else 0
+
+        def scaled(count):
+            return int(round(count * scale))
+
+        heavy_hitters = [(value, scaled(count)) for value, count in counts.most_common(top)]
+        total = sum(counts.values())
+        # Equi-depth: each bucket closes once it holds its share of
+        # the value occurrences. A value is never split between
+        # buckets, so a frequent value can make one much deeper.
+        histogram = []
+        depth = total / buckets if buckets else total
+        low = None
+        in_bucket = 0
+        seen = 0
+        for value in sorted(counts, key=_btree_key):
+            if not in_bucket:
+                low = value
+            count = counts[value]
+            in_bucket += count
+            seen += count
+            if seen >= depth * (len(histogram) + 1) or seen == total:
+                histogram.append((low, value, scaled(in_bucket)))
+                in_bucket = 0
+        return cls(documents, distinct_values, heavy_hitters, histogram,
+                   total / sampled_documents if sampled_documents else 0.0,
+                   sampled_documents)
+
+    def __repr__(self):
+        return "<%s documents=%d distinct_values=%d values_per_document=%.2f sampled=%d>" % (
+            type(self).__name__, self.documents, self.distinct_values,
+            self.values_per_document, self.sampled_documents)
+
+
+def _sample_items(tree, count, size, _randint=random.randint):
+    # All the (key, value) items of *tree*, which has *count* of them,
+    # if there are no more than *size*; otherwise, the items of up to
+    # *size* random keys. Only the buckets holding those are loaded.
+    if count <= size:
+        for items in bucket_items(tree):
+            yield from zip(items[::2], items[1::2])
+        return
+    low = tree.minKey()
+    high = tree.maxKey()
+    seen = set()
+    for _ in range(size):
+        key = tree.minKey(_randint(low, high))
+        if key not in seen:
+            seen.add(key)
+            yield key, tree[key]
+
+
+class _StatisticsMixin(object):
+    """
+    Computes :class:`IndexStatistics` from a sample of the reverse
+    index.
+    """
+
+    #: The most documents :meth:`statistics` examines by default.
+    STATISTICS_SAMPLE_SIZE = 10000
+
+    def statistics(self, top=10, buckets=10, sample_size=None):
+        """
+        Return an :class:`IndexStatistics` describing the values of
+        this index: the number of documents and distinct values, the
+        *top* most common values, an equi-depth histogram of (up to)
+        *buckets* ``(low, high, documents)`` tuples over the stored
+        (normalized) values, and the average number of values per
+        document.
+
+        The stored values of at most *sample_size* (by default,
+        :attr:`STATISTICS_SAMPLE_SIZE`) documents are examined. If the
+        index has more, they are chosen at random, and all but the
+        number of documents and distinct values are estimated. The
+        postings of the forward index are never loaded.
+
+        .. versionadded:: 4.3.0
+        """
+        documents = self._statistics_documents()
+        sample_size = sample_size or self.STATISTICS_SAMPLE_SIZE
+        counts, sampled = self._statistics_sample(documents, sample_size)
+        return IndexStatistics.from_counts(documents, self._distinct_value_count(),
+                                           counts, sampled, top, buckets)
+
+    def _statistics_documents(self):
+        return self._num_docs.value
+
+    def _distinct_value_count(self):
+        return len(self._fwd_index)
+
+    def _statistics_sample(self, documents, size):
+        """
+        Return a counter of the values of the documents sampled, and
+        how many were.
+        """
+        counts = collections.Counter()
+        sampled = 0
+        document_values = self._document_values
+        for _, stored in _sample_items(self._rev_index, documents, size):
+            counts.update(document_values(stored))
+            sampled += 1
+        return counts, sampled
+
+
+class _ArrayMixin(object):
+    """
+    Export and import of the values of a single-valued index as
+    parallel NumPy arrays.
+
+    NumPy is not a dependency of this package (install the ``numpy``
+    extra); it's only imported when these methods are called.
+    """
+
+    #: The NumPy dtype of the values returned by :meth:`to_arrays`.
+    _array_value_dtype = object
+
+    def to_arrays(self, doc_ids=None, value_dtype=None):
+        """
+        Return a pair of NumPy arrays ``(docids, values)``, where
+        ``values[i]`` is the value stored for ``docids[i]``. The docids
+        are an ``int64`` array; the values have the *value_dtype* (by
+        default, ``int64`` for integer indexes and ``object``
+        otherwise).
+
+        If *doc_ids* is None, every document is returned, in docid
+        order, reading the stored values one bucket at a time.
+        Otherwise, only those of *doc_ids* that are indexed are
+        returned, in the order given.
+
+        .. versionadded:: 4.3.0
+        """
+        import numpy # pylint:disable=import-outside-toplevel
+        docids = []
+        values = []
+        if doc_ids is None:
+            for items in bucket_items(self._rev_index):
+                docids.extend(items[0::2])
+                values.extend(items[1::2])
+        else:
+            get = self._rev_index.get
+            for docid in doc_ids:
+                value = get(docid, _MARKER)
+                if value is not _MARKER:
+                    docids.append(docid)
+                    values.append(value)
+        if value_dtype is None:
+            value_dtype = self._array_value_dtype
+        return (numpy.array(docids, dtype=numpy.int64),
+                numpy.array(values, dtype=value_dtype))
+
+    def from_arrays(self, docids, values):
+        """
+        Index ``values[i]`` for ``docids[i]``, for the parallel
+        sequences (usually NumPy arrays, as returned by
+        :meth:`to_arrays`) *docids* and *values*. This uses
+        ``index_docs``, so an empty index is bulk loaded.
+
+        For an attribute index, the *values* are those that it would
+        extract from the documents.
+
+        .. versionadded:: 4.3.0
+        """
+        if len(docids) != len(values):
+            raise ValueError("docids and values must be the same length")
+        # Python objects, as BTrees need.
+        docids = docids.tolist() if hasattr(docids, 'tolist') else docids
+        values = values.tolist() if hasattr(values, 'tolist') else values
+        if isinstance(self, AttributeIndex):
+            values = [_ExtractedValue(self, value) for value in values]
+        self.index_docs(zip(docids, values))
+
+
+def _distinct(values):
+    try:
+        return set(values)
+    except TypeError:
+        # Not hashable, so not indexed; let the caller deal with it.
+        return list(values)
+
+
+def _range_filter(min_value=None, max_value=None, excludemin=False, excludemax=False):
+    # Matches the keys that ``BTree.keys(min, max, excludemin, excludemax)``
+    # would return.
+    low = None if min_value is None else _btree_key(min_value)
+    high = None if max_value is None else _btree_key(max_value)
+
+    def match(value):
+        key = _btree_key(value)
+        try:
+            if low is not None and (key < low or (excludemin and key == low)):
+                return False
+            if high is not None and (key > high or (excludemax and key == high)):
+                return False
+        except TypeError:
+            return False
+        return True
+    return match
+
+
+def _count_in_range(values, query):
+    try:
+        return sum(1 for _ in values.keys(*query))
+    except TypeError:
+        return 0
+
+
+def _count_contained(values, query):
+    count = 0
+    for value in query:
+        try:
+            if value in values:
+                count += 1
+        except TypeError:
+            pass
+    return count
+
+
 @implementer(IFieldIndex)
 class NormalizingFieldIndex(_ZipMixin,
+                            _SingleValueBatchMixin,
+                            _SortMixin,
+                            _PlanMixin,
+                            _StatisticsMixin,
                             zope.index.field.FieldIndex,
                             Contained):
     """
@@ -107,18 +1183,46 @@ class NormalizingFieldIndex(_ZipMixin,
     # We default to 64-bit trees
     family = BTrees.family64
 
+    # A field index can store None.
+    _none_unindexes = False
+
     def normalize(self, value):
         """Subclasses must override this method."""
         raise NotImplementedError()
 
+    def _normalize_batch_value(self, value):
+        return self.normalize(value)
+
     def index_doc(self, docid, value):
-        super().index_doc(
-            docid, self.normalize(value))
+        value = self.normalize(value)
+        if not self._skip_write(docid, value):
+            super().index_doc(docid, value)
 
     def apply(self, query):
         query = tuple(self.normalize(x) for x in query)
         return super().apply(query)
 
+    def _normalize_range(self, query):
+        # As apply accepts it.
+        query = tuple(self.normalize(x) for x in query)
+        if len(query) != 2:
+            raise TypeError("two-length tuple expected", query)
+        return query
+
+    def estimate(self, query):
+        try:
+            query = self._normalize_range(query)
+            return self._estimate_postings(self._fwd_index.keys(*query))
+        except TypeError:
+            return None
+
+    def _query_filter(self, query):
+        return _range_filter(*self._normalize_range(query)), False
+
+    def count(self, query):
+        query = self._normalize_range(query)
+        return self._count_postings(self._fwd_index.keys(*query))
+
     def ids(self):
         return self._rev_index.keys()
 
@@ -152,6 +1256,11 @@ class CaseInsensitiveAttributeFieldIndex(AttributeIndex,
 class ValueIndex(_ZCApplyMixin,
                  _ZCAbstractIndexMixin,
                  _ZipMixin,
+                 _ArrayMixin,
+                 _SingleValueBatchMixin,
+                 _SortMixin,
+                 _PlanMixin,
+                 _StatisticsMixin,
                  zc.catalog.index.ValueIndex):
     "An index of raw values."
 
@@ -165,10 +1274,37 @@ class AttributeValueIndex(ValueIndex,
 @implementer(ISetIndex)
 class SetIndex(_ZCAbstractIndexMixin,
                _SetZipMixin,
+               _MultiValueBatchMixin,
+               _PlanMixin,
+               _StatisticsMixin,
                zc.catalog.index.SetIndex):
 
     "An index of values that are multiple."
 
+    def _batch_value_set(self, value):
+        new = self.family.OO.TreeSet(v for v in value if v is not None)
+        return new if new else None
+
+    def _query_filter(self, query):
+        query_type, query = zc.catalog.index.parseQuery(convertQuery(query))
+        if query_type == 'any_of':
+            # Weighted by the number of matching values.
+            return (lambda values: _count_contained(values, query)), True
+        if query_type == 'all_of' and query:
+            query = list(query)
+            return (lambda values: _count_contained(values, query) == len(query)), False
+        if query_type == 'between':
+            return (lambda values: _count_in_range(values, query)), True
+        return None
+
+    def _store_values(self, docid, old, new, added, removed):
+        if old is None:
+            self.documents_to_values[docid] = new
+        else:
+            for v in removed:
+                old.remove(v)
+            old.update(added)
+
 class AttributeSetIndex(SetIndex,
                         zc.catalog.catalogindex.SetIndex):
     "An index of values that are multiple and stored in an attribute."
@@ -178,6 +1314,11 @@ class AttributeSetIndex(SetIndex,
 class IntegerValueIndex(_ZCApplyMixin,
                         _ZCAbstractIndexMixin,
                         _ZipMixin,
+                        _ArrayMixin,
+                        _SingleValueBatchMixin,
+                        _SortMixin,
+                        _PlanMixin,
+                        _StatisticsMixin,
                         zc.catalog.index.ValueIndex):
     """
     A "raw" index that is optimized for, and only supports,
@@ -186,10 +1327,95 @@ class IntegerValueIndex(_ZCApplyMixin,
     (which is an attribute index).
     """
 
+    _sort_integer_keys = True
+    _array_value_dtype = 'int64'
+
+    #: The :class:`~.SortedRangeArrays`, if enabled.
+    _range_arrays = None
+
     def clear(self):
         super().clear()
         self.documents_to_values = self.family.II.BTree()
         self.values_to_documents = self.family.IO.BTree()
+        if self._range_arrays is not None:
+            self._range_arrays = SortedRangeArrays(self.family)
+
+    def enable_range_arrays(self):
+        """
+        Build a :class:`~.SortedRangeArrays` holding the values of
+        every document, and keep it up to date as documents are
+        indexed and unindexed. From then on, ``between`` queries are
+        answered by it. Does nothing if already enabled.
+
+        .. versionadded:: 4.3.0
+        """
+        if self._range_arrays is None:
+            self._range_arrays = SortedRangeArrays(self.family, self._range_pairs())
+
+    def disable_range_arrays(self):
+        """
+        Stop using and discard the :class:`~.SortedRangeArrays`.
+
+        .. versionadded:: 4.3.0
+        """
+        self._range_arrays = None
+
+    def _range_pairs(self):
+        for value, docids in self.values_to_documents.items():
+            for docid in docids:
+                yield value, docid
+
+    def _bulk_loaded(self):
+        if self._range_arrays is not None:
+            self._range_arrays = SortedRangeArrays(self.family, self._range_pairs())
+
+    def _update_range_arrays(self, doc_id, old):
+        # After a change to a single document that had the value *old*.
+        new = self.documents_to_values.get(doc_id)
+        if old != new:
+            if old is not None:
+                self._range_arrays.remove(old, (doc_id,))
+            if new is not None:
+                self._range_arrays.add(new, (doc_id,))
+
+    def index_doc(self, doc_id, value):
+        if self._range_arrays is None:
+            return super().index_doc(doc_id, value)
+        old = self.documents_to_values.get(doc_id)
+        result = super().index_doc(doc_id, value)
+        self._update_range_arrays(doc_id, old)
+        return result
+
+    def unindex_doc(self, doc_id):
+        if self._range_arrays is None:
+            return super().unindex_doc(doc_id)
+        old = self.documents_to_values.get(doc_id)
+        result = super().unindex_doc(doc_id)
+        self._update_range_arrays(doc_id, old)
+        return result
+
+    def _add_to_fwd(self, added):
+        super()._add_to_fwd(added)
+        if self._range_arrays is not None:
+            for value, docids in added.items():
+                self._range_arrays.add(value, docids)
+
+    def _remove_from_fwd(self, removed):
+        super()._remove_from_fwd(removed)
+        if self._range_arrays is not None:
+            for value, docids in removed.items():
+                self._range_arrays.remove(value, docids)
+
+    def apply(self, query):
+        if self._range_arrays is not None:
+            query_type, bounds = zc.catalog.index.parseQuery(convertQuery(query))
+            if query_type == 'between':
+                try:
+                    return self._range_arrays.between(*bounds)
+                except TypeError:
+                    # As zc.catalog does for values of the wrong type.
+                    return []
+        return super().apply(query)
 
 
 # pylint:disable=too-many-ancestors
@@ -204,8 +1430,275 @@ class IntegerAttributeIndex(IntegerValueIndex,
     """
 
 
+class _ShardedBulkLoader(object):
+
+    def __init__(self, index, loaders):
+        self._index = index
+        self._loaders = loaders
+
+    def add(self, pairs):
+        for number, shard_pairs in self._index._partition_pairs(pairs).items():
+            self._loaders[number].add(shard_pairs)
+
+    def finish(self):
+        for loader in self._loaders:
+            loader.finish()
+
+
+@implementer(IIntegerValueIndex,
+             zope.index.interfaces.IInjection,
+             zope.index.interfaces.IIndexSearch,
+             zope.index.interfaces.IIndexSort,
+             zope.index.interfaces.IStatistics,
+             zc.catalog.interfaces.IIndexValues)
+class ShardedIntegerValueIndex(_SortMixin,
+                               _StatisticsMixin,
+                               persistent.Persistent):
+    """
+    An :class:`IntegerValueIndex` split by docid into several
+    :attr:`shards`, each an :class:`IntegerValueIndex` with its own
+    BTrees.
+
+    Values that keep increasing, such as creation times, are always
+    added at the end of the forward index, so concurrent transactions
+    indexing new documents all change its last bucket (and often the
+    same posting, when the values are normalized to minutes) and
+    conflict. Sharding sends documents with different docids to
+    different trees, so that, with random intids, most concurrent
+    transactions don't touch the same objects.
+
+    Queries are applied to each shard and the (disjoint) results
+    combined, so they return the same documents as an unsharded
+    index. Sorting merges the sorted results of each shard.
+
+    .. versionadded:: 4.3.0
+    """
+
+    family = BTrees.family64
+
+    #: The default number of shards.
+    SHARDS = 8
+
+    def __init__(self, shards=None, family=None):
+        if family is not None:
+            self.family = family
+        self.shards = tuple(IntegerValueIndex(family=self.family)
+                            for _ in range(shards or self.SHARDS))
+
+    def _shard(self, docid):
+        return self.shards[docid % len(self.shards)]
+
+    def _partition(self, docids):
+        count = len(self.shards)
+        groups = defaultdict(list)
+        for docid in docids:
+            groups[docid % count].append(docid)
+        return groups
+
+    def _partition_pairs(self, pairs):
+        if isinstance(self, AttributeIndex):
+            pairs = ((docid, attribute_index_value(self, obj)) for docid, obj in pairs)
+        count = len(self.shards)
+        groups = defaultdict(list)
+        for docid, value in pairs:
+            if value is not _NOT_APPLICABLE:
+                groups[docid % count].append((docid, value))
+        return groups
+
+    def clear(self):
+        for shard in self.shards:
+            shard.clear()
+
+    def index_doc(self, docid, value):
+        self._shard(docid).index_doc(docid, value)
+
+    def unindex_doc(self, docid):
+        self._shard(docid).unindex_doc(docid)
+
+    def index_docs(self, pairs):
+        for number, shard_pairs in self._partition_pairs(pairs).items():
+            self.shards[number].index_docs(shard_pairs)
+
+    def unindex_docs(self, docids):
+        for number, shard_docids in self._partition(docids).items():
+            self.shards[number].unindex_docs(shard_docids)
+
+    def bulk_loader(self):
+        """
+        Like :meth:`IntegerValueIndex.bulk_loader`, returns an object
+        to bulk load all the (empty) shards, or None.
+        """
+        loaders = [shard.bulk_loader() for shard in self.shards]
+        if None in loaders:
+            return None
+        return _ShardedBulkLoader(self, loaders)
+
+    bulk_load = _BatchMixin.bulk_load
+
+    def _union(self, results):
+        for result in results:
+            if result is None or isinstance(result, list):
+                # Not applicable, or a TypeError.
+                return result
+        return self.family.IF.multiunion(results)
+
+    def apply(self, query):
+        query = convertQuery(query)
+        query_type, extent = zc.catalog.index.parseQuery(query)
+        if query_type == 'none':
+            # Not in any shard.
+            return extent - self.family.IF.Set(self.ids())
+        return self._union([shard.apply(query) for shard in self.shards])
+
+    def apply_filtered(self, query, docids):
+        """
+        See :meth:`_PlanMixin.apply_filtered`.
+        """
+        IF = self.family.IF
+        groups = self._partition(docids)
+        return self._union([shard.apply_filtered(query, IF.Set(groups.get(number, ())))
+                            for number, shard in enumerate(self.shards)])
+
+    def _sum(self, method, query):
+        total = 0
+        for shard in self.shards:
+            result = getattr(shard, method)(query)
+            if result is None:
+                return None
+            total += result
+        return total
+
+    def estimate(self, query):
+        """
+        See :meth:`_PlanMixin.estimate`.
+        """
+        return self._sum('estimate', query)
+
+    def count(self, query):
+        """
+        See :meth:`_PlanMixin.count`.
+        """
+        return self._sum('count', query)
+
+    def sort(self, docids, reverse=False, limit=None):
+        if limit is not None and limit < 1:
+            raise ValueError('limit value must be 1 or greater')
+        if docids is None:
+            sorted_docids = [shard.sort(None, reverse, limit) for shard in self.shards]
+        else:
+            sorted_docids = [self.shards[number].sort(shard_docids, reverse, limit)
+                             for number, shard_docids in self._partition(docids).items()]
+        merged = heapq.merge(*sorted_docids, key=self._sort_key, reverse=reverse)
+        yield from itertools.islice(merged, limit)
+
+    def _sort_key(self, docid):
+        return (self._shard(docid).documents_to_values[docid], docid)
+
+    def zip(self, doc_ids=()):
+        for doc_id in doc_ids or ():
+            yield doc_id, self._shard(doc_id).documents_to_values.get(doc_id)
+
+    def documentCount(self):
+        return sum(shard.documentCount() for shard in self.shards)
+
+    def _statistics_documents(self):
+        return self.documentCount()
+
+    def statistics(self, top=10, buckets=10, sample_size=None):
+        """
+        See :meth:`_StatisticsMixin.statistics`.
+
+        The number of distinct values is exact when every document is
+        examined. Otherwise, it is estimated (without reading any
+        keys) as :meth:`wordCount`, which over-counts values found in
+        several shards, by up to the number of shards for values that
+        many documents share.
+        """
+        documents = self._statistics_documents()
+        sample_size = sample_size or self.STATISTICS_SAMPLE_SIZE
+        counts, sampled = self._statistics_sample(documents, sample_size)
+        if sampled >= documents:
+            distinct = len(counts)
+        else:
+            distinct = self.wordCount()
+        return IndexStatistics.from_counts(documents, distinct,
+                                           counts, sampled, top, buckets)
+
+    def _statistics_sample(self, documents, size):
+        # Each shard contributes an equal part of the sample.
+        counts = collections.Counter()
+        sampled = 0
+        size = -(-size // len(self.shards))
+        for shard in self.shards:
+            shard_counts, shard_sampled = shard._statistics_sample(
+                shard._statistics_documents(), size)
+            counts.update(shard_counts)
+            sampled += shard_sampled
+        return counts, sampled
+
+    def wordCount(self):
+        """
+        The sum of the number of distinct values in each shard. A
+        value found in several shards is counted more than once.
+        """
+        return sum(shard.wordCount() for shard in self.shards)
+
+    def ids(self):
+        IF = self.family.IF
+        return IF.multiunion([IF.Set(shard.ids()) for shard in self.shards])
+
+    def values(self, min=None, max=None, excludemin=False, excludemax=False,
+               doc_id=None):
+        # pylint:disable=redefined-builtin
+        if doc_id is not None:
+            return self._shard(doc_id).values(min, max, excludemin, excludemax, doc_id)
+        merged = heapq.merge(*[shard.values(min, max, excludemin, excludemax)
+                               for shard in self.shards])
+        return (value for value, _ in itertools.groupby(merged))
+
+    def containsValue(self, value):
+        return any(shard.containsValue(value) for shard in self.shards)
+
+    def _extreme(self, method, choose, bound):
+        found = []
+        for shard in self.shards:
+            try:
+                found.append(getattr(shard, method)(bound))
+            except ValueError:
+                # Empty, or nothing in bounds.
+                pass
+        if not found:
+            raise ValueError('empty tree')
+        return choose(found)
+
+    def minValue(self, min=None):
+        # pylint:disable=redefined-builtin
+        return self._extreme('minValue', builtins.min, min)
+
+    def maxValue(self, max=None):
+        # pylint:disable=redefined-builtin
+        return self._extreme('maxValue', builtins.max, max)
+
+
+@implementer(zc.catalog.interfaces.ICatalogValueIndex)
+class ShardedIntegerAttributeIndex(AttributeIndex,
+                                   ShardedIntegerValueIndex,
+                                   Contained):
+    """
+    An attribute index for integer values (such as timestamps
+    normalized by :class:`~.TimestampTo64BitIntNormalizer`) that is
+    sharded to avoid write conflicts. See
+    :class:`ShardedIntegerValueIndex`.
+
+    .. versionadded:: 4.3.0
+    """
+
+
 @implementer(IKeywordIndex)
 class NormalizingKeywordIndex(_SetZipMixin,
+                              _MultiValueBatchMixin,
+                              _PlanMixin,
+                              _StatisticsMixin,
                               zope.index.keyword.CaseInsensitiveKeywordIndex,
                               Contained):
     """
@@ -215,6 +1708,40 @@ class NormalizingKeywordIndex(_SetZipMixin,
 
     family = BTrees.family64
 
+    def _batch_value_set(self, value):
+        if isinstance(value, six.string_types):
+            raise TypeError('seq argument must be a list/tuple of strings')
+        if not value:
+            return None
+        return self.family.OO.Set(self.normalize(value))
+
+    def _store_values(self, docid, old, new, added, removed):
+        self._rev_index[docid] = new
+
+    def index_doc(self, docid, seq):
+        # zope.index stores a new set of keywords even if they're unchanged.
+        # We index the normalized set, so that an iterable is only
+        # consumed once.
+        value = self._bulk_value(seq)
+        if not self._skip_write(docid, value):
+            super().index_doc(docid, seq if value is _NOT_APPLICABLE else value)
+
+    def _bulk_posting(self, docids):
+        if len(docids) >= self.tree_threshold:
+            return super()._bulk_posting(docids)
+        return self.family.IF.Set(docids)
+
+    def _new_posting(self, docids):
+        IF = self.family.IF
+        if len(docids) >= self.tree_threshold:
+            return IF.TreeSet(docids)
+        return IF.Set(docids)
+
+    def _posting_updated(self, value, docs):
+        TreeSet = self.family.IF.TreeSet
+        if not isinstance(docs, TreeSet) and len(docs) >= self.tree_threshold:
+            self._fwd_index[value] = TreeSet(docs)
+
     def _parseQuery(self, query): # pylint:disable=too-many-branches,too-complex
         if isinstance(query, Mapping):
             if 'query' in query:  # support legacy
@@ -257,9 +1784,9 @@ class NormalizingKeywordIndex(_SetZipMixin,
             res = super().search(
                 query, operator=query_type)
         elif query_type in {'between',}:
-            query = list(self._fwd_index.iterkeys(query[0], query[1]))
-            res = super().search(
-                query, operator='or')
+            # The keys are already normalized; union the postings
+            # of the range as the forward index yields them.
+            res = self.family.IF.multiunion(self._fwd_index.values(query[0], query[1]))
         elif query_type == 'none':
             # pylint:disable-next=no-value-for-parameter
             assert zc.catalog.interfaces.IExtent.providedBy(query)
@@ -275,6 +1802,45 @@ class NormalizingKeywordIndex(_SetZipMixin,
             raise ValueError("unknown query type", query_type) # pragma: no cover (can't get here)
         return res
 
+    def estimate(self, query):
+        query_type, query = self._parseQuery(convertQuery(query))
+        if query_type is None:
+            return 0
+        if query_type in ('or', 'and'):
+            return self._estimate_postings(self.normalize(query),
+                                           all_of=query_type == 'and')
+        if query_type == 'between':
+            return self._estimate_postings(self._fwd_index.keys(query[0], query[1]))
+        if query_type == 'any' and query is None:
+            return self._num_docs.value
+        return None
+
+    def count(self, query):
+        query_type, words = self._parseQuery(convertQuery(query))
+        if query_type is None:
+            return 0
+        if query_type in ('or', 'and'):
+            words = _distinct(self.normalize(words))
+            if len(words) == 1:
+                return self._count_postings(words)
+        if query_type == 'any' and words is None:
+            return self._num_docs.value
+        return super().count(query)
+
+    def _query_filter(self, query):
+        query_type, query = self._parseQuery(convertQuery(query))
+        if query_type is None:
+            return (lambda values: False), False
+        if query_type == 'or':
+            words = self.normalize(query)
+            return (lambda values: _count_contained(values, words)), False
+        if query_type == 'and':
+            words = self.normalize(query)
+            return (lambda values: _count_contained(values, words) == len(words)), False
+        if query_type == 'between':
+            return (lambda values: _count_in_range(values, (query[0], query[1]))), False
+        return None
+
     def ids(self):
         return self._rev_index.keys()
 
@@ -312,6 +1878,7 @@ class AttributeKeywordIndex(AttributeIndex, NormalizingKeywordIndex):
 
 @implementer(ICatalogIndex)  # The superclass forgets this
 class NormalizationWrapper(_ZCApplyMixin,
+                           BatchIndexMixin,
                            zc.catalog.catalogindex.NormalizationWrapper):
     """
     An attribute index that wraps a raw index and normalizes values.
@@ -334,6 +1901,15 @@ class NormalizationWrapper(_ZCApplyMixin,
         super().__init__(field_name, interface, field_callable,
                          index, normalizer, is_collection)
 
+    def statistics(self, top=10, buckets=10, sample_size=None):
+        """
+        The ``statistics()`` of the wrapped index, over the normalized
+        values.
+
+        .. versionadded:: 4.3.0
+        """
+        return self.index.statistics(top, buckets, sample_size)
+
 
 # text
 
@@ -353,7 +1929,7 @@ def stemmer_lexicon(lang='english', stopwords=True):
 
 
 @implementer(ITextIndex)
-class AttributeTextIndex(TextIndex):
+class AttributeTextIndex(_StatisticsMixin, BatchIndexMixin, TextIndex):
     """
     A 64-bit text index.
 
@@ -366,3 +1942,45 @@ class AttributeTextIndex(TextIndex):
 
     #: We default to 64-bit btrees.
     family = BTrees.family64
+
+    def index_doc(self, docid, value):
+        # zope.index rewrites the stored words (and weights) of a
+        # document even if they're unchanged.
+        # As in _ZCAbstractIndexMixin, extract the text just once and
+        # pass it to the index beyond AttributeIndex.
+        text = attribute_index_value(self, value)
+        if text is _NOT_APPLICABLE:
+            return None
+        base = super(AttributeIndex, self) # pylint:disable=bad-super-call
+        if text is None:
+            return base.unindex_doc(docid)
+        if self._is_stored(docid, text):
+            _count_skipped_writes(self, 1)
+            return None
+        return base.index_doc(docid, text)
+
+    def _is_stored(self, docid, text):
+        index = self.index
+        if not index.has_doc(docid):
+            return False
+        # Unlike sourceToWordIds, this doesn't add words to the
+        # lexicon; unknown words are 0, which is never stored.
+        return index.get_words(docid) == self.lexicon.termToWordIds(text)
+
+    # The values of a document are its distinct words.
+
+    def _statistics_documents(self):
+        return self.documentCount()
+
+    def _distinct_value_count(self):
+        return self.wordCount()
+
+    def _statistics_sample(self, documents, size):
+        index = self.index
+        get_word = self.lexicon.get_word
+        counts = collections.Counter()
+        sampled = 0
+        for docid, _ in _sample_items(index._docwords, documents, size):
+            counts.update({get_word(wid) for wid in index.get_words(docid)})
+            sampled += 1
+        return counts, sampled
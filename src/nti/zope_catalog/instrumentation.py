@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Optional timing and counter instrumentation for catalogs and indexes.
+
+Nothing is recorded until :func:`enable` is called. It installs
+timing wrappers around ``index_doc``, ``unindex_doc``, ``apply`` and
+the batch and update methods of the catalog and index classes in this
+package; :func:`disable` removes them again, so that a disabled
+process runs exactly the code it would without this module.
+
+A few counters that are only updated once per batch or chunk (such as
+the documents visited by ``updateIndexes``, the prefetch round
+trips made by :class:`~.CatalogPrefetchIterator` and the
+``skipped_writes`` of indexes asked to index a value they already
+have) are reported directly by that code whenever a recorder is
+enabled.
+
+Timings are attributed to the ``__name__`` of the catalog or index
+(or its class name, if it has none). When one instrumented method
+calls another for the same object and operation (such as a subclass
+calling its base), only the outermost call is recorded.
+
+.. versionadded:: 4.3.0
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import bisect
+import collections
+import threading
+import time
+
+from zope import interface
+from zope.index.interfaces import IInjection
+
+from .interfaces import IInstrumentationRecorder
+
+__docformat__ = "restructuredtext en"
+
+logger = __import__('logging').getLogger(__name__)
+
+#: The methods wrapped on each index class, when present.
+INDEX_OPERATIONS = ('index_doc', 'unindex_doc', 'index_docs', 'unindex_docs', 'apply')
+
+#: The methods wrapped on the catalog classes.
+CATALOG_OPERATIONS = ('index_doc', 'unindex_doc', 'index_docs', 'unindex_docs', 'apply',
+                      'updateIndex', 'updateIndexes')
+
+_recorder = None
+# [(cls, operation, original)], in installation order.
+_installed = []
+_MISSING = object()
+_active = threading.local()
+
+
+class OperationStats(object):
+    """
+    The calls, cumulative time and latency histogram of one operation.
+    """
+
+    #: The upper bounds, in seconds, of the histogram buckets. A
+    #: final bucket counts anything slower.
+    BUCKET_BOUNDS = (1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0)
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.histogram = [0] * (len(self.BUCKET_BOUNDS) + 1)
+
+    def add(self, seconds):
+        self.calls += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.histogram[bisect.bisect_left(self.BUCKET_BOUNDS, seconds)] += 1
+
+    @property
+    def mean_seconds(self):
+        return self.seconds / self.calls if self.calls else 0.0
+
+    def __repr__(self):
+        return "<%s calls=%d seconds=%.6f max=%.6f>" % (
+            type(self).__name__, self.calls, self.seconds, self.max_seconds)
+
+
+@interface.implementer(IInstrumentationRecorder)
+class StatsRecorder(object):
+    """
+    Keeps :class:`OperationStats` in :attr:`timings` and event counts
+    in :attr:`counters`, both keyed by ``(name, operation)``. Safe to
+    use from several threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings = {}
+        self.counters = collections.Counter()
+
+    def timed(self, name, operation, seconds):
+        key = (name, operation)
+        with self._lock:
+            stats = self.timings.get(key)
+            if stats is None:
+                stats = self.timings[key] = OperationStats()
+            stats.add(seconds)
+
+    def counted(self, name, event, count=1):
+        with self._lock:
+            self.counters[(name, event)] += count
+
+    def reset(self):
+        with self._lock:
+            self.timings = {}
+            self.counters = collections.Counter()
+
+    def report(self):
+        """
+        Return a human readable summary, slowest operations first.
+        """
+        with self._lock:
+            timings = sorted(self.timings.items(),
+                             key=lambda item: item[1].seconds,
+                             reverse=True)
+            counters = sorted(self.counters.items())
+        lines = []
+        for (name, operation), stats in timings:
+            lines.append("%s.%s: %d calls, %.6fs total, %.6fs mean, %.6fs max" % (
+                name, operation, stats.calls, stats.seconds,
+                stats.mean_seconds, stats.max_seconds))
+        for (name, event), count in counters:
+            lines.append("%s.%s: %d" % (name, event, count))
+        return '\n'.join(lines)
+
+
+def get_recorder():
+    """
+    Return the enabled :class:`~.IInstrumentationRecorder`, or None.
+    """
+    return _recorder
+
+
+def _name(obj):
+    return getattr(obj, '__name__', None) or type(obj).__name__
+
+
+def _make_wrapper(cls, operation, original, _now=time.perf_counter):
+    if original is _MISSING:
+        def call(self, args, kwargs):
+            return getattr(super(cls, self), operation)(*args, **kwargs)
+    else:
+        def call(self, args, kwargs):
+            return original(self, *args, **kwargs)
+
+    def wrapper(self, *args, **kwargs):
+        recorder = _recorder
+        active = getattr(_active, 'calls', None)
+        if active is None:
+            active = _active.calls = set()
+        key = (id(self), operation)
+        if recorder is None or key in active:
+            return call(self, args, kwargs)
+        active.add(key)
+        start = _now()
+        try:
+            return call(self, args, kwargs)
+        finally:
+            active.discard(key)
+            recorder.timed(_name(self), operation, _now() - start)
+
+    wrapper.__name__ = operation
+    wrapper.__doc__ = getattr(original, '__doc__', None)
+    return wrapper
+
+
+def _targets():
+    from . import catalog
+    from . import index
+    from . import topic
+    for module in (index, topic):
+        for name, cls in sorted(vars(module).items()):
+            if (isinstance(cls, type)
+                    and not name.startswith('_')
+                    and cls.__module__ == module.__name__
+                    and IInjection.implementedBy(cls)):
+                yield cls, INDEX_OPERATIONS
+    yield catalog.Catalog, CATALOG_OPERATIONS
+
+
+def enable(recorder=None):
+    """
+    Start recording to *recorder* (by default, a new
+    :class:`StatsRecorder`) and return it. If instrumentation is
+    already enabled, the recorder is replaced.
+    """
+    global _recorder
+    if recorder is None:
+        recorder = StatsRecorder()
+    if not _installed:
+        for cls, operations in _targets():
+            for operation in [op for op in operations if hasattr(cls, op)]:
+                original = cls.__dict__.get(operation, _MISSING)
+                _installed.append((cls, operation, original))
+                setattr(cls, operation, _make_wrapper(cls, operation, original))
+    _recorder = recorder
+    return recorder
+
+
+def disable():
+    """
+    Stop recording and restore the original methods. Returns the
+    recorder that was enabled, if any.
+    """
+    global _recorder
+    recorder = _recorder
+    _recorder = None
+    while _installed:
+        cls, operation, original = _installed.pop()
+        if original is _MISSING:
+            delattr(cls, operation)
+        else:
+            setattr(cls, operation, original)
+    return recorder
@@ -21,6 +21,7 @@ from zope.catalog.keyword import IKeywordIndex as IZCKeywordIndex
 from zope.catalog.text import ITextIndex as IZCTextIndex
 import zope.container.constraints
 from zope.container.interfaces import IContainer
+from zope.interface import Attribute
 from zope.interface import Interface
 
 __docformat__ = "restructuredtext en"
@@ -111,6 +112,9 @@ class IDeferredCatalog(ICatalogQuery, ICatalogEdit, IContainer):
     As a base, instead of extending :class:`.Catalog`, you can extend
     :class:`.DeferredCatalog`.
 
+    :mod:`nti.zope_catalog.deferred` provides a queue and a worker
+    to do the deferred indexing.
+
     .. versionadded:: 2.0.0
     """
 
@@ -120,3 +124,81 @@ IDeferredCatalog['__setitem__'].__doc__ = ''
 
 #: Backwards compatibility alias.
 IMetadataCatalog = IDeferredCatalog
+
+
+class IDeferredIndexingQueue(Interface):
+    """
+    A persistent queue of indexing work for the
+    :class:`IDeferredCatalog` objects.
+
+    See :mod:`nti.zope_catalog.deferred`.
+
+    .. versionadded:: 4.3.0
+    """
+
+    def __len__():
+        """
+        The number of queued entries.
+        """
+
+    def put(docid, operation):
+        """
+        Add an entry for *docid*. The *operation* is one of the
+        constants in :mod:`nti.zope_catalog.deferred`.
+        """
+
+    def pull(limit=None):
+        """
+        Remove and return a list of at most *limit* ``(docid,
+        operation)`` entries.
+
+        The entries added for a docid are returned as (at most) one
+        entry with the same effect.
+        """
+
+
+class IInstrumentationRecorder(Interface):
+    """
+    Receives the measurements made while
+    :mod:`nti.zope_catalog.instrumentation` is enabled.
+
+    Both methods may be called from several threads.
+
+    .. versionadded:: 4.3.0
+    """
+
+    def timed(name, operation, seconds):
+        """
+        The *operation* (such as ``'apply'``) of the catalog or index
+        called *name* took *seconds*.
+        """
+
+    def counted(name, event, count=1):
+        """
+        The *event* (such as ``'documents_visited'``) happened *count*
+        times for the object called *name*.
+        """
+
+
+class IIndexStatistics(Interface):
+    """
+    The distribution of the values of an index, as returned by its
+    ``statistics()`` method. Counts are numbers of documents, and may
+    be estimated from a sample.
+
+    .. versionadded:: 4.3.0
+    """
+
+    documents = Attribute("The number of documents indexed.")
+    distinct_values = Attribute("The number of distinct values.")
+    heavy_hitters = Attribute(
+        "A list of ``(value, documents)`` for the most common values, "
+        "most common first.")
+    histogram = Attribute(
+        "An equi-depth histogram: a list of ``(low, high, documents)`` "
+        "for consecutive ranges of values, each holding about the same "
+        "number of value occurrences.")
+    values_per_document = Attribute("The average number of values of a document.")
+    sampled_documents = Attribute(
+        "The number of documents whose values were examined.")
+    exact = Attribute("Whether every document was examined.")
@@ -8,8 +8,12 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import operator
+
 __docformat__ = "restructuredtext en"
 
+_first = operator.itemgetter(0)
+
 
 class AbstractNormalizerMixin(object):
     """
@@ -33,3 +37,31 @@ class AbstractNormalizerMixin(object):
     def value(self, value):
         """Normalize the given value for an arbitrary query."""
         raise NotImplementedError()
+
+
+class BatchIndexMixin(object):
+    """
+    Provides the batch indexing methods ``index_docs`` and
+    ``unindex_docs`` in terms of ``index_doc`` and ``unindex_doc``.
+
+    The documents are processed in docid order, which keeps accesses
+    to the BTrees of an index local. If the same docid is given more
+    than once, only the last value is used. Indexes that can do better
+    should override these methods.
+
+    .. versionadded:: 4.3.0
+    """
+
+    def index_docs(self, pairs):
+        """
+        Index each ``(docid, value)`` pair in the iterable *pairs*.
+        """
+        for docid, value in sorted(dict(pairs).items(), key=_first):
+            self.index_doc(docid, value)
+
+    def unindex_docs(self, docids):
+        """
+        Unindex each docid in the iterable *docids*.
+        """
+        for docid in sorted(set(docids)):
+            self.unindex_doc(docid)
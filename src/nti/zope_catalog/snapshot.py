@@ -0,0 +1,446 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Read-only, memory-mapped snapshots of indexes.
+
+A process that has just started must load many BTree buckets from
+storage before queries against a large index get fast. A snapshot,
+written by :func:`write_snapshot`, holds the sorted keys of an index
+with the docids of each key (its posting) in a file. Any number of
+processes can open it with :class:`IndexSnapshot`; the file is
+memory-mapped, so it is read lazily and the pages are shared between
+processes.
+
+Snapshots are supported for :class:`~.IntegerValueIndex`,
+:class:`~.ValueIndex`, :class:`~.SetIndex`,
+:class:`~.NormalizingKeywordIndex` (and their attribute index
+subclasses) whose keys are all integers or all strings, and for
+:class:`~.ExtentFilteredSet`.
+
+A snapshot doesn't change after it has been written, so it is queried
+through a :class:`SnapshotIndex`, which corrects its results for the
+documents that have changed since (the *delta*) by asking the live
+index about only those documents.
+
+The file holds the docids of all the postings, one after the other,
+as native 64-bit integers; the offset of each posting; the docids of
+all the indexed documents; the keys, also as integers if they are
+integers, or else the offset of each key followed by all the keys
+encoded as UTF-8; and finally a pickled header. Nothing but the
+header is held in memory. The header is pickled, so snapshots must
+only be opened from trusted locations.
+
+.. versionadded:: 4.3.0
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import array
+import bisect
+import contextlib
+import mmap
+import os
+import pickle
+import struct
+import sys
+
+import BTrees
+import zc.catalog.index
+
+from .bulk import bucket_items
+from .index import NormalizingKeywordIndex
+from .index import SetIndex
+from .index import _ZCAbstractIndexMixin
+from .index import convertQuery
+from .topic import ExtentFilteredSet
+
+__docformat__ = "restructuredtext en"
+
+_MAGIC = b'NTIZCSN1'
+_TRAILER = struct.Struct('<Q8s')
+_VERSION = 1
+
+#: The kind of snapshot holding keys and postings.
+VALUES = 'values'
+#: The kind of snapshot holding only docids.
+IDS = 'ids'
+
+_INTEGER_KEYS = 'integer'
+_TEXT_KEYS = 'text'
+
+
+def _integer_array(values):
+    return array.array('q', values)
+
+
+def _keys_array(tree, step):
+    result = _integer_array(())
+    if tree is not None:
+        for items in bucket_items(tree):
+            result.extend(items[::step])
+    return result
+
+
+def write_snapshot(index, path, tid=None):
+    """
+    Write a snapshot of *index* to *path*, replacing it atomically.
+
+    Every posting of the index is loaded, so this is best done by a
+    process that has them in its cache anyway, or by a periodic job.
+
+    :keyword bytes tid: The id of the last transaction whose changes
+        *index* is known to include, stored as
+        :attr:`IndexSnapshot.tid` for finding the changes made since
+        (for example, with :meth:`.Catalog.changedDocidsSince`). Take
+        it *before* the transaction reading *index* begins: then any
+        transaction committed in between is included in the delta.
+    :raises TypeError: If the kind of index isn't supported, or if
+        its keys aren't all integers or all strings.
+    """
+    if isinstance(index, ExtentFilteredSet):
+        kind = IDS
+        ids = _keys_array(index._ids, 1)
+        fwd_items = ()
+    elif isinstance(index, (_ZCAbstractIndexMixin, NormalizingKeywordIndex)):
+        kind = VALUES
+        ids = _keys_array(index._rev_index, 2)
+        fwd_items = index._fwd_index.items()
+    else:
+        raise TypeError("Cannot snapshot index", index)
+
+    # Integer keys, or the UTF-8 encoded keys and the offset of each,
+    # as determined by the first key.
+    key_type = _INTEGER_KEYS
+    keys = _integer_array(())
+    text_keys = []
+    text_offsets = [0]
+    offsets = [0]
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(_MAGIC)
+            for key, posting in fwd_items:
+                if len(offsets) == 1 and isinstance(key, str):
+                    key_type = _TEXT_KEYS
+                if key_type == _INTEGER_KEYS and isinstance(key, int):
+                    keys.append(key)
+                elif key_type == _TEXT_KEYS and isinstance(key, str):
+                    text_keys.append(key.encode('utf-8'))
+                    text_offsets.append(text_offsets[-1] + len(text_keys[-1]))
+                else:
+                    raise TypeError("Can only snapshot integer or string keys", index, key)
+                docids = _integer_array(posting)
+                docids.tofile(f)
+                offsets.append(offsets[-1] + len(docids))
+            _integer_array(offsets).tofile(f)
+            ids.tofile(f)
+            if key_type == _INTEGER_KEYS:
+                keys.tofile(f)
+            else:
+                _integer_array(text_offsets).tofile(f)
+            text_offset = f.tell()
+            f.write(b''.join(text_keys))
+            header = {
+                'version': _VERSION,
+                'kind': kind,
+                'byteorder': sys.byteorder,
+                'family': 64 if index.family is BTrees.family64 else 32,
+                'tid': tid,
+                'postings_length': offsets[-1],
+                'keys_length': len(offsets) - 1,
+                'ids_length': len(ids),
+                'key_type': key_type,
+                'text_offset': text_offset,
+            }
+            header_offset = f.tell()
+            pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+            f.write(_TRAILER.pack(header_offset, _MAGIC))
+    except BaseException:
+        # Failing to remove it must not hide the original error.
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+class _TextKeys(object):
+    # The string keys of a snapshot as a sequence, decoding each one
+    # from the map only when it's asked for.
+
+    def __init__(self, data, start, offsets):
+        self._data = data
+        self._start = start
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        start = self._start
+        offsets = self._offsets
+        return self._data[start + offsets[i]:start + offsets[i + 1]].decode('utf-8')
+
+
+class IndexSnapshot(object):
+    """
+    A snapshot written by :func:`write_snapshot`, opened read-only.
+
+    Postings are returned as new ``IF.Set`` objects; the keys and
+    docids are only read from the file as needed. Close the snapshot
+    (or use it as a context manager) when done.
+
+    :raises ValueError: If *path* isn't a snapshot that can be read
+        on this machine.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._open()
+        except BaseException:
+            self.close()
+            raise
+
+    def _open(self):
+        data = self._mmap
+        if len(data) < len(_MAGIC) + _TRAILER.size or data[:len(_MAGIC)] != _MAGIC:
+            raise ValueError("Not an index snapshot")
+        header_offset, magic = _TRAILER.unpack(data[-_TRAILER.size:])
+        if magic != _MAGIC:
+            raise ValueError("Truncated index snapshot")
+        header = pickle.loads(data[header_offset:-_TRAILER.size])
+        if header['version'] != _VERSION or header['byteorder'] != sys.byteorder:
+            raise ValueError("Incompatible index snapshot", header['version'],
+                             header['byteorder'])
+
+        self.kind = header['kind']
+        self.tid = header['tid']
+        self.family = BTrees.family64 if header['family'] == 64 else BTrees.family32
+        self._views = []
+        text_offset = header['text_offset']
+        integers = self._view(memoryview(data)[len(_MAGIC):text_offset].cast('q'))
+        keys_length = header['keys_length']
+        integer_keys = header['key_type'] == _INTEGER_KEYS
+        start = 0
+        sections = []
+        for length in (header['postings_length'],
+                       keys_length + 1,
+                       header['ids_length'],
+                       keys_length if integer_keys else keys_length + 1):
+            sections.append(self._view(integers[start:start + length]))
+            start += length
+        self._docids, self._offsets, self._ids, keys = sections
+        self._keys = keys if integer_keys else _TextKeys(data, text_offset, keys)
+
+    def _view(self, view):
+        self._views.append(view)
+        return view
+
+    def close(self):
+        # The map can only be closed once nothing refers to it.
+        for view in reversed(getattr(self, '_views', ())):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def keys(self):
+        """
+        The keys, in order, as a sequence.
+        """
+        return self._keys
+
+    def ids(self):
+        """
+        The docids of all the documents.
+        """
+        return self.family.IF.Set(self._ids)
+
+    def _posting(self, i):
+        offsets = self._offsets
+        return self.family.IF.Set(self._docids[offsets[i]:offsets[i + 1]])
+
+    def posting(self, key):
+        """
+        The docids of *key*, or None if there are none.
+        """
+        keys = self._keys
+        i = bisect.bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            return self._posting(i)
+        return None
+
+    def _key_range(self, min_value=None, max_value=None,
+                   excludemin=False, excludemax=False):
+        keys = self._keys
+        start = 0
+        if min_value is not None:
+            start = (bisect.bisect_right if excludemin else bisect.bisect_left)(keys, min_value)
+        end = len(keys)
+        if max_value is not None:
+            end = (bisect.bisect_left if excludemax else bisect.bisect_right)(keys, max_value)
+        return start, max(start, end)
+
+    def postings(self, *args):
+        """
+        The postings of the keys in a range, in key order.
+
+        The arguments are the same as for ``BTree.keys``: *min*,
+        *max*, *excludemin* and *excludemax*, where a bound of None
+        means unbounded.
+        """
+        start, end = self._key_range(*args)
+        return [self._posting(i) for i in range(start, end)]
+
+    def union(self, *args):
+        """
+        The union of the postings of the keys in a range, taking the
+        same arguments as :meth:`postings`.
+
+        The postings are contiguous in the file, so this is done with
+        one slice.
+        """
+        start, end = self._key_range(*args)
+        offsets = self._offsets
+        return self.family.IF.multiunion(self._docids[offsets[start]:offsets[end]])
+
+
+class SnapshotIndex(object):
+    """
+    Answers queries for *index* from *snapshot*, corrected for the
+    documents whose values may have changed since the snapshot was
+    written.
+
+    Queries are answered the way ``index.apply`` answers them (including
+    the weights of a :class:`~.SetIndex`), except that, for each docid
+    in :attr:`changed`, the live *index* is asked whether the document
+    matches instead. The live index is also used to parse queries, and
+    to answer any query the snapshot can't (such as ``none`` queries).
+
+    The caller is responsible for including every changed docid. Note
+    that :meth:`.Catalog.changedDocidsSince` doesn't find removed
+    documents; those that are still in the snapshot are returned
+    unless they are added (for example, by the
+    :class:`~.IDeferredIndexingQueue` worker) with :meth:`add_changed`.
+    """
+
+    def __init__(self, index, snapshot, changed=()):
+        self.index = index
+        self.snapshot = snapshot
+        #: The docids found from the live index.
+        self.changed = snapshot.family.IF.Set(changed)
+
+    def add_changed(self, docids):
+        self.changed = self.snapshot.family.IF.union(
+            self.changed, self.snapshot.family.IF.Set(docids))
+
+    def _live_ids(self):
+        index = self.index
+        docids = index._ids if isinstance(index, ExtentFilteredSet) else index._rev_index
+        docids = () if docids is None else docids
+        return self.snapshot.family.IF.Set(d for d in self.changed if d in docids)
+
+    def _merge(self, result, live):
+        IF = self.snapshot.family.IF
+        result = IF.difference(result, self.changed)
+        if isinstance(result, IF.Bucket) or isinstance(live, IF.Bucket):
+            return IF.weightedUnion(result, live)[1]
+        return IF.union(result, live)
+
+    def ids(self):
+        """
+        The docids of all the documents.
+        """
+        result = self.snapshot.ids()
+        return self._merge(result, self._live_ids()) if self.changed else result
+
+    def apply(self, query):
+        if self.snapshot.kind != VALUES:
+            raise TypeError("Only the ids of a filtered set can be queried")
+        query = convertQuery(query)
+        if isinstance(self.index, NormalizingKeywordIndex):
+            query_type, value = self.index._parseQuery(query)
+            apply = self._apply_keyword
+        else:
+            query_type, value = zc.catalog.index.parseQuery(query)
+            apply = self._apply_set if isinstance(self.index, SetIndex) else self._apply_value
+
+        if query_type == 'any' and value is None:
+            return self.ids()
+        try:
+            result = apply(query_type, value)
+        except TypeError:
+            # As zc.catalog does for values of the wrong type.
+            return []
+        if result is None:
+            return self.index.apply(query)
+        if self.changed:
+            result = self._merge(result, self.index.apply_filtered(query, self.changed))
+        return result
+
+    def _postings(self, values):
+        posting = self.snapshot.posting
+        return [p for p in (posting(v) for v in values) if p is not None]
+
+    def _intersection(self, postings):
+        # Smallest first, to intersect as few docids as possible.
+        IF = self.snapshot.family.IF
+        postings.sort(key=len)
+        result = postings[0]
+        for posting in postings[1:]:
+            result = IF.intersection(result, posting)
+        return result
+
+    def _apply_value(self, query_type, value):
+        snapshot = self.snapshot
+        if query_type == 'any_of':
+            return snapshot.family.IF.multiunion(self._postings(value))
+        if query_type == 'between':
+            return snapshot.union(*value)
+        return None
+
+    def _apply_set(self, query_type, value):
+        IF = self.snapshot.family.IF
+        if query_type in ('any_of', 'between'):
+            postings = (self.snapshot.postings(*value) if query_type == 'between'
+                        else self._postings(value))
+            result = IF.Bucket()
+            for posting in postings:
+                result = IF.weightedUnion(result, posting)[1]
+            return result
+        if query_type == 'all_of':
+            value = list(value)
+            postings = self._postings(value)
+            if len(postings) < len(value) or not postings:
+                return IF.Set()
+            return self._intersection(postings)
+        return None
+
+    def _apply_keyword(self, query_type, value):
+        IF = self.snapshot.family.IF
+        if query_type is None:
+            return IF.Set()
+        if query_type == 'or':
+            return IF.multiunion(self._postings(self.index.normalize(value)))
+        if query_type == 'and':
+            words = self.index.normalize(value)
+            postings = self._postings(words)
+            if len(postings) < len(words):
+                return IF.Set()
+            return self._intersection(postings)
+        if query_type == 'between':
+            return self.snapshot.union(value[0], value[1])
+        return None
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Sorted arrays of ``(value, docid)`` pairs for answering range queries
+over integer values.
+
+An :class:`~.IntegerValueIndex` answers a ``between`` query by
+loading the posting of each value in the range and taking their
+union, which for a wide range over many distinct values (such as
+timestamps) means loading and merging many small sets. A
+:class:`SortedRangeArrays` instead keeps every ``(value, docid)`` pair
+in order in compact arrays of 64-bit integers, split into persistent
+chunks of up to :attr:`~SortedRangeArrays.CHUNK_SIZE` pairs, so a
+range is found with a binary search and read as one slice of each
+chunk it covers.
+
+The chunks are kept up to date one pair at a time; see
+:meth:`.IntegerValueIndex.enable_range_arrays`.
+
+.. versionadded:: 4.3.0
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import array
+from bisect import bisect_left
+from bisect import bisect_right
+
+import BTrees
+from persistent import Persistent
+from ZODB.POSException import ConflictError
+
+__docformat__ = "restructuredtext en"
+
+
+def _integer_array(values=()):
+    return array.array('q', values)
+
+
+class _Chunk(Persistent):
+    # The pairs with values from the key of this chunk up to (but not
+    # including) the key of the next one, in order, as parallel
+    # arrays.
+
+    def __init__(self, values=(), docids=()):
+        self.values = _integer_array(values)
+        self.docids = _integer_array(docids)
+        # Incremented when pairs are moved to a new chunk.
+        self.generation = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def _find(self, value, docid):
+        values = self.values
+        lo = bisect_left(values, value)
+        hi = bisect_right(values, value, lo)
+        i = bisect_left(self.docids, docid, lo, hi)
+        return i, i < hi and self.docids[i] == docid
+
+    def add(self, value, docid):
+        i, found = self._find(value, docid)
+        if not found:
+            self.values.insert(i, value)
+            self.docids.insert(i, docid)
+            self._p_changed = True
+
+    def remove(self, value, docid):
+        i, found = self._find(value, docid)
+        if found:
+            del self.values[i]
+            del self.docids[i]
+            self._p_changed = True
+
+    def split(self):
+        """
+        Move the upper half of the pairs (never splitting the pairs of
+        one value) to a new chunk and return it, or return None if
+        every pair has the same value.
+        """
+        values = self.values
+        middle = values[len(values) // 2]
+        i = bisect_left(values, middle) or bisect_right(values, middle)
+        if i == len(values):
+            return None
+        new = _Chunk(values[i:], self.docids[i:])
+        del self.values[i:]
+        del self.docids[i:]
+        self.generation += 1
+        return new
+
+    def _p_resolveConflict(self, old_state, committed_state, new_state):
+        # Pairs are unique, so concurrent additions and removals can
+        # be merged as sets, unless pairs were moved to another chunk.
+        if not (old_state['generation'] == committed_state['generation']
+                == new_state['generation']):
+            raise ConflictError("Chunk split concurrently")
+
+        def pairs(state):
+            return set(zip(state['values'], state['docids']))
+        old = pairs(old_state)
+        new = pairs(new_state)
+        merged = sorted((pairs(committed_state) | (new - old)) - (old - new))
+        state = dict(new_state)
+        state['values'] = _integer_array(value for value, _ in merged)
+        state['docids'] = _integer_array(docid for _, docid in merged)
+        return state
+
+
+class SortedRangeArrays(Persistent):
+    """
+    The ``(value, docid)`` pairs of an integer index, sorted, for
+    fast range queries.
+
+    Concurrent changes to the same chunk are merged by conflict
+    resolution, except while it is being split. Values greater than
+    any in a full chunk go to a new chunk, so appending increasing
+    values only writes the last chunk. A chunk holding only
+    pairs of a single value can't be split, and so may grow larger
+    than :attr:`CHUNK_SIZE`. Chunks that become empty are kept.
+    """
+
+    #: The number of pairs at which a chunk is split in two.
+    CHUNK_SIZE = 2048
+
+    family = BTrees.family64
+
+    def __init__(self, family=None, pairs=()):
+        """
+        :param pairs: An iterable of ``(value, docid)`` pairs, in order.
+        """
+        if family is not None:
+            self.family = family
+        # {lowest value: _Chunk}, with a first chunk for every value
+        # below the second.
+        self._chunks = self.family.IO.BTree()
+        self._fill(pairs)
+
+    def _fill(self, pairs):
+        # Leave room for additions in each chunk.
+        fill = self.CHUNK_SIZE // 2
+        key = self.family.minint
+        values = _integer_array()
+        docids = _integer_array()
+        for value, docid in pairs:
+            if len(values) >= fill and value != values[-1]:
+                self._chunks[key] = _Chunk(values, docids)
+                key = value
+                values = _integer_array()
+                docids = _integer_array()
+            values.append(value)
+            docids.append(docid)
+        self._chunks[key] = _Chunk(values, docids)
+
+    def _chunk(self, value):
+        chunks = self._chunks
+        return chunks[chunks.maxKey(value)]
+
+    def add(self, value, docids):
+        """
+        Add a pair for each of *docids* with *value*.
+        """
+        chunk = self._chunk(value)
+        if len(chunk) >= self.CHUNK_SIZE and value > chunk.values[-1]:
+            # Appending to a full chunk (as for increasing values such
+            # as timestamps): start a new one instead of splitting it,
+            # so the full chunk isn't written again.
+            chunk = self._chunks[value] = _Chunk()
+        for docid in docids:
+            chunk.add(value, docid)
+        if len(chunk) > self.CHUNK_SIZE:
+            new = chunk.split()
+            if new is not None:
+                self._chunks[new.values[0]] = new
+
+    def remove(self, value, docids):
+        """
+        Remove the pairs of each of *docids* with *value*, if present.
+        """
+        chunk = self._chunk(value)
+        for docid in docids:
+            chunk.remove(value, docid)
+
+    def between(self, min_value=None, max_value=None, excludemin=False, excludemax=False):
+        """
+        Return an ``IF.Set`` of the docids with values in a range,
+        with the same arguments as ``BTree.keys``.
+
+        :raises TypeError: If a bound isn't an integer.
+        """
+        family = self.family
+        bounds = []
+        for bound, default, exclude, step in ((min_value, family.minint, excludemin, 1),
+                                              (max_value, family.maxint, excludemax, -1)):
+            if bound is None:
+                bound = default
+            elif not isinstance(bound, int):
+                raise TypeError("Expected an integer", bound)
+            elif exclude:
+                bound += step
+            bounds.append(bound)
+        min_value, max_value = bounds
+
+        docids = _integer_array()
+        if (min_value <= max_value
+                and min_value <= family.maxint and max_value >= family.minint):
+            min_value = max(min_value, family.minint)
+            max_value = min(max_value, family.maxint)
+            chunks = self._chunks
+            for chunk in chunks.values(chunks.maxKey(min_value), max_value):
+                values = chunk.values
+                docids.extend(chunk.docids[bisect_left(values, min_value):
+                                           bisect_right(values, max_value)])
+        return family.IF.multiunion(docids)
@@ -8,3 +8,6 @@ import zope.component.testlayer
 import nti.zope_catalog
 
 NTIZopeCatalogLayer = zope.component.testlayer.ZCMLFileLayer(nti.zope_catalog, 'configure.zcml')
+
+NTIZopeCatalogDeferredLayer = zope.component.testlayer.ZCMLFileLayer(nti.zope_catalog, 'deferred.zcml',
+                                                                     name='NTIZopeCatalogDeferredLayer')
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+# stdlib imports
+import unittest
+
+import BTrees
+from BTrees.check import check
+
+from hamcrest import assert_that
+from hamcrest import calling
+from hamcrest import has_length
+from hamcrest import is_
+from hamcrest import raises
+
+from nti.zope_catalog.bulk import ExternalSorter
+from nti.zope_catalog.bulk import bucket_items
+from nti.zope_catalog.bulk import fill_tree
+
+__docformat__ = "restructuredtext en"
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+family = BTrees.family64
+
+
+class TestFillTree(unittest.TestCase):
+
+    def _check_tree(self, tree, keys):
+        tree._check()
+        check(tree)
+        assert_that(list(tree.keys()), is_(keys))
+
+    def _check_grows(self, tree_type, count):
+        keys = list(range(count))
+        tree = fill_tree(tree_type(), ((k, str(k)) for k in keys))
+        self._check_tree(tree, keys)
+        assert_that(tree[count - 1], is_(str(count - 1)))
+        # It can still be modified.
+        for k in range(count, count + 100):
+            tree[k] = str(k)
+        for k in keys[::7]:
+            del tree[k]
+        self._check_tree(tree, sorted(set(range(count + 100)) - set(keys[::7])))
+
+    def test_empty(self):
+        tree = fill_tree(family.OO.BTree(), iter(()))
+        assert_that(len(tree), is_(0))
+
+    def test_one_bucket(self):
+        self._check_grows(family.OO.BTree, 1)
+        self._check_grows(family.OO.BTree, family.OO.BTree.max_leaf_size)
+
+    def test_two_levels(self):
+        self._check_grows(family.OO.BTree, family.OO.BTree.max_leaf_size + 1)
+
+    def test_three_levels(self):
+        tree_type = family.OO.BTree
+        self._check_grows(tree_type,
+                          tree_type.max_leaf_size * tree_type.max_internal_size * 2 + 3)
+
+    def test_full_buckets(self):
+        tree_type = family.IO.BTree
+        tree = fill_tree(tree_type(), ((k, k) for k in range(tree_type.max_leaf_size * 3)))
+        # Three children and the two keys between them.
+        assert_that(len(tree.__getstate__()[0]), is_(5))
+
+    def test_tree_set(self):
+        keys = list(range(1000))
+        tree = fill_tree(family.IF.TreeSet(), keys)
+        self._check_tree(tree, keys)
+        tree.add(1000)
+        self._check_tree(tree, keys + [1000])
+
+    def test_not_empty(self):
+        tree = family.OO.BTree({1: 1})
+        assert_that(calling(fill_tree).with_args(tree, ()),
+                    raises(ValueError))
+
+
+class TestBucketItems(unittest.TestCase):
+
+    def test_tree(self):
+        tree = BTrees.family64.IO.BTree()
+        assert_that(list(bucket_items(tree)), is_([]))
+        tree.update({i: str(i) for i in range(1000)})
+        buckets = list(bucket_items(tree))
+        assert_that(len(buckets) > 1, is_(True))
+        items = [item for bucket in buckets for item in bucket]
+        assert_that(items[0::2], is_(list(range(1000))))
+        assert_that(items[1::2], is_([str(i) for i in range(1000)]))
+
+    def test_tree_set(self):
+        tree = BTrees.family64.IF.TreeSet(range(5))
+        assert_that(list(bucket_items(tree)), is_([(0, 1, 2, 3, 4)]))
+
+
+class TestExternalSorter(unittest.TestCase):
+
+    def test_in_memory(self):
+        sorter = ExternalSorter()
+        sorter.extend([3, 1, 2])
+        assert_that(list(sorter), is_([1, 2, 3]))
+
+    def test_spills_stable(self):
+        sorter = ExternalSorter(key=lambda item: item[0], max_in_memory=10)
+        sorter._SPILL_CHUNK_SIZE = 3
+        items = [(i % 7, i) for i in range(100)]
+        sorter.extend(items)
+        assert_that(sorter._runs, is_(has_length(10)))
+        assert_that(list(sorter), is_(sorted(items, key=lambda item: item[0])))
+        # The files are closed
+        assert_that(sorter._runs, is_([]))
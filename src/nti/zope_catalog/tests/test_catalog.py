@@ -6,6 +6,7 @@ from __future__ import division
 from __future__ import print_function
 
 # stdlib imports
+import collections
 import unittest
 
 from hamcrest import assert_that
@@ -14,6 +15,7 @@ from hamcrest import is_not as does_not
 from hamcrest import has_length
 from hamcrest import is_
 from hamcrest import none
+from hamcrest import only_contains
 
 
 import BTrees
@@ -22,10 +24,16 @@ from zope.annotation.interfaces import IAttributeAnnotatable
 from zope.catalog.interfaces import ICatalog
 
 from zope.index.interfaces import IIndexSearch
+from zope.intid.interfaces import IIntIds
 from zope.container.interfaces import IBTreeContainer
+from zope.interface.interfaces import IComponentLookup
 from zope.location.interfaces import ILocation
+from zope.location.interfaces import IRoot
+from zope.location.interfaces import ISite
 from persistent.interfaces import IPersistent
 from persistent import Persistent
+from persistent.list import PersistentList
+from zope.container.contained import Contained
 
 from nti.testing.matchers import validly_provides
 from nti.testing.matchers import verifiably_provides
@@ -33,6 +41,7 @@ from nti.testing.matchers import implements
 from nti.zope_catalog.catalog import Catalog
 from nti.zope_catalog.catalog import DeferredCatalog
 from nti.zope_catalog.catalog import ResultSet
+from nti.zope_catalog.index import AttributeValueIndex
 from nti.zope_catalog.interfaces import IDeferredCatalog
 from nti.zope_catalog.interfaces import INoAutoIndex
 
@@ -74,6 +83,39 @@ class MockCatalog(Catalog):
 class IDNE(interface.Interface): # pylint:disable=inherit-non-class
     """Not implemented by anything"""
 
+
+class IValued(interface.Interface): # pylint:disable=inherit-non-class
+    """Has a value"""
+
+
+@interface.implementer(IValued)
+class ValuedContent(Persistent):
+
+    def __init__(self, value):
+        self.value = value
+
+    def get_value(self):
+        if self.value == 'broken':
+            raise AttributeError(self.value)
+        return self.value
+
+
+class RangedMockCatalog(MockCatalog):
+
+    def _uidBounds(self):
+        uids = [uid for uid, _ in self.mock_catalog_data]
+        return min(uids), max(uids)
+
+
+def _open_read_only_db(path):
+    from ZODB.DB import DB
+    from ZODB.FileStorage import FileStorage
+    return DB(FileStorage(path, read_only=True))
+
+
+def _in_topic(_extent, _docid, obj):
+    return isinstance(obj, ValuedContent)
+
 class TestCatalog(unittest.TestCase):
 
     main_interface = ICatalog
@@ -117,6 +159,15 @@ class TestCatalogFull(TestCatalog):
         assert_that(locs[0],
                     contains(1, is_(Content)))
 
+    def test_visit_sublocations_range(self):
+        # An override of _visitAllSublocations takes no range, so it
+        # is filtered.
+        cat = self._makeOne()
+        cat.mock_catalog_data.extend((uid, Content()) for uid in range(3, 8))
+        assert_that([uid for uid, _ in cat._visitSublocations(4, 6)], is_([4, 5, 6]))
+        assert_that([uid for uid, _ in cat._visitSublocations(6)], is_([6, 7]))
+        assert_that([uid for uid, _ in cat._visitSublocations(None, 3)], is_([1, 3]))
+
     def test_visit_sublocations_check_class_only(self):
         from zope.interface import alsoProvides
         class MyException(Exception):
@@ -196,6 +247,58 @@ class TestCatalogFull(TestCatalog):
         assert_that(handler.records[0].msg,
                     is_("Error indexing object %s(%s); %s"))
 
+    def test_update_indexes_bulk_loads_empty(self):
+        from zope.testing.loggingsupport import InstalledHandler
+        from nti.zope_catalog.index import AttributeValueIndex
+        handler = InstalledHandler('nti.zope_catalog.catalog')
+        self.addCleanup(handler.uninstall)
+
+        cat = self._makeOne()
+        cat._PERSISTENCE_EXCEPTIONS = AttributeError
+        cat.PREFETCH_CHUNK_SIZE = 2
+        cat.mock_catalog_data[:] = [
+            (uid, ValuedContent('broken' if uid == 3 else uid))
+            for uid in range(1, 6)
+        ]
+        cat['value'] = AttributeValueIndex('get_value', field_callable=True)
+        index = cat['value']
+        loaders = []
+        bulk_loader = index.bulk_loader
+        def recording_loader():
+            loader = bulk_loader()
+            loaders.append(loader)
+            return loader
+        index.bulk_loader = recording_loader
+
+        cat.updateIndexes(ignore_persistence_exceptions=True)
+        assert_that(loaders, has_length(1))
+        assert_that(dict(index.documents_to_values),
+                    is_({1: 1, 2: 2, 4: 4, 5: 5}))
+        assert_that(index.documentCount(), is_(4))
+        assert_that(handler.records, has_length(1))
+
+        # Now that it's populated, it's updated incrementally.
+        del loaders[:]
+        cat.mock_catalog_data[0] = (1, ValuedContent(10))
+        cat.updateIndexes(ignore_persistence_exceptions=True)
+        assert_that(loaders, only_contains(none()))
+        assert_that(index.documents_to_values[1], is_(10))
+
+    def test_index_docs(self):
+        from nti.zope_catalog.index import AttributeValueIndex
+        cat = self._makeOne()
+        cat['value'] = AttributeValueIndex('value')
+        cat['recording'] = RecordingIndex()
+        cat.index_docs((uid, ValuedContent(uid)) for uid in (3, 1, 2))
+        assert_that(dict(cat['value'].documents_to_values),
+                    is_({1: 1, 2: 2, 3: 3}))
+        assert_that(list(cat['recording'].indexed), is_([3, 1, 2]))
+
+        cat.unindex_docs(iter([1, 2]))
+        assert_that(dict(cat['value'].documents_to_values),
+                    is_({3: 3}))
+        assert_that(list(cat['recording'].indexed), is_([3]))
+
     def test_update_index_with_error(self):
         from zope.testing.loggingsupport import InstalledHandler
         handler = InstalledHandler('nti.zope_catalog.catalog')
@@ -211,11 +314,1096 @@ class TestCatalogFull(TestCatalog):
                     is_("Error indexing object %s(%s); %s"))
 
 
+class TestUpdateIndexesInParallel(unittest.TestCase):
+
+    def setUp(self):
+        import os
+        import shutil
+        import tempfile
+        import transaction
+        from ZODB.DB import DB
+        from ZODB.FileStorage import FileStorage
+        from nti.zope_catalog.index import AttributeValueIndex
+        from nti.zope_catalog.topic import ExtentFilteredSet
+        from nti.zope_catalog.topic import TopicIndex
+
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.path = os.path.join(tmpdir, 'Data.fs')
+        db = DB(FileStorage(self.path))
+        self.addCleanup(db.close)
+        self.transaction_manager = transaction.TransactionManager()
+        conn = db.open(self.transaction_manager)
+        self.addCleanup(conn.close)
+        self.addCleanup(self.transaction_manager.abort)
+
+        cat = RangedMockCatalog()
+        cat.mock_catalog_data.extend(
+            (uid, ValuedContent('v%d' % uid))
+            for uid in range(3, 20)
+        )
+        cat['value'] = AttributeValueIndex('value')
+        cat['callable'] = AttributeValueIndex('get_value', IValued,
+                                              field_callable=True)
+        topic = TopicIndex()
+        topic.addFilter(ExtentFilteredSet('valued', _in_topic))
+        cat['topic'] = topic
+        conn.root.cat = cat
+        self.transaction_manager.commit()
+        self.cat = cat
+
+    def _db_factory(self):
+        import functools
+        return functools.partial(_open_read_only_db, self.path)
+
+    def _update(self, **kwargs):
+        from concurrent.futures import ThreadPoolExecutor
+        kwargs.setdefault('executor', ThreadPoolExecutor(3))
+        self.cat.updateIndexesInParallel(self._db_factory(), workers=3, **kwargs)
+
+    def _check_indexed(self):
+        cat = self.cat
+        assert_that(dict(cat['value'].documents_to_values),
+                    is_({uid: 'v%d' % uid for uid in range(3, 20)}))
+        assert_that(dict(cat['callable'].documents_to_values),
+                    is_({uid: 'v%d' % uid for uid in range(3, 20)}))
+        assert_that(sorted(cat['topic']['valued'].ids()),
+                    is_(list(range(3, 20))))
+
+    def test_update_with_executor(self):
+        self._update()
+        self._check_indexed()
+
+    def test_update_with_processes(self):
+        self.cat.updateIndexesInParallel(self._db_factory(), workers=2)
+        self._check_indexed()
+
+    def test_update_unindexes_none(self):
+        self.cat['value'].index_doc(3, 'old')
+        self.cat.mock_catalog_data[2][1].value = None
+        self.transaction_manager.commit()
+        self._update()
+        assert_that(self.cat['value'].documents_to_values.get(3), is_(none()))
+
+    def test_update_with_error(self):
+        from zope.testing.loggingsupport import InstalledHandler
+        handler = InstalledHandler('nti.zope_catalog.catalog')
+        self.addCleanup(handler.uninstall)
+
+        self.cat.mock_catalog_data[2][1].value = 'broken'
+        self.cat._PERSISTENCE_EXCEPTIONS = AttributeError
+        self.transaction_manager.commit()
+        self._update(ignore_persistence_exceptions=True)
+
+        assert_that(handler.records, has_length(1))
+        assert_that(self.cat['callable'].documents_to_values.get(3), is_(none()))
+        assert_that(self.cat['value'].documents_to_values.get(3), is_('broken'))
+
+    def test_update_no_uids(self):
+        from nti.zope_catalog.catalog import Catalog as _Catalog
+        cat = self.cat
+        # No intids utility, so no bounds: updated serially.
+        cat._uidBounds = lambda: _Catalog._uidBounds(cat)
+        self._update(executor=None)
+        self._check_indexed()
+
+    def test_uid_bounds_from_intids(self):
+        from zope.component import getGlobalSiteManager
+        from zope.intid.interfaces import IIntIds
+        from nti.zope_catalog.catalog import Catalog as _Catalog
+
+        @interface.implementer(IIntIds)
+        class IntIds(object):
+            refs = family.IO.BTree({5: None, 42: None, 7: None})
+
+        intids = IntIds()
+        gsm = getGlobalSiteManager()
+        gsm.registerUtility(intids, IIntIds)
+        self.addCleanup(gsm.unregisterUtility, intids, IIntIds)
+
+        assert_that(_Catalog()._uidBounds(), is_((5, 42)))
+        intids.refs = family.IO.BTree()
+        assert_that(_Catalog()._uidBounds(), is_(none()))
+        del IntIds.refs
+        assert_that(_Catalog()._uidBounds(), is_(none()))
+
+    def test_update_not_committed(self):
+        cat = RangedMockCatalog()
+        with self.assertRaises(ValueError):
+            cat.updateIndexesInParallel(self._db_factory())
+
+    def test_worker_other_database(self):
+        from nti.zope_catalog.catalog import _update_indexes_worker
+
+        class Conn(object):
+            closed = False
+            def __init__(self, name, other=None):
+                self.name = name
+                self.other = other
+            def db(self):
+                return self
+            database_name = property(lambda self: self.name)
+            def get_connection(self, name):
+                assert name == self.other.name
+                return self.other
+            def get(self, oid):
+                assert oid == b'oid'
+                return self
+            def _extractIndexValues(self, *args):
+                return self.name, args
+            def close(self):
+                self.closed = True
+
+        class DB(object):
+            closed = False
+            conn = Conn('root', Conn('catalogs'))
+            def open(self):
+                return self.conn
+            def close(self):
+                self.closed = True
+
+        db = DB()
+        result = _update_indexes_worker(lambda: db, 'catalogs', b'oid',
+                                        ['a'], 1, 2, False)
+        assert_that(result, is_(('catalogs', (['a'], 1, 2, False))))
+        assert_that(db.closed, is_(True))
+        assert_that(db.conn.closed, is_(True))
+
+    def test_extracted_value_attributes(self):
+        from nti.zope_catalog.catalog import _ExtractedValue
+        from nti.zope_catalog.index import AttributeValueIndex
+        value = _ExtractedValue(AttributeValueIndex('value'), 42)
+        assert_that(value.value, is_(42))
+        with self.assertRaises(AttributeError):
+            getattr(value, 'other')
+
+    def test_split_uid_range(self):
+        from nti.zope_catalog.catalog import _split_uid_range
+        assert_that(_split_uid_range(1, 10, 3),
+                    is_([(1, 3), (4, 6), (7, 10)]))
+        assert_that(_split_uid_range(1, 2, 3),
+                    is_([(1, 1), (2, 2)]))
+        assert_that(_split_uid_range(5, 5, 1),
+                    is_([(5, 5)]))
+
+
+class LocatedContent(ValuedContent):
+
+    def __init__(self, value, parent):
+        super().__init__(value)
+        self.__parent__ = parent
+
+
+@interface.implementer(ISite, IRoot)
+class Site(Persistent):
+
+    __parent__ = None
+
+    def __init__(self):
+        from zope.component import getGlobalSiteManager
+        from zope.component.persistentregistry import PersistentComponents
+        self.sm = PersistentComponents(bases=(getGlobalSiteManager(),))
+
+    def getSiteManager(self):
+        return self.sm
+
+
+class _SitesMixin(object):
+    # A database with two sites, holding ten objects each, and
+    # a zope.intid utility. Call _register once it is in place.
+
+    def setUp(self):
+        import transaction
+        from ZODB.DB import DB
+        from zope.component import getGlobalSiteManager
+        from zope.intid import IntIds
+        from zope.keyreference.interfaces import IKeyReference
+        from zope.keyreference.persistent import KeyReferenceToPersistent
+        from zope.location.interfaces import ILocationInfo
+        from zope.location.traversing import LocationPhysicallyLocatable
+        from zope.site.site import SiteManagerAdapter
+
+        gsm = getGlobalSiteManager()
+        for factory, required, provided in (
+                (KeyReferenceToPersistent, (IPersistent,), IKeyReference),
+                (LocationPhysicallyLocatable, (ILocation,), ILocationInfo),
+                (SiteManagerAdapter, (interface.Interface,), IComponentLookup),
+        ):
+            gsm.registerAdapter(factory, required, provided)
+            self.addCleanup(gsm.unregisterAdapter, factory, required, provided)
+
+        self.db = db = DB(self._makeStorage())
+        self.addCleanup(db.close)
+        self.transaction_manager = transaction.TransactionManager()
+        self.conn = conn = db.open(self.transaction_manager)
+        self.addCleanup(conn.close)
+        self.addCleanup(self.transaction_manager.abort)
+
+        root = conn.root
+        root.site = Site()
+        root.other_site = Site()
+        root.intids = self.intids = IntIds(family=family)
+        root.contents = PersistentList(
+            LocatedContent(i, root.site if i % 2 else root.other_site)
+            for i in range(20)
+        )
+        self.cat = cat = Catalog()
+        cat.__parent__ = root.site
+        cat['value'] = AttributeValueIndex('value')
+        root.cat = cat
+        self.transaction_manager.commit()
+
+    def _makeStorage(self):
+        from ZODB.MappingStorage import MappingStorage
+        return MappingStorage()
+
+    def _register(self):
+        # In intid order
+        self.contents = [
+            content
+            for _, content in sorted((self.intids.register(content), content)
+                                     for content in self.conn.root.contents)
+        ]
+        self.uids = [self.intids.getId(content) for content in self.contents]
+        self.transaction_manager.commit()
+
+    def _status(self):
+        return [content._p_status for content in self.contents]
+
+
+class TestVisitSublocations(_SitesMixin, unittest.TestCase):
+
+    def test_local_intids_range(self):
+        self.conn.root.site.sm.registerUtility(self.intids, IIntIds)
+        self._register()
+        uids = self.uids
+        self.conn.cacheMinimize()
+
+        visited = list(self.cat._visitSublocations(uids[3], uids[5]))
+        assert_that(visited, is_(list(zip(uids[3:6], self.contents[3:6]))))
+        # The objects outside the range weren't loaded.
+        assert_that(self._status(),
+                    is_(['ghost'] * 3 + ['saved'] * 3 + ['ghost'] * 14))
+
+        self.conn.cacheMinimize()
+        results = self.cat._extractIndexValues(['value'], None, uids[1], False)
+        assert_that(results,
+                    is_({'value': [(uid, content.value)
+                                   for uid, content in zip(uids[:2], self.contents)]}))
+        assert_that(self._status(), is_(['saved'] * 2 + ['ghost'] * 18))
+
+    def test_global_intids_inside_site(self):
+        from zope.component import getGlobalSiteManager
+        gsm = getGlobalSiteManager()
+        gsm.registerUtility(self.intids, IIntIds)
+        self.addCleanup(gsm.unregisterUtility, self.intids, IIntIds)
+        self._register()
+        uids = self.uids
+        self.conn.cacheMinimize()
+
+        visited = list(self.cat._visitSublocations(uids[10]))
+        assert_that(visited,
+                    is_([(uid, content)
+                         for uid, content in zip(uids[10:], self.contents[10:])
+                         if content.value % 2]))
+        # Only those in the range had to be loaded to see if they're
+        # in the site.
+        assert_that(self._status(), is_(['ghost'] * 10 + ['saved'] * 10))
+
+    def test_changed_inside_site(self):
+        from zope.component import getGlobalSiteManager
+        gsm = getGlobalSiteManager()
+        gsm.registerUtility(self.intids, IIntIds)
+        self.addCleanup(gsm.unregisterUtility, self.intids, IIntIds)
+        self._register()
+        tid = self.db.lastTransaction()
+        inside = [content for content in self.contents if content.value % 2][:2]
+        outside = [content for content in self.contents if not content.value % 2][:2]
+        for content in inside + outside:
+            content.text = 'changed'
+        inside = sorted(self.intids.getId(content) for content in inside)
+        outside = sorted(self.intids.getId(content) for content in outside)
+        self.transaction_manager.commit()
+        self.conn.cacheMinimize()
+
+        class NotIterable(object):
+            def __iter__(self):
+                raise AssertionError("Iterated the whole utility") # pragma: no cover
+            keys = values = items = __iter__
+
+        # The utility's refs are neither iterated nor used to find
+        # objects.
+        intids = self.intids
+        intids.refs = NotIterable()
+        changed = self.cat.changedDocidsSince(tid)
+        assert_that(list(changed), is_(sorted(inside + outside)))
+        # Without loading anything
+        assert_that(set(self._status()), is_({'ghost'}))
+        self.transaction_manager.abort()
+        assert_that(intids.refs, does_not(is_(NotIterable)))
+
+        self.cat.updateIndexes(since=tid)
+        assert_that(list(self.cat['value'].ids()), is_(inside))
+        # The other objects weren't loaded.
+        assert_that(self._status().count('ghost'), is_(16))
+
+    def test_resume_skips_earlier_intids(self):
+        from zope.component import getGlobalSiteManager
+        from nti.zope_catalog.catalog import ResumeToken
+        gsm = getGlobalSiteManager()
+        gsm.registerUtility(self.intids, IIntIds)
+        self.addCleanup(gsm.unregisterUtility, self.intids, IIntIds)
+        self._register()
+        uids = self.uids
+        cat = self.cat
+        cat._resume_token = ResumeToken(('value',))
+        cat._resume_token.last_uid = uids[9]
+        self.transaction_manager.commit()
+        self.conn.cacheMinimize()
+
+        cat.updateIndexes(checkpoint_documents=3)
+        assert_that(sorted(cat['value'].ids()),
+                    is_([uid for uid, content in zip(uids[10:], self.contents[10:])
+                         if content.value % 2]))
+        assert_that(cat._resume_token, is_(none()))
+        # The objects before the token were never loaded.
+        assert_that(self._status()[:10], is_(['ghost'] * 10))
+
+
+class TestParallelLocalIntIds(_SitesMixin, unittest.TestCase):
+
+    def _makeStorage(self):
+        import tempfile
+        import shutil
+        import os
+        from ZODB.FileStorage import FileStorage
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.path = os.path.join(tmpdir, 'Data.fs')
+        return FileStorage(self.path)
+
+    def test_update_with_local_intids(self):
+        import functools
+        from concurrent.futures import ThreadPoolExecutor
+        self.conn.root.site.sm.registerUtility(self.intids, IIntIds)
+        self._register()
+
+        self.cat.updateIndexesInParallel(functools.partial(_open_read_only_db, self.path),
+                                         workers=3, executor=ThreadPoolExecutor(3))
+        assert_that(dict(self.cat['value'].documents_to_values),
+                    is_({uid: content.value
+                         for uid, content in zip(self.uids, self.contents)}))
+
+
+class RecordingIndex(Contained, Persistent):
+
+    fail_on = None
+
+    def __init__(self):
+        self.indexed = PersistentList()
+
+    def index_doc(self, uid, _obj):
+        if uid == self.fail_on:
+            raise MyIndexingError(uid)
+        self.indexed.append(uid)
+
+    def unindex_doc(self, uid):
+        self.indexed.remove(uid)
+
+
+class MyIndexingError(Exception):
+    pass
+
+
+class TestCheckpointedUpdate(unittest.TestCase):
+
+    def setUp(self):
+        import transaction
+        from ZODB.DB import DB
+        from ZODB.MappingStorage import MappingStorage
+
+        db = DB(MappingStorage())
+        self.addCleanup(db.close)
+        self.transaction_manager = transaction.TransactionManager()
+        conn = db.open(self.transaction_manager)
+        self.addCleanup(conn.close)
+        self.addCleanup(self.transaction_manager.abort)
+
+        cat = MockCatalog()
+        cat.mock_catalog_data.extend(
+            (uid, ValuedContent(uid))
+            for uid in range(3, 10)
+        )
+        cat['recording'] = RecordingIndex()
+        conn.root.cat = cat
+        self.transaction_manager.commit()
+        self.cat = cat
+        self.index = cat['recording']
+
+    def test_resume_after_failure(self):
+        self.index.fail_on = 6
+        with self.assertRaises(MyIndexingError):
+            self.cat.updateIndexes(checkpoint_documents=2)
+        self.transaction_manager.abort()
+
+        # Uids 1, 3, 4 and 5 were committed (2 is not indexed).
+        assert_that(list(self.index.indexed), is_([1, 3, 4, 5]))
+        assert_that(self.cat._resume_token.last_uid, is_(5))
+        assert_that(self.cat._resume_token.index_names, is_(('recording',)))
+
+        del self.index.fail_on
+        self.cat.updateIndex(self.index, checkpoint_documents=2)
+        assert_that(list(self.index.indexed), is_([1, 3, 4, 5, 6, 7, 8, 9]))
+        assert_that(self.cat._resume_token, is_(none()))
+        # Everything was committed
+        self.transaction_manager.abort()
+        assert_that(list(self.index.indexed), is_([1, 3, 4, 5, 6, 7, 8, 9]))
+
+    def test_different_indexes_start_over(self):
+        from nti.zope_catalog.catalog import ResumeToken
+        self.cat._resume_token = ResumeToken(('other',))
+        self.cat._resume_token.last_uid = 5
+        self.cat.updateIndexes(checkpoint_seconds=0)
+        assert_that(list(self.index.indexed), is_([1, 3, 4, 5, 6, 7, 8, 9]))
+
+    def test_commits_by_time(self):
+        commits = []
+        class TM(object):
+            def commit(self):
+                commits.append(1)
+        self.cat.PREFETCH_CHUNK_SIZE = 3
+        self.cat.updateIndexes(checkpoint_seconds=0, transaction_manager=TM())
+        # One for each batch of documents, plus one at the end
+        assert_that(commits, has_length(4))
+
+    def test_default_transaction_manager(self):
+        cat = MockCatalog()
+        cat['recording'] = RecordingIndex()
+        cat.updateIndexes(checkpoint_documents=1)
+        assert_that(list(cat['recording'].indexed), is_([1]))
+        assert_that(cat._resume_token, is_(none()))
+
+
+@interface.implementer(IIntIds)
+class IAdaptableToValued(interface.Interface): # pylint:disable=inherit-non-class
+    """Has an adapter to IValued"""
+
+
+@interface.implementer(IAdaptableToValued)
+class AdaptableContent(Persistent):
+    pass
+
+
+class ConformingContent(Persistent):
+
+    def __conform__(self, iface):
+        return ValuedContent('conformed') if iface is IValued else None
+
+
+class _SeenValueIndex(AttributeValueIndex):
+
+    def bulk_loader(self):
+        return None
+
+    def index_docs(self, pairs):
+        pairs = list(pairs)
+        self._v_seen = getattr(self, '_v_seen', []) + [uid for uid, _ in pairs]
+        super().index_docs(pairs)
+
+
+class TestSkipInapplicableClasses(unittest.TestCase):
+
+    def setUp(self):
+        import transaction
+        from ZODB.DB import DB
+        from ZODB.MappingStorage import MappingStorage
+        from zope.component import getGlobalSiteManager
+
+        gsm = getGlobalSiteManager()
+        adapter = lambda _obj: ValuedContent('adapted')
+        gsm.registerAdapter(adapter, (IAdaptableToValued,), IValued)
+        self.addCleanup(gsm.unregisterAdapter, adapter, (IAdaptableToValued,), IValued)
+
+        db = DB(MappingStorage())
+        self.addCleanup(db.close)
+        self.transaction_manager = transaction.TransactionManager()
+        self.conn = conn = db.open(self.transaction_manager)
+        self.addCleanup(conn.close)
+        self.addCleanup(self.transaction_manager.abort)
+
+        cat = MockCatalog()
+        cat.SKIP_INAPPLICABLE_CLASSES = True
+        cat.mock_catalog_data.extend([
+            (3, ValuedContent('v3')),
+            (4, ValuedContent('v4')),
+            (5, PersistentContent()),
+            (6, PersistentContent()),
+            (7, AdaptableContent()),
+            (8, ConformingContent()),
+        ])
+        cat['callable'] = _SeenValueIndex('get_value', IValued, field_callable=True)
+        cat['dne'] = _SeenValueIndex('value', IDNE)
+        conn.root.cat = cat
+        self.transaction_manager.commit()
+        conn.cacheMinimize()
+        self.cat = conn.root.cat
+
+    def _status(self, uid):
+        return dict(self.cat.mock_catalog_data)[uid]._p_status
+
+    def test_update_skips_without_loading(self):
+        cat = self.cat
+        cat.updateIndexes()
+        assert_that(dict(cat['callable'].documents_to_values),
+                    is_({3: 'v3', 4: 'v4', 7: 'adapted', 8: 'conformed'}))
+        assert_that(cat['callable']._v_seen, is_([3, 4, 7, 8]))
+        # Only the class with __conform__ could apply.
+        assert_that(cat['dne']._v_seen, is_([8]))
+        assert_that(self._status(5), is_('ghost'))
+        assert_that(self._status(6), is_('ghost'))
+
+        # An index without an interface applies to everything.
+        cat['value'] = AttributeValueIndex('value')
+        cat.updateIndexes()
+        assert_that(cat['callable']._v_seen, is_([3, 4, 7, 8] * 2))
+        assert_that(cat['dne']._v_seen, is_([8, 8]))
+        assert_that(self._status(5), is_('saved'))
+
+    def test_nothing_applicable(self):
+        cat = self.cat
+        del cat.mock_catalog_data[-1]
+        cat.updateIndexes()
+        assert_that(getattr(cat['dne'], '_v_seen', None), is_(none()))
+
+    def test_disabled(self):
+        cat = self.cat
+        cat.SKIP_INAPPLICABLE_CLASSES = False
+        cat.updateIndex(cat['callable'])
+        assert_that(cat['callable']._v_seen, is_([1, 3, 4, 5, 6, 7, 8]))
+        assert_that(self._status(5), is_('saved'))
+
+    def test_applies_to(self):
+        cat = self.cat
+        cat.SKIP_INAPPLICABLE_CLASSES = False
+        cat['callable'].applies_to = (ValuedContent,)
+        cat['dne'].applies_to = (IAdaptableToValued,)
+        cat.updateIndexes()
+        assert_that(cat['callable']._v_seen, is_([3, 4]))
+        assert_that(cat['dne']._v_seen, is_([7]))
+        assert_that(self._status(5), is_('ghost'))
+        assert_that(self._status(8), is_('ghost'))
+
+        results = cat._extractIndexValues(['callable'], None, None, False)
+        assert_that(results, is_({'callable': [(3, 'v3'), (4, 'v4')]}))
+
+    def test_extract_values(self):
+        results = self.cat._extractIndexValues(['callable', 'dne'], 4, None, False)
+        assert_that(results, is_({'callable': [(4, 'v4'), (7, 'adapted'), (8, 'conformed')],
+                                  'dne': []}))
+        assert_that(self._status(6), is_('ghost'))
+        assert_that(self._status(5), is_('ghost'))
+
+
+class MappingIntIds(object):
+
+    def __init__(self):
+        self.objects = {}
+
+    def register(self, uid, obj):
+        self.objects[uid] = obj
+
+    def getObject(self, uid):
+        return self.objects[uid]
+
+    def queryId(self, obj):
+        for uid, o in self.objects.items():
+            if o is obj:
+                return uid
+        return None
+
+    def __iter__(self):
+        return iter(sorted(self.objects))
+
+
+class TestUpdateSince(unittest.TestCase):
+
+    def setUp(self):
+        import transaction
+        from zope.component import getGlobalSiteManager
+        from ZODB.DB import DB
+        from ZODB.MappingStorage import MappingStorage
+
+        self.db = db = DB(MappingStorage())
+        self.addCleanup(db.close)
+        self.transaction_manager = transaction.TransactionManager()
+        conn = db.open(self.transaction_manager)
+        self.addCleanup(conn.close)
+        self.addCleanup(self.transaction_manager.abort)
+
+        self.intids = MappingIntIds()
+        gsm = getGlobalSiteManager()
+        gsm.registerUtility(self.intids, IIntIds)
+        self.addCleanup(gsm.unregisterUtility, self.intids, IIntIds)
+
+        cat = Catalog()
+        cat['recording'] = RecordingIndex()
+        conn.root.cat = cat
+        conn.root.contents = contents = PersistentList()
+        for uid in range(10):
+            content = ValuedContent(uid)
+            contents.append(content)
+            self.intids.register(uid, content)
+        no_index = NoIndexContent()
+        contents.append(no_index)
+        self.intids.register(10, no_index)
+        self.transaction_manager.commit()
+        self.cat = cat
+        self.contents = contents
+
+    def test_changed_since(self):
+        tid = self.db.lastTransaction()
+        self.contents[7].value = 'changed'
+        self.contents[3].value = 'changed'
+        self.contents[10].value = 'changed'
+        # Not an intid
+        self.contents.append(ValuedContent('new'))
+        self.transaction_manager.commit()
+
+        assert_that(list(self.cat.changedDocidsSince(tid)),
+                    is_([3, 7, 10]))
+        self.cat.updateIndexes(since=tid)
+        assert_that(list(self.cat['recording'].indexed),
+                    is_([3, 7]))
+
+        # Which is resumable
+        del self.cat['recording'].indexed[:]
+        from nti.zope_catalog.catalog import ResumeToken
+        self.cat._resume_token = ResumeToken(('recording',))
+        self.cat._resume_token.last_uid = 3
+        self.cat.updateIndex(self.cat['recording'], since=tid,
+                             checkpoint_documents=1)
+        assert_that(list(self.cat['recording'].indexed),
+                    is_([7]))
+
+    def test_visit_range_without_refs(self):
+        visited = self.cat._visitSublocations(3, 5)
+        assert_that([uid for uid, _ in visited], is_([3, 4, 5]))
+
+    def test_nothing_changed(self):
+        tid = self.db.lastTransaction()
+        assert_that(list(self.cat.changedDocidsSince(tid)), is_([]))
+
+    def test_unregistered_object(self):
+        tid = self.db.lastTransaction()
+        self.contents[1].value = 'changed'
+        self.contents[2].value = 'changed'
+        # BTree records are skipped
+        self.cat._p_jar.root()['tree'] = family.OO.BTree({'a': 1})
+        self.transaction_manager.commit()
+        del self.intids.objects[1]
+        assert_that(list(self.cat.changedDocidsSince(tid)), is_([2]))
+
+    def test_storage_not_iterable(self):
+        tid = self.db.lastTransaction()
+        storage = self.db.storage
+        self.db.storage = object()
+        self.addCleanup(setattr, self.db, 'storage', storage)
+        with self.assertRaises(TypeError):
+            self.cat.changedDocidsSince(tid)
+
+
+class TestSearchResults(unittest.TestCase):
+
+    def setUp(self):
+        from zope.component import getGlobalSiteManager
+        from zope.catalog.field import FieldIndex
+        from zope.catalog.text import TextIndex
+        from nti.zope_catalog.index import IntegerAttributeIndex
+
+        self.intids = MappingIntIds()
+        gsm = getGlobalSiteManager()
+        gsm.registerUtility(self.intids, IIntIds)
+        self.addCleanup(gsm.unregisterUtility, self.intids, IIntIds)
+
+        self.cat = cat = Catalog()
+        cat['num'] = IntegerAttributeIndex('value')
+        cat['field'] = FieldIndex('value')
+        cat['text'] = TextIndex('text')
+        for uid in range(20):
+            content = ValuedContent(uid % 7)
+            content.text = 'even' if uid % 2 == 0 else 'odd'
+            self.intids.register(uid, content)
+            cat.index_doc(uid, content)
+
+    def test_sort_with_limit(self):
+        results = self.cat.searchResults(num={'between': (2, 5)},
+                                         _sort_index='num', _limit=4, _reverse=True)
+        assert_that(results, is_(ResultSet))
+        assert_that(list(results.uids), is_([19, 12, 5, 18]))
+        assert_that([x.value for x in results], is_([5, 5, 5, 4]))
+
+    def test_sort_without_query(self):
+        results = self.cat.searchResults(_sort_index='num', _limit=5)
+        assert_that(list(results.uids), is_([0, 7, 14, 1, 8]))
+
+        with self.assertRaises(ValueError):
+            self.cat.searchResults(_sort_index='field')
+
+    def test_sort_by_other_index(self):
+        results = self.cat.searchResults(text='even', _sort_index='field', _limit=3)
+        assert_that(list(results.uids), is_([0, 14, 8]))
+
+        with self.assertRaises(ValueError):
+            self.cat.searchResults(num={'any_of': (1,)}, _sort_index='text')
+
+    def test_no_sort(self):
+        assert_that(self.cat.searchResults(), is_(none()))
+        results = self.cat.searchResults(num={'any_of': (1, 2)},
+                                         _limit=3, _reverse=True)
+        assert_that(list(results.uids), is_([16, 15, 9]))
+        results = self.cat.searchResults(num={'any_of': (1,)})
+        assert_that(list(results.uids), is_([1, 8, 15]))
+
+
+class TestApplyPlan(unittest.TestCase):
+
+    def setUp(self):
+        from zc.catalog.catalogindex import ValueIndex as ZCValueIndex
+        from zope.catalog.catalog import Catalog as ZopeCatalog
+        from nti.zope_catalog.index import AttributeSetIndex
+        from nti.zope_catalog.index import AttributeValueIndex
+
+        calls = self.calls = []
+
+        class RecordingValueIndex(AttributeValueIndex):
+            def apply(self, query):
+                calls.append(('apply', self.__name__))
+                return super().apply(query)
+
+            def apply_filtered(self, query, docids):
+                calls.append(('apply_filtered', self.__name__))
+                return super().apply_filtered(query, docids)
+
+        self.cat = cat = Catalog()
+        self.zope_cat = zope_cat = ZopeCatalog(family=family)
+        for c in cat, zope_cat:
+            c['value'] = RecordingValueIndex('value')
+            c['mod'] = RecordingValueIndex('mod')
+            c['set'] = AttributeSetIndex('tags')
+            # Can't estimate
+            c['text'] = ZCValueIndex('text', family=family)
+        for uid in range(200):
+            content = ValuedContent(uid % 20)
+            content.mod = uid % 3
+            content.tags = (uid % 4, uid % 5 + 10)
+            content.text = 'even' if uid % 2 == 0 else 'odd'
+            for c in cat, zope_cat:
+                c.index_doc(uid, content)
+        del calls[:]
+
+    def _items(self, result):
+        return list(result.items()) if hasattr(result, 'items') else list(result)
+
+    def test_same_results(self):
+        queries = [
+            {'value': {'any_of': (1, 2)}, 'mod': {'any_of': (0,)}},
+            {'value': {'between': (1, 8)}, 'set': {'any_of': (1, 12)},
+             'text': {'any_of': ('even',)}},
+            {'text': {'any_of': ('odd',)}, 'set': {'all_of': (1, 11)}},
+            {'value': {'any_of': (1,)}, 'mod': {'any_of': (2,)}, 'set': {'any_of': (3,)}},
+            {'value': {'any_of': (99,)}, 'text': {'any_of': ('even',)}},
+            {'text': {'any_of': ('nothing',)}, 'value': {'any_of': (1,)}},
+            {'text': {'any_of': ('even',)}, 'value': {}},
+            {'text': {}},
+        ]
+        for query in queries:
+            result = self.cat.apply(query)
+            count = self.cat.count(query)
+            expected = self.zope_cat.apply(query)
+            if expected is None:
+                assert_that(result, is_(none()))
+                assert_that(count, is_(none()))
+            else:
+                assert_that(self._items(result), is_(self._items(expected)), query)
+                assert_that(count, is_(len(expected)), query)
+
+    def test_count(self):
+        assert_that(self.cat.count({'value': {'any_of': (1, 2)}}), is_(20))
+        assert_that(self.calls, is_([]))
+        # Without a count method.
+        assert_that(self.cat.count({'text': {'any_of': ('odd',)}}), is_(100))
+
+        # Several indexes filter instead of intersecting.
+        assert_that(self.cat.count({'value': {'any_of': (1, 2, 3, 4, 5)},
+                                    'mod': {'any_of': (0, 1)}}),
+                    is_(33))
+        assert_that(self.calls, is_([('apply', 'value'), ('apply_filtered', 'mod')]))
+
+    def test_most_selective_first(self):
+        # Ten documents have value 1; about sixty-seven have mod 2.
+        result = self.cat.apply({'mod': {'any_of': (2,)}, 'value': {'any_of': (1,)}})
+        assert_that(list(result), is_([41, 101, 161]))
+        assert_that(self.calls, is_([('apply', 'value'), ('apply_filtered', 'mod')]))
+
+        del self.calls[:]
+        self.cat.PLAN_FILTER_RATIO = 0.1
+        self.cat.apply({'mod': {'any_of': (2,)}, 'value': {'any_of': (1,)}})
+        assert_that(self.calls, is_([('apply', 'value'), ('apply', 'mod')]))
+
+    def test_empty_estimate(self):
+        result = self.cat.apply({'mod': {'any_of': (2,)}, 'value': {'any_of': (99,)}})
+        assert_that(list(result), is_([]))
+        assert_that(self.calls, is_([]))
+
+    def test_stops_when_empty(self):
+        result = self.cat.apply({'value': {'any_of': (1,)},
+                                 'set': {'all_of': (2, 11)},
+                                 'mod': {'any_of': (0, 1, 2)}})
+        assert_that(list(result), is_([]))
+        # The set index emptied the intersection.
+        assert_that(self.calls, is_([('apply', 'value')]))
+
+        # Likewise without filtering.
+        self.cat.PLAN_FILTER_RATIO = 0
+        result = self.cat.apply({'value': {'any_of': (1,)},
+                                 'set': {'all_of': (2, 11)},
+                                 'mod': {'any_of': (0, 1, 2)}})
+        assert_that(list(result), is_([]))
+
+
+class _CountingValueIndex(AttributeValueIndex):
+
+    applied = []
+
+    def apply(self, query):
+        self.applied.append(self.__name__)
+        return super().apply(query)
+
+
+class CachingCatalog(Catalog):
+    QUERY_CACHE_SIZE = 10
+
+    def _visitAllSublocations(self):
+        return iter(())
+
+
+class TestQueryCache(unittest.TestCase):
+
+    def _makeOne(self, max_entries=3, max_bytes=1000):
+        from nti.zope_catalog.catalog import QueryCache
+        return QueryCache(max_entries, max_bytes)
+
+    def test_lru(self):
+        cache = self._makeOne()
+        for i in range(3):
+            cache.put(i, family.IF.Set([i]))
+        assert_that(cache.get(0), is_(family.IF.Set))
+        cache.put(3, family.IF.Set())
+        # 1 was least recently used.
+        assert_that(cache.get(1), is_(none()))
+        assert_that([cache.get(i) is not None for i in (0, 2, 3)],
+                    is_([True, True, True]))
+        assert_that((cache.hits, cache.misses), is_((4, 1)))
+        cache.clear()
+        assert_that(cache, has_length(0))
+        assert_that(cache.nbytes, is_(0))
+
+    def test_bytes(self):
+        cache = self._makeOne(max_entries=10, max_bytes=1000)
+        cache.put('big', family.IF.Set(range(200)))
+        assert_that(cache, has_length(0))
+        cache.put('a', family.IF.Set(range(50)))
+        cache.put('a', family.IF.Set(range(60)))
+        assert_that(cache.nbytes, is_(64 + 8 * 60))
+        cache.put('b', family.IF.Bucket([(i, 1.0) for i in range(20)]))
+        assert_that(cache.nbytes, is_(64 + 8 * 60 + 64 + 16 * 20))
+        cache.put('c', family.IF.Set(range(20)))
+        assert_that(cache.get('a'), is_(none()))
+        assert_that(cache, has_length(2))
+
+
+class TestCatalogQueryCache(unittest.TestCase):
+
+    query = {'value': {'any_of': (1, 2)}}
+
+    def setUp(self):
+        from ZODB.DB import DB
+        from ZODB.MappingStorage import MappingStorage
+        import transaction
+
+        self.db = DB(MappingStorage())
+        self.addCleanup(self.db.close)
+        self.tm = transaction.TransactionManager()
+        conn = self.db.open(self.tm)
+        self.addCleanup(conn.close)
+        self.addCleanup(self.tm.abort)
+
+        self.cat = cat = CachingCatalog()
+        cat['value'] = _CountingValueIndex('value')
+        cat['other'] = _CountingValueIndex('value')
+        conn.root.cat = cat
+        conn.root.contents = contents = PersistentList()
+        for uid in range(10):
+            content = ValuedContent(uid % 4)
+            contents.append(content)
+            cat.index_doc(uid, content)
+        self.tm.commit()
+        self.applied = _CountingValueIndex.applied
+        del self.applied[:]
+
+    def test_cached(self):
+        cat = self.cat
+        result = cat.apply(self.query)
+        assert_that(list(result), is_([1, 2, 5, 6, 9]))
+        assert_that(self.applied, is_(['value']))
+        # Changing what we get back doesn't change the cache.
+        result.remove(1)
+
+        result = cat.apply(self.query)
+        assert_that(list(result), is_([1, 2, 5, 6, 9]))
+        assert_that(self.applied, is_(['value']))
+        assert_that(cat._v_query_cache.hits, is_(1))
+
+        # The order of indexes doesn't matter.
+        cat.apply({'value': {'any_of': (1, 2)}, 'other': {'any_of': (1,)}})
+        cat.apply({'other': {'any_of': (1,)}, 'value': {'any_of': (1, 2)}})
+        assert_that(self.applied, is_(['value', 'other', 'value']))
+        assert_that(cat._v_query_cache, has_length(2))
+
+        # Lists and tuples are different.
+        cat.apply({'value': {'any_of': [1, 2]}})
+        assert_that(cat._v_query_cache, has_length(3))
+
+    def test_changed_in_transaction(self):
+        cat = self.cat
+        cat.apply(self.query)
+        cat.index_doc(10, ValuedContent(1))
+        assert_that(list(cat.apply(self.query)), is_([1, 2, 5, 6, 9, 10]))
+        assert_that(list(cat.apply(self.query)), is_([1, 2, 5, 6, 9, 10]))
+        assert_that(self.applied, is_(['value'] * 3))
+        assert_that(cat._v_query_cache, has_length(1))
+
+        self.tm.abort()
+        assert_that(list(cat.apply(self.query)), is_([1, 2, 5, 6, 9]))
+        assert_that(self.applied, is_(['value'] * 3))
+
+    def test_changed_elsewhere(self):
+        import transaction
+        cat = self.cat
+        cat.apply(self.query)
+
+        tm = transaction.TransactionManager()
+        conn = self.db.open(tm)
+        conn.root.cat.unindex_doc(1)
+        tm.commit()
+        conn.close()
+
+        self.tm.begin()
+        assert_that(list(cat.apply(self.query)), is_([2, 5, 6, 9]))
+        assert_that(self.applied, is_(['value'] * 2))
+        cat.apply(self.query)
+        assert_that(self.applied, is_(['value'] * 2))
+
+    def test_uncacheable(self):
+        from zc.catalog.extentcatalog import Extent
+        extent = Extent(family)
+        cat = self.cat
+        for _ in range(2):
+            cat.apply({'value': {'any': extent}})
+        assert_that(self.applied, is_(['value'] * 2))
+        assert_that(cat._v_query_cache.misses, is_(0))
+
+    def test_invalidate(self):
+        cat = self.cat
+        counters = cat._query_cache_counters
+
+        def versions():
+            return [counters[name].value for name in ('other', 'value')]
+        assert_that(versions(), is_([10, 10]))
+        cat.index_docs([(11, ValuedContent(1))])
+        cat.unindex_docs([11])
+        cat.unindex_doc(11)
+        assert_that(versions(), is_([13, 13]))
+        cat.updateIndex(cat['value'])
+        cat._mergeIndexValues({'other': []})
+        assert_that(versions(), is_([14, 14]))
+        cat.clear()
+        del cat['other']
+        assert_that(versions(), is_([16, 15]))
+
+    def test_weighted_without_database(self):
+        from nti.zope_catalog.index import AttributeSetIndex
+        cat = CachingCatalog()
+        cat['set'] = AttributeSetIndex('tags')
+        content = ValuedContent(1)
+        content.tags = (1, 2)
+        # Changing the index directly isn't noticed.
+        cat['set'].index_doc(1, content)
+        query = {'set': {'any_of': {1, 2}}}
+        result = cat.apply(query)
+        assert_that(dict(result), is_({1: 2.0}))
+        assert_that(dict(cat.apply(query)), is_({1: 2.0}))
+        assert_that(cat._v_query_cache.hits, is_(1))
+
+    def test_disabled(self):
+        cat = Catalog()
+        cat['value'] = _CountingValueIndex('value')
+        cat.index_doc(1, ValuedContent(1))
+        cat.apply(self.query)
+        cat.apply(self.query)
+        assert_that(self.applied, is_(['value'] * 2))
+        assert_that(cat._query_cache_counters, is_(none()))
+        assert_that(getattr(cat, '_v_query_cache', None), is_(none()))
+
+
+class _PrefetchingDBMixin(object):
+    # pylint:disable=no-member
+
+    def _makeStorage(self, name):
+        import threading
+        from ZODB.MappingStorage import MappingStorage
+
+        class PrefetchingStorage(MappingStorage):
+            def __init__(self, name):
+                MappingStorage.__init__(self, name)
+                self.prefetched = []
+
+            def prefetch(self, oids, _tid):
+                self.prefetched.append((threading.current_thread().name,
+                                        sorted(oids)))
+
+        return PrefetchingStorage(name)
+
+    def _makeDB(self, count, database_name='unnamed', databases=None):
+        from ZODB.DB import DB
+        import transaction
+        db = DB(self._makeStorage(database_name),
+                database_name=database_name, databases=databases)
+        self.addCleanup(db.close)
+        transaction_manager = transaction.TransactionManager()
+        conn = db.open(transaction_manager=transaction_manager)
+        conn.root.objs = objs = PersistentList(PersistentContent() for _ in range(count))
+        transaction_manager.commit()
+        oids = [obj._p_oid for obj in objs]
+        conn.close()
+        return db, oids
+
+    def _open(self, db):
+        import transaction
+        transaction_manager = transaction.TransactionManager()
+        conn = db.open(transaction_manager=transaction_manager)
+        self.addCleanup(conn.close)
+        self.addCleanup(transaction_manager.abort)
+        return conn
+
+
 class TestResultSet(unittest.TestCase):
 
     def test_len(self):
         r = ResultSet((1,), None)
         assert_that(r, has_length(1))
+        # Without looking up any objects
+        assert_that(r.count(), is_(1))
 
     def test_iter(self):
         class UIDS(object):
@@ -243,6 +1431,95 @@ class TestResultSet(unittest.TestCase):
 
         assert_that(w, has_length(1))
 
+    class UIDS(object):
+        def getObject(self, uid):
+            return 'obj%d' % uid
+
+    def _check_slicing(self, uids):
+        r = ResultSet(uids, self.UIDS())
+        assert_that(r[0], is_('obj0'))
+        assert_that(r[-1], is_('obj9'))
+        with self.assertRaises(IndexError):
+            r[10] # pylint:disable=pointless-statement
+
+        page = r[2:5]
+        assert_that(page, is_(ResultSet))
+        assert_that(page, has_length(3))
+        assert_that(list(page), is_(['obj2', 'obj3', 'obj4']))
+        assert_that(list(r[::4]), is_(['obj0', 'obj4', 'obj8']))
+        assert_that(list(r[-2:]), is_(['obj8', 'obj9']))
+        assert_that(list(r.page(8)), is_(['obj8', 'obj9']))
+        assert_that(list(r.page(3, 2)), is_(['obj3', 'obj4']))
+        assert_that(list(r.page(20, 2)), is_([]))
+
+    def test_slicing(self):
+        self._check_slicing(list(range(10)))
+        self._check_slicing(range(10))
+        self._check_slicing(family.IF.Set(range(10)))
+        self._check_slicing(family.IF.TreeSet(range(10)))
+        self._check_slicing(family.IF.Bucket([(i, 1.0) for i in range(10)]))
+        self._check_slicing(collections.deque(range(10)))
+
+    def test_slice_keeps_ignore_invalid(self):
+        import warnings
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            r = ResultSet((1, 2), self.UIDS(), True)
+            page = r[1:]
+        assert_that(w, has_length(1))
+        assert_that(page.ignore_invalid, is_(True))
+
+
+class TestResultSetPrefetch(_PrefetchingDBMixin, unittest.TestCase):
+
+    def test_prefetches_in_chunks(self):
+        db, oids = self._makeDB(10)
+        conn = self._open(db)
+        objs = conn.root.objs
+        conn.cacheMinimize()
+
+        class UIDS(object):
+            def getObject(self, uid):
+                return objs[uid]
+
+        r = ResultSet(range(10), UIDS())
+        r.PREFETCH_CHUNK_SIZE = 4
+        assert_that(list(r), is_(list(objs)))
+        assert_that([prefetched for _, prefetched in db.storage.prefetched],
+                    is_([sorted(oids[:4]), sorted(oids[4:8]), sorted(oids[8:])]))
+
+        # Only the page is prefetched
+        del db.storage.prefetched[:]
+        page = r.page(5, 3)
+        assert_that(list(page), is_(objs[5:8]))
+        assert_that([prefetched for _, prefetched in db.storage.prefetched],
+                    is_([sorted(oids[5:8])]))
+
+    def test_ignore_invalid_checks_after_prefetch(self):
+        import warnings
+        db, _ = self._makeDB(10)
+        conn = self._open(db)
+        objs = conn.root.objs
+        conn.cacheMinimize()
+
+        class UIDS(object):
+            def queryObject(self, uid):
+                return objs[uid] if uid != 3 else None
+
+        statuses = []
+        db.storage.prefetch = lambda oids, tid: statuses.append(
+            sorted({objs[i]._p_status for i in range(10)}))
+        with warnings.catch_warnings(record=True):
+            r = ResultSet(range(10), UIDS(), True)
+        r.PREFETCH_CHUNK_SIZE = 4
+        assert_that(r.count(), is_(9))
+        assert_that(r, has_length(10))
+        # Nothing was loaded (to check it) before its chunk was prefetched.
+        assert_that(statuses, is_([['ghost'], ['ghost', 'saved'], ['ghost', 'saved']]))
+        assert_that([obj._p_status for obj in objs],
+                    is_(['saved'] * 3 + ['ghost'] + ['saved'] * 6))
+
+
 class TestConfigure(unittest.TestCase):
 
     layer = NTIZopeCatalogLayer
@@ -323,3 +1600,144 @@ class TestCatalogPrefetchIterator(unittest.TestCase):
         assert_that(jar1.prefetched, is_(({1,},)))
         assert_that(jar2.prefetched, is_(({2, 5},)))
         assert_that(jar3.prefetched, is_(({3, 4, 5},)))
+
+
+class TestCatalogPrefetchIteratorReadAhead(_PrefetchingDBMixin, unittest.TestCase):
+
+    def _makeOne(self, iterable, chunk_size):
+        from ..catalog import CatalogPrefetchIterator
+        return CatalogPrefetchIterator(iterable, chunk_size, read_ahead=True)
+
+    def test_read_ahead(self):
+        db, oids = self._makeDB(10)
+        conn = self._open(db)
+        objs = conn.root.objs
+        inst = self._makeOne(enumerate(objs), 3)
+        read_ahead = inst._read_ahead
+
+        result = [obj for _, obj in inst]
+        assert_that(result, is_(list(objs)))
+
+        read_ahead._executor.shutdown(wait=True)
+        assert_that(read_ahead._conn, is_(none()))
+        prefetched = db.storage.prefetched
+        assert_that([oids for _, oids in prefetched],
+                    is_([sorted(oids[i:i + 3]) for i in range(0, 10, 3)]))
+        assert_that({thread for thread, _ in prefetched},
+                    is_({'CatalogPrefetchIterator_0'}))
+
+        # Already exhausted
+        assert_that(list(inst), is_([]))
+
+    def test_read_ahead_multidb(self):
+        databases = {}
+        db1, oids1 = self._makeDB(2, 'db1', databases)
+        db2, oids2 = self._makeDB(2, 'db2', databases)
+        conn = self._open(db1)
+        objs = list(conn.root.objs) + list(conn.get_connection('db2').root.objs)
+
+        result = [obj for _, obj in self._makeOne(enumerate(objs), 10)]
+        assert_that(result, is_(objs))
+        assert_that([oids for _, oids in db1.storage.prefetched],
+                    is_([sorted(oids1)]))
+        assert_that([oids for _, oids in db2.storage.prefetched],
+                    is_([sorted(oids2)]))
+
+    def test_abandoned(self):
+        import gc
+        db, _ = self._makeDB(10)
+        conn = self._open(db)
+        inst = self._makeOne(enumerate(conn.root.objs), 3)
+        next(inst)
+        read_ahead = inst._read_ahead
+        # Let the background thread finish with it.
+        read_ahead.submit(lambda: None).result()
+        assert_that(read_ahead._executor._shutdown, is_(False))
+
+        del inst
+        gc.collect()
+        read_ahead._executor.shutdown(wait=True)
+        assert_that(read_ahead._conn, is_(none()))
+
+    def test_catalog(self):
+        cat = MockCatalog()
+        cat.PREFETCH_READ_AHEAD = True
+        locs = list(cat._visitSublocations())
+        assert_that(locs, has_length(1))
+
+
+class TestAdaptiveChunkSizer(unittest.TestCase):
+
+    def _makeOne(self, *args, **kwargs):
+        from ..catalog import AdaptiveChunkSizer
+        return AdaptiveChunkSizer(*args, **kwargs)
+
+    def test_bounds(self):
+        sizer = self._makeOne(1, minimum=10, maximum=100)
+        assert_that(sizer.size, is_(10))
+        assert_that(self._makeOne(1000, maximum=100).size, is_(100))
+
+    def test_grows_and_shrinks_gradually(self):
+        sizer = self._makeOne(100, target_seconds=1.0)
+        # Far too fast: only doubles
+        assert_that(sizer.next_size(100, 0.001, 0.001, 0), is_(200))
+        # No measurable time
+        assert_that(sizer.next_size(200, 0, 0, 0), is_(400))
+        # Far too slow: only halves
+        assert_that(sizer.next_size(400, 10, 10, 0), is_(200))
+        # About right: 200 in 2/3 second -> 300 in a second.
+        assert_that(sizer.next_size(200, 0.3333, 0.3333, 0), is_(300))
+        # Nothing to go on
+        assert_that(sizer.next_size(0, 0, 0, 0), is_(300))
+        assert_that(sizer.sizes, is_([100, 200, 400, 200, 300, 300]))
+
+    def test_limits_bytes(self):
+        sizer = self._makeOne(100, target_seconds=1.0, max_bytes=1000)
+        # 15 bytes per object, so about 66 fit
+        assert_that(sizer.next_size(100, 0.01, 0.01, 1500), is_(66))
+
+
+class TestCatalogPrefetchIteratorAdaptive(unittest.TestCase):
+
+    class Obj(object):
+        _p_estimated_size = 100
+
+    def _makeOne(self, iterable, chunk_sizer, read_ahead=False):
+        from ..catalog import CatalogPrefetchIterator
+        return CatalogPrefetchIterator(iterable, 0, read_ahead, chunk_sizer)
+
+    def _check(self, read_ahead):
+        from ..catalog import AdaptiveChunkSizer
+        sizer = AdaptiveChunkSizer(2, minimum=1, maximum=8)
+        items = [(i, i) for i in range(50)]
+        assert_that(list(self._makeOne(items, sizer, read_ahead)), is_(items))
+        # Chunks of 2, 4, 8, ... (with read ahead, each size
+        # applies one chunk later)
+        assert_that(sizer.sizes[:3], is_([2, 4, 8]))
+        assert_that(max(sizer.sizes), is_(8))
+
+        sizer = AdaptiveChunkSizer(8, max_bytes=400, minimum=1)
+        items = [(i, self.Obj()) for i in range(50)]
+        assert_that(list(self._makeOne(items, sizer, read_ahead)), is_(items))
+        assert_that(sizer.sizes[:3], is_([8, 4, 4]))
+
+    def test_adaptive(self):
+        self._check(False)
+
+    def test_adaptive_read_ahead(self):
+        self._check(True)
+
+    def test_catalog(self):
+        import functools
+        from ..catalog import AdaptiveChunkSizer
+        sizers = []
+        def factory(size):
+            sizer = AdaptiveChunkSizer(size, minimum=1)
+            sizers.append(sizer)
+            return sizer
+        cat = MockCatalog()
+        cat.PREFETCH_CHUNK_SIZE = 1
+        cat.PREFETCH_CHUNK_SIZER = functools.partial(factory)
+        locs = list(cat._visitSublocations())
+        assert_that(locs, has_length(1))
+        assert_that(sizers[0].sizes, is_([1, 2]))
@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from hamcrest import assert_that
+from hamcrest import calling
+from hamcrest import contains_inanyorder
+from hamcrest import has_length
+from hamcrest import is_
+from hamcrest import less_than
+from hamcrest import none
+from hamcrest import raises
+
+from nti.testing.matchers import verifiably_provides
+
+from persistent import Persistent
+import transaction
+from ZODB.DB import DB
+from ZODB.FileStorage import FileStorage
+from ZODB.POSException import ConflictError
+from zope import component
+from zope import interface
+from zope.event import notify
+from zope.intid.interfaces import IIntIds
+from zope.intid.interfaces import IntIdAddedEvent
+from zope.intid.interfaces import IntIdRemovedEvent
+from zope.lifecycleevent import ObjectModifiedEvent
+
+from nti.zope_catalog.catalog import DeferredCatalog
+from nti.zope_catalog.deferred import ADDED
+from nti.zope_catalog.deferred import MODIFIED
+from nti.zope_catalog.deferred import REMOVED
+from nti.zope_catalog.deferred import IndexingQueue
+from nti.zope_catalog.deferred import process_queue
+from nti.zope_catalog.index import AttributeValueIndex
+from nti.zope_catalog.interfaces import IDeferredCatalog
+from nti.zope_catalog.interfaces import IDeferredIndexingQueue
+from nti.zope_catalog.interfaces import INoAutoIndexEver
+
+from . import NTIZopeCatalogDeferredLayer
+from . import NTIZopeCatalogLayer
+
+__docformat__ = "restructuredtext en"
+
+# pylint:disable=protected-access
+
+
+class Content(Persistent):
+
+    def __init__(self, value):
+        self.value = value
+
+
+@interface.implementer(INoAutoIndexEver)
+class NoIndexContent(Content):
+    pass
+
+
+@interface.implementer(IIntIds)
+class MappingIntIds(object):
+
+    def __init__(self):
+        self.objects = {}
+
+    def queryId(self, obj):
+        for uid, o in self.objects.items():
+            if o is obj:
+                return uid
+        return None
+
+    def queryObject(self, uid):
+        return self.objects.get(uid)
+
+
+class TestIndexingQueue(unittest.TestCase):
+
+    def test_provides(self):
+        assert_that(IndexingQueue(), verifiably_provides(IDeferredIndexingQueue))
+
+    def test_put_and_pull(self):
+        queue = IndexingQueue(buckets=4)
+        queue.put(1, ADDED)
+        queue.put(2, MODIFIED)
+        queue.put(5, REMOVED)
+        assert_that(queue, has_length(3))
+
+        entries = queue.pull()
+        assert_that(entries, contains_inanyorder(
+            (1, ADDED), (2, MODIFIED), (5, REMOVED)))
+        assert_that(queue, has_length(0))
+        assert_that(queue.pull(), is_([]))
+
+    def test_pull_limit(self):
+        queue = IndexingQueue(buckets=2)
+        for docid in range(10):
+            queue.put(docid, ADDED)
+        queue.put(0, MODIFIED)
+
+        assert_that(queue.pull(1), is_([(0, ADDED)]))
+        assert_that(queue, has_length(9))
+        # The next pull starts in the other bucket.
+        assert_that(queue.pull(1), is_([(1, ADDED)]))
+        assert_that(queue.pull(100), has_length(8))
+
+    def test_coalesce(self):
+        queue = IndexingQueue(buckets=1)
+        for _ in range(10):
+            queue.put(1, MODIFIED)
+        queue.put(2, ADDED)
+        queue.put(2, MODIFIED)
+        queue.put(3, MODIFIED)
+        queue.put(3, REMOVED)
+        queue.put(4, REMOVED)
+        queue.put(4, ADDED)
+        # Cancelled, but the removal is kept.
+        queue.put(5, ADDED)
+        queue.put(5, REMOVED)
+        assert_that(queue, has_length(5))
+        assert_that(queue.pull(), is_([(1, MODIFIED), (2, ADDED), (3, REMOVED),
+                                       (4, MODIFIED), (5, REMOVED)]))
+
+        # When a conflict leaves several entries, they are coalesced
+        # when pulled.
+        queue._buckets[0].update({1: ((1, ADDED), (2, MODIFIED), (3, REMOVED)),
+                                  2: ((1, ADDED), (2, MODIFIED))})
+        assert_that(queue, has_length(5))
+        assert_that(queue.pull(), is_([(2, ADDED)]))
+
+    def test_resolve_conflict(self):
+        old = (1, ((1, ADDED),), 2, ((2, ADDED),), 5, ((5, ADDED),))
+        # A worker pulled docid 1 and 2...
+        committed = (5, ((5, ADDED),))
+        # ...while another transaction modified 2 and added 3.
+        new = (1, ((1, ADDED),),
+               2, ((2, ADDED), (4, MODIFIED)),
+               3, ((3, ADDED),),
+               5, ((5, ADDED),))
+        expected = (2, ((4, MODIFIED),), 3, ((3, ADDED),), 5, ((5, ADDED),))
+
+        tree = IndexingQueue(buckets=1)._buckets[0]
+        for docid in range(200):
+            tree[docid] = ()
+        bucket = tree._firstbucket
+        assert_that(bucket._p_resolveConflict((old, 'next'), (committed, 'next'),
+                                              (new, 'next')),
+                    is_((expected, 'next')))
+        assert_that(bucket._p_resolveConflict((old,), (committed,), (new,)),
+                    is_((expected,)))
+        # Split...
+        assert_that(calling(bucket._p_resolveConflict).with_args(
+            (old,), (committed, 'next'), (new,)),
+                    raises(ConflictError, 'split'))
+        # ...or emptied, on either side or in total.
+        assert_that(calling(bucket._p_resolveConflict).with_args(
+            (old,), ((),), (new,)),
+                    raises(ConflictError, 'emptied'))
+        assert_that(calling(bucket._p_resolveConflict).with_args(
+            (old,), (old[:2],), (old[2:],)),
+                    raises(ConflictError, 'emptied'))
+
+        # A small tree holds its bucket itself.
+        def small(items):
+            return (((items,),),)
+        assert_that(tree._p_resolveConflict(small(old), small(committed), small(new)),
+                    is_(small(expected)))
+        assert_that(tree._p_resolveConflict(None, small(committed), None),
+                    is_(small(committed)))
+        assert_that(tree._p_resolveConflict(small(old), small(old[:2]), small(old[2:])),
+                    is_(none()))
+        assert_that(calling(tree._p_resolveConflict).with_args(
+            small(old), (bucket, 5, bucket), small(new)),
+                    raises(ConflictError, 'split'))
+
+
+class TestConcurrentQueue(unittest.TestCase):
+
+    def setUp(self):
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        self.db = DB(FileStorage(os.path.join(tempdir, 'Data.fs')))
+        self.addCleanup(self.db.close)
+        tm = transaction.TransactionManager()
+        conn = self.db.open(tm)
+        conn.root.queue = IndexingQueue(buckets=1)
+        tm.commit()
+        conn.close()
+
+    def _open(self):
+        tm = transaction.TransactionManager()
+        conn = self.db.open(tm)
+        self.addCleanup(conn.close)
+        self.addCleanup(tm.abort)
+        return tm, conn.root.queue
+
+    def test_concurrent_put_and_pull(self):
+        tm1, queue1 = self._open()
+        tm2, queue2 = self._open()
+        tm3, queue3 = self._open()
+        queue1.put(1, ADDED)
+        tm1.commit()
+
+        tm2.begin()
+        tm3.begin()
+        assert_that(queue2.pull(), is_([(1, ADDED)]))
+        queue3.put(1, MODIFIED)
+        queue3.put(2, ADDED)
+        tm2.commit()
+        tm3.commit()
+
+        tm1.begin()
+        # The worker may have indexed docid 1 before the modification,
+        # so it remains queued.
+        assert_that(queue1.pull(), contains_inanyorder((1, ADDED), (2, ADDED)))
+
+    def test_concurrent_put_and_pull_large(self):
+        tm1, queue1 = self._open()
+        tm2, queue2 = self._open()
+        tm3, queue3 = self._open()
+        for docid in range(1000):
+            queue1.put(docid, ADDED)
+        tm1.commit()
+
+        tm2.begin()
+        tm3.begin()
+        assert_that(queue2.pull(10), has_length(10))
+        queue3.put(5, MODIFIED)
+        # Only the bucket holding the docid is written.
+        changed = queue3._p_jar._registered_objects
+        assert_that(changed, has_length(1))
+        assert_that(len(changed[0]), is_(less_than(100)))
+        tm2.commit()
+        tm3.commit()
+
+        tm1.begin()
+        # The worker pulled docid 5, but not the modification.
+        assert_that(queue1, has_length(991))
+        assert_that(queue1.pull(1), is_([(5, ADDED)]))
+
+
+class TestSubscribers(unittest.TestCase):
+
+    layer = NTIZopeCatalogDeferredLayer
+
+    def setUp(self):
+        gsm = component.getGlobalSiteManager()
+        self.intids = MappingIntIds()
+        gsm.registerUtility(self.intids, IIntIds)
+        self.addCleanup(gsm.unregisterUtility, self.intids, IIntIds)
+        self.queue = IndexingQueue(buckets=1)
+        gsm.registerUtility(self.queue, IDeferredIndexingQueue)
+        self.addCleanup(gsm.unregisterUtility, self.queue, IDeferredIndexingQueue)
+
+    def test_events_queue_entries(self):
+        content = Content(1)
+        self.intids.objects[1] = content
+        notify(IntIdAddedEvent(content, None))
+        notify(ObjectModifiedEvent(content))
+        notify(IntIdRemovedEvent(content, None))
+        # Not registered, not queued.
+        notify(ObjectModifiedEvent(Content(2)))
+        assert_that(self.queue.pull(),
+                    is_([(1, REMOVED)]))
+
+    def test_no_auto_index(self):
+        content = NoIndexContent(1)
+        self.intids.objects[1] = content
+        notify(IntIdAddedEvent(content, None))
+        notify(ObjectModifiedEvent(content))
+        assert_that(self.queue, has_length(0))
+
+    def test_no_intids(self):
+        gsm = component.getGlobalSiteManager()
+        gsm.unregisterUtility(self.intids, IIntIds)
+        notify(IntIdAddedEvent(Content(1), None))
+        assert_that(self.queue, has_length(0))
+
+    def test_no_queue(self):
+        gsm = component.getGlobalSiteManager()
+        gsm.unregisterUtility(self.queue, IDeferredIndexingQueue)
+        notify(IntIdAddedEvent(Content(1), None))
+        assert_that(self.queue, has_length(0))
+
+
+class TestSubscribersNotConfigured(TestSubscribers):
+
+    # Only deferred.zcml registers them.
+    layer = NTIZopeCatalogLayer
+
+    def test_events_queue_entries(self):
+        content = Content(1)
+        self.intids.objects[1] = content
+        notify(IntIdAddedEvent(content, None))
+        assert_that(self.queue, has_length(0))
+
+
+class TestProcessQueue(unittest.TestCase):
+
+    layer = NTIZopeCatalogLayer
+
+    def setUp(self):
+        self.db = DB(None)
+        self.addCleanup(self.db.close)
+        self.tm = transaction.TransactionManager()
+        conn = self.db.open(self.tm)
+        self.addCleanup(conn.close)
+        self.addCleanup(self.tm.abort)
+
+        root = conn.root
+        root.queue = self.queue = IndexingQueue(buckets=4)
+        root.catalog = self.catalog = DeferredCatalog()
+        self.catalog['value'] = AttributeValueIndex('value')
+        root.contents = self.contents = {i: Content(i * 10) for i in range(10)}
+        self.intids = MappingIntIds()
+        self.intids.objects.update(self.contents)
+        self.tm.commit()
+
+        gsm = component.getGlobalSiteManager()
+        for utility, provided in ((self.intids, IIntIds),
+                                  (self.queue, IDeferredIndexingQueue),
+                                  (self.catalog, IDeferredCatalog)):
+            gsm.registerUtility(utility, provided)
+            self.addCleanup(gsm.unregisterUtility, utility, provided)
+
+    def _values(self):
+        return dict(self.catalog['value'].documents_to_values.items())
+
+    def test_process(self):
+        for docid in range(10):
+            self.queue.put(docid, ADDED)
+        self.tm.commit()
+
+        assert_that(process_queue(batch_size=3, max_batches=2), is_(6))
+        assert_that(self.queue, has_length(4))
+        assert_that(self._values(), has_length(6))
+        assert_that(process_queue(), is_(4))
+
+        # Many changes, one reindex.
+        for value in range(30, 34):
+            self.contents[3].value = value
+            self.queue.put(3, MODIFIED)
+        del self.intids.objects[4]
+        self.queue.put(4, REMOVED)
+        # Removed before the worker got to it.
+        self.queue.put(5, MODIFIED)
+        del self.intids.objects[5]
+        assert_that(process_queue(), is_(3))
+        assert_that(self.queue, has_length(0))
+        values = self._values()
+        assert_that(values, has_length(8))
+        assert_that(values[3], is_(33))
+        assert_that(process_queue(), is_(0))
+
+    def test_conflicts_retried(self):
+        for docid in range(3):
+            self.queue.put(docid, ADDED)
+        self.tm.commit()
+
+        class TM(object):
+            conflicts = 2
+            aborted = 0
+
+            def commit(self):
+                if self.conflicts:
+                    self.conflicts -= 1
+                    raise ConflictError()
+                transaction_manager.commit()
+
+            def abort(self):
+                self.aborted += 1
+                transaction_manager.abort()
+
+        transaction_manager = self.tm
+        tm = TM()
+        assert_that(process_queue(transaction_manager=tm), is_(3))
+        assert_that(tm.aborted, is_(2))
+
+        self.queue.put(1, MODIFIED)
+        self.tm.commit()
+        tm.conflicts = 10
+        with self.assertRaises(ConflictError):
+            process_queue(transaction_manager=tm, max_conflict_retries=1)
+        assert_that(self.queue, has_length(1))
+
+    def test_default_transaction_manager(self):
+        queue = IndexingQueue(buckets=1)
+        queue.put(1, ADDED)
+        assert_that(process_queue(queue, catalogs=[self.catalog],
+                                  intids=self.intids),
+                    is_(1))
+        transaction.abort()
@@ -17,10 +17,14 @@ from hamcrest import has_key
 from hamcrest import has_length
 from hamcrest import has_property
 from hamcrest import is_
-
+from hamcrest import is_not
+from hamcrest import less_than
 from hamcrest import none
+from hamcrest import not_none
 from hamcrest import raises
 
+from zope.interface import Interface
+
 from nti.zope_catalog.index import AttributeTextIndex
 from nti.zope_catalog.index import CaseInsensitiveAttributeFieldIndex
 from nti.zope_catalog.index import IntegerAttributeIndex
@@ -28,6 +32,7 @@ from nti.zope_catalog.index import IntegerValueIndex
 from nti.zope_catalog.index import NormalizingFieldIndex
 from nti.zope_catalog.index import NormalizingKeywordIndex
 from nti.zope_catalog.index import SetIndex
+from nti.zope_catalog.index import ShardedIntegerValueIndex
 from nti.zope_catalog.index import ValueIndex
 from nti.zope_catalog.index import stemmer_lexicon
 
@@ -103,6 +108,32 @@ class TestSetIndex(unittest.TestCase):
         assert_that(list(self.index.zip((1,))),
                     is_([(1, {'FOO'})]))
 
+    def test_index_iterables(self):
+        index = self.index
+        index.index_doc(1, (x for x in 'ab'))
+        index.index_doc(2, iter(['b', 'c']))
+        assert_that(list(index.documents_to_values[1]), is_(['a', 'b']))
+        assert_that(list(index.apply({'any_of': ('b',)})), is_([1, 2]))
+        # Unchanged, and then changed.
+        index.index_doc(1, iter('ba'))
+        index.index_doc(2, (x for x in 'cd'))
+        assert_that(list(index.apply({'any_of': ('b',)})), is_([1]))
+        assert_that(list(index.documents_to_values[2]), is_(['c', 'd']))
+        index.index_doc(2, iter(()))
+        assert_that(list(index.ids()), is_([1]))
+
+    def test_attribute_index_iterables(self):
+        from nti.zope_catalog.index import AttributeSetIndex
+        index = AttributeSetIndex('field')
+        index.index_doc(1, Doc(x for x in 'ab'))
+        assert_that(list(index.documents_to_values[1]), is_(['a', 'b']))
+        index.index_doc(1, Doc(None))
+        assert_that(list(index.ids()), is_([]))
+
+        index = AttributeSetIndex('field', interface=IOtherDoc)
+        index.index_doc(1, Doc('ab'))
+        assert_that(list(index.ids()), is_([]))
+
 class TestIntegerValueIndex(unittest.TestCase):
 
     def setUp(self):
@@ -145,6 +176,19 @@ class TestNormalizingKeywordIndex(unittest.TestCase):
         assert_that(words,
                     is_(['aizen', 'ichigo', 'kuchiki', 'rukia']))
 
+    def test_index_iterables(self):
+        index = self.index
+        index.index_doc(1, (x for x in ('Aizen', 'ichigo')))
+        index.index_doc(2, iter(['Ichigo']))
+        assert_that(index.documentCount(), is_(2))
+        assert_that(sorted(index.words()), is_(['aizen', 'ichigo']))
+        assert_that(list(index.apply({'query': 'ichigo'})), is_([1, 2]))
+        # Unchanged, and then changed.
+        index.index_doc(1, iter(['ICHIGO', 'aizen']))
+        index.index_doc(2, (x for x in ('rukia',)))
+        assert_that(list(index.apply({'query': 'ichigo'})), is_([1]))
+        assert_that(list(index.apply({'query': 'rukia'})), is_([2]))
+
     def test_remove_words(self):
         index = self.index
         index.index_doc(1, ('aizen',))
@@ -244,6 +288,9 @@ class TestNormalizingKeywordIndex(unittest.TestCase):
         res = index.apply({'between': ('r', 'z')})
         assert_that(res, has_length(1))
 
+        res = index.apply({'between': ('x', 'z')})
+        assert_that(list(res), is_([]))
+
         res = index.apply(['rukia'])
         assert_that(res, has_length(0))
 
@@ -341,3 +388,1120 @@ class TestAttributeTextIndex(unittest.TestCase):
         assert_that(index.documentCount(), is_(1))
         # This used to contain tests that the zopyx.txng3.ext stemmer
         # was being used. That isn't supported any more.
+
+
+class IOtherDoc(Interface):
+    "Not provided by Doc."
+
+
+class Doc(object):
+
+    def __init__(self, field):
+        self.field = field
+
+
+class _AbstractBatchTest(object):
+    # pylint:disable=no-member
+
+    def _makeOne(self):
+        raise NotImplementedError
+
+    def _value(self, i):
+        raise NotImplementedError
+
+    def _wrap(self, value):
+        return value
+
+    #: The value that causes a document to be unindexed.
+    _unindexed = None
+
+    def _state(self, index):
+        fwd = {k: list(v) for k, v in index._fwd_index.items()}
+        rev = {k: (list(v) if hasattr(v, 'keys') else v)
+               for k, v in index._rev_index.items()}
+        return fwd, rev, index.documentCount(), index.wordCount()
+
+    def _check(self, batches):
+        one_at_a_time = self._makeOne()
+        batched = self._makeOne()
+        for batch in batches:
+            if isinstance(batch, tuple):
+                # docids to unindex
+                for docid in batch:
+                    one_at_a_time.unindex_doc(docid)
+                batched.unindex_docs(batch)
+            else:
+                for docid, value in batch:
+                    one_at_a_time.index_doc(docid, self._wrap(value))
+                batched.index_docs([(docid, self._wrap(value))
+                                    for docid, value in batch])
+            assert_that(self._state(batched),
+                        is_(self._state(one_at_a_time)))
+        return batched
+
+    def test_batch_matches_single(self):
+        value = self._value
+        self._check([
+            [(i, value(i % 5)) for i in range(20, 0, -1)],
+            # Change some, leave some alone, repeat a docid.
+            [(i, value(i % 3)) for i in range(10)] + [(3, value(4))],
+            (1, 2, 3, 99),
+            [(i, value(i % 7)) for i in range(30)],
+        ])
+
+    def test_batch_unindexes(self):
+        index = self._check([
+            [(i, self._value(i)) for i in range(5)],
+            [(1, None), (2, None)],
+        ])
+        assert_that(index.documentCount(), is_(3))
+
+    def test_bulk_load_matches_single(self):
+        from BTrees.check import check
+        from nti.zope_catalog.index import _BulkLoader
+        # Force spilling to disk
+        self.addCleanup(setattr, _BulkLoader, 'MAX_IN_MEMORY',
+                        _BulkLoader.MAX_IN_MEMORY)
+        _BulkLoader.MAX_IN_MEMORY = 100
+
+        value = self._value
+        batches = [
+            [(i, value(i % 37)) for i in range(1000, 0, -1)],
+            # A later value wins; so does unindexing.
+            [(3, value(40)), (5, self._unindexed), (7, self._unindexed)],
+            [(7, value(41))],
+        ]
+        one_at_a_time = self._makeOne()
+        for batch in batches:
+            for docid, v in batch:
+                one_at_a_time.index_doc(docid, self._wrap(v))
+
+        bulk = self._makeOne()
+        loader = bulk.bulk_loader()
+        for batch in batches:
+            loader.add([(docid, self._wrap(v)) for docid, v in batch])
+        assert_that(bulk.documentCount(), is_(0))
+        loader.finish()
+        assert_that(self._state(bulk), is_(self._state(one_at_a_time)))
+        check(bulk._fwd_index)
+        check(bulk._rev_index)
+
+        # The buckets are full, so there are fewer of them.
+        assert_that(len(bulk._rev_index.__getstate__()[0]),
+                    is_(less_than(len(one_at_a_time._rev_index.__getstate__()[0]))))
+
+        # Now it's not empty, so it updates normally.
+        assert_that(bulk.bulk_loader(), is_(none()))
+        assert_that(calling(bulk.bulk_load).with_args([]),
+                    raises(ValueError))
+        batch = [(i, value(i % 5)) for i in range(990, 1010)]
+        for docid, v in batch:
+            one_at_a_time.index_doc(docid, self._wrap(v))
+        bulk.index_docs([(docid, self._wrap(v)) for docid, v in batch])
+        assert_that(self._state(bulk), is_(self._state(one_at_a_time)))
+
+    def test_bulk_load_nothing(self):
+        index = self._makeOne()
+        index.bulk_load([])
+        assert_that(index.documentCount(), is_(0))
+        assert_that(index.bulk_loader(), is_(not_none()))
+
+    def test_bulk_load_in_memory(self):
+        one_at_a_time = self._makeOne()
+        batch = [(i, self._value(i % 3)) for i in range(200, 0, -1)]
+        # Field indexes store None
+        batch.append((201, self._unindexed))
+        for docid, value in batch:
+            one_at_a_time.index_doc(docid, self._wrap(value))
+        bulk = self._makeOne()
+        bulk.bulk_load([(docid, self._wrap(value)) for docid, value in batch])
+        assert_that(self._state(bulk), is_(self._state(one_at_a_time)))
+
+
+class TestNormalizingFieldIndexBatch(_AbstractBatchTest, unittest.TestCase):
+
+    def _makeOne(self):
+        class _NormalizingIndex(NormalizingFieldIndex):
+            def normalize(self, value):
+                return value.lower() if value else value
+        return _NormalizingIndex()
+
+    def _value(self, i):
+        return 'VALUE%d' % i
+
+    def test_batch_unindexes(self):
+        # A field index can store None
+        index = self._check([
+            [(i, self._value(i)) for i in range(5)],
+            [(1, None), (2, None), (3, 'new')],
+        ])
+        assert_that(index.documentCount(), is_(5))
+
+    def test_batch_normalize_fails(self):
+        index = self._makeOne()
+        index.index_doc(3, self._wrap('y'))
+        index.index_doc(99, self._wrap('z'))
+        state = self._state(index)
+        # Values that aren't strings can't be normalized.
+        assert_that(calling(index.index_docs).with_args(
+            [(1, self._wrap('a')), (2, self._wrap(42)), (3, self._wrap(None))]),
+                    raises(AttributeError))
+        assert_that(self._state(index), is_(state))
+        index.index_docs([(1, self._wrap('a'))])
+        assert_that(list(index.apply(('a', 'a'))), is_([1]))
+
+
+class TestCaseInsensitiveAttributeFieldIndexBatch(TestNormalizingFieldIndexBatch):
+
+    def _makeOne(self):
+        return CaseInsensitiveAttributeFieldIndex('field')
+
+    _wrap = Doc
+
+    def test_batch_unindexes(self): # pylint:disable=useless-parent-delegation
+        _AbstractBatchTest.test_batch_unindexes(self)
+
+    def test_batch_not_applicable(self):
+        from zope import interface
+        class IFoo(interface.Interface): # pylint:disable=inherit-non-class
+            pass
+        index = CaseInsensitiveAttributeFieldIndex('field', IFoo)
+        index.index_docs([(1, Doc('a'))])
+        assert_that(index.documentCount(), is_(0))
+
+
+class TestValueIndexBatch(_AbstractBatchTest, unittest.TestCase):
+
+    _makeOne = ValueIndex
+
+    def _value(self, i):
+        return 'value%d' % i
+
+
+class TestAttributeValueIndexBatch(TestValueIndexBatch):
+
+    def _makeOne(self):
+        from nti.zope_catalog.index import AttributeValueIndex
+        return AttributeValueIndex('field')
+
+    _wrap = Doc
+
+
+class TestIntegerValueIndexBatch(_AbstractBatchTest, unittest.TestCase):
+
+    _makeOne = IntegerValueIndex
+
+    def _value(self, i):
+        return i
+
+    def test_batch_wrong_type(self):
+        index = self._makeOne()
+        assert_that(calling(index.index_docs).with_args([(1, 'str')]),
+                    raises(TypeError))
+
+
+class TestIntegerAttributeIndexBatch(TestIntegerValueIndexBatch):
+
+    def _makeOne(self):
+        return IntegerAttributeIndex('field')
+
+    _wrap = Doc
+
+    def test_batch_wrong_type(self):
+        index = self._makeOne()
+        assert_that(calling(index.index_docs).with_args([(1, Doc('str'))]),
+                    raises(TypeError))
+
+
+class TestSetIndexBatch(_AbstractBatchTest, unittest.TestCase):
+
+    _makeOne = SetIndex
+    _unindexed = ()
+
+    def _value(self, i):
+        return ['v%d' % i, 'v%d' % (i + 1), None]
+
+    def test_batch_unindexes(self):
+        index = self._check([
+            [(i, self._value(i)) for i in range(5)],
+            [(1, ()), (2, [None])],
+        ])
+        assert_that(index.documentCount(), is_(3))
+
+
+class TestAttributeSetIndexBatch(TestSetIndexBatch):
+
+    def _makeOne(self):
+        from nti.zope_catalog.index import AttributeSetIndex
+        return AttributeSetIndex('field')
+
+    _wrap = Doc
+
+
+class TestNormalizingKeywordIndexBatch(_AbstractBatchTest, unittest.TestCase):
+
+    def _makeOne(self):
+        index = NormalizingKeywordIndex()
+        # Exercise the conversion to TreeSets
+        index.tree_threshold = 4
+        return index
+
+    _unindexed = ()
+
+    def _value(self, i):
+        return ['V%d' % i, 'v%d' % (i + 1)]
+
+    def test_batch_unindexes(self):
+        index = self._check([
+            [(i, self._value(i)) for i in range(5)],
+            [(1, ()), (2, [])],
+        ])
+        assert_that(index.documentCount(), is_(3))
+
+    def test_batch_string(self):
+        index = self._makeOne()
+        assert_that(calling(index.index_docs).with_args([(1, 'str')]),
+                    raises(TypeError))
+
+    def test_batch_grows_to_tree(self):
+        index = self._check([
+            [(1, ['a'])],
+            [(2, ['a', 'b']), (3, ['a']), (4, ['A'])],
+        ])
+        assert_that(index._fwd_index['a'], is_(family.IF.TreeSet))
+        # Ranges union Sets and TreeSets alike.
+        assert_that(list(index.apply({'between': ('a', 'b')})), is_([1, 2, 3, 4]))
+
+
+class TestAttributeKeywordIndexBatch(TestNormalizingKeywordIndexBatch):
+
+    def _makeOne(self):
+        from nti.zope_catalog.index import AttributeKeywordIndex
+        index = AttributeKeywordIndex('field')
+        index.tree_threshold = 4
+        return index
+
+    _wrap = Doc
+
+    def test_batch_unindexes(self):
+        index = self._check([
+            [(i, self._value(i)) for i in range(5)],
+            [(1, ()), (2, None)],
+        ])
+        assert_that(index.documentCount(), is_(3))
+
+    def test_batch_string(self):
+        index = self._makeOne()
+        assert_that(calling(index.index_docs).with_args([(1, Doc('str'))]),
+                    raises(TypeError))
+
+
+class TestDefaultBatch(unittest.TestCase):
+
+    def test_text_index(self):
+        index = AttributeTextIndex('field', field_callable=False)
+        index.index_docs([(2, Doc('some text')), (1, Doc('more text'))])
+        assert_that(index.documentCount(), is_(2))
+        index.unindex_docs([1, 2, 2])
+        assert_that(index.documentCount(), is_(0))
+
+    def test_normalization_wrapper(self):
+        from nti.zope_catalog.index import NormalizationWrapper
+        from nti.zope_catalog.string import StringTokenNormalizer
+        index = NormalizationWrapper('field', index=ValueIndex(),
+                                     normalizer=StringTokenNormalizer())
+        index.index_docs([(1, Doc('A ')), (2, Doc(' b'))])
+        assert_that(dict(index.index.documents_to_values),
+                    is_({1: 'a', 2: 'b'}))
+
+
+class _AbstractSortTest(object):
+    # pylint:disable=no-member
+
+    def _makeOne(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        super().setUp()
+        self.index = index = self._makeOne()
+        self.values = {docid: docid % 37 for docid in range(1, 301)}
+        for docid, value in self.values.items():
+            index.index_doc(docid, value)
+
+    def _expected(self, docids, reverse, limit):
+        # By value and then docid; reversing reverses both.
+        result = sorted(((self.values[d], d) for d in docids if d in self.values),
+                        reverse=reverse)
+        result = [d for _, d in result]
+        return result[:limit] if limit else result
+
+    def _check(self, docids, walks):
+        index = self.index
+        if docids is not None:
+            assert_that(index._sort_by_walking(family.IF.Set(docids), False, 5),
+                        is_(walks))
+        for reverse in (False, True):
+            for limit in (None, 1, 5, 50, 1000):
+                expected = self._expected(self.values if docids is None else docids,
+                                          reverse, limit)
+                assert_that(list(index.sort(docids, reverse=reverse, limit=limit)),
+                            is_(expected))
+
+    def test_sort_most(self):
+        # Includes a docid that isn't indexed.
+        self._check([d for d in range(1, 310) if d % 10], True)
+
+    def test_sort_few(self):
+        self._check([3, 77, 38, 150, 1], False)
+
+    def test_sort_all(self):
+        self._check(None, True)
+        assert_that(calling(list).with_args(self.index.sort(None, limit=0)),
+                    raises(ValueError))
+
+    def test_sort_empty(self):
+        index = self._makeOne()
+        for reverse in (False, True):
+            assert_that(list(index.sort(None, reverse=reverse)), is_([]))
+            assert_that(list(index.sort([1, 2], reverse=reverse, limit=1)),
+                        is_([]))
+
+    def test_sort_walks_lazily(self):
+        index = self.index
+        fwd_index = index._fwd_index
+        visited = []
+
+        class Recording(type(fwd_index)):
+            def __getitem__(self, key):
+                visited.append(key)
+                return super().__getitem__(key)
+
+            def values(self, *args):
+                for key in self.keys(*args):
+                    yield self[key]
+
+        recording = Recording()
+        recording.update(fwd_index)
+        setattr(index, index._sorting_fwd_index_attr, recording)
+        assert_that(list(index.sort(None, limit=10)),
+                    is_([37, 74, 111, 148, 185, 222, 259, 296, 1, 38]))
+        assert_that(visited, is_([0, 1]))
+        if index._sort_integer_keys:
+            del visited[:]
+            assert_that(list(index.sort(None, reverse=True, limit=10)),
+                        is_([295, 258, 221, 184, 147, 110, 73, 36, 294, 257]))
+            assert_that(visited, is_([36, 35]))
+
+
+class TestNormalizingFieldIndexSort(_AbstractSortTest, unittest.TestCase):
+
+    def _makeOne(self):
+        class _NormalizingIndex(NormalizingFieldIndex):
+            def normalize(self, value):
+                return value
+        return _NormalizingIndex()
+
+
+    def test_sort_none(self):
+        # A field index stores None, which Python can't
+        # compare with other values.
+        index = self._makeOne()
+        for docid, value in ((1, 'b'), (2, None), (3, 'a'), (4, None)):
+            index.index_doc(docid, value)
+        assert_that(list(index.sort([1, 2, 3, 4, 5])), is_([2, 4, 3, 1]))
+        assert_that(list(index.sort([1, 2, 3, 4], reverse=True, limit=3)),
+                    is_([1, 3, 4]))
+
+
+class TestValueIndexSort(_AbstractSortTest, unittest.TestCase):
+
+    def _makeOne(self):
+        return ValueIndex()
+
+
+class TestIntegerValueIndexSort(_AbstractSortTest, unittest.TestCase):
+
+    def _makeOne(self):
+        return IntegerValueIndex()
+
+
+class _AbstractPlanTest(object):
+    # pylint:disable=no-member
+
+    #: Queries to check; each must apply without error.
+    _queries = ()
+
+    def _makeOne(self):
+        raise NotImplementedError
+
+    def _value(self, i):
+        raise NotImplementedError
+
+    def setUp(self):
+        super().setUp()
+        self.index = index = self._makeOne()
+        for docid in range(1, 61):
+            index.index_doc(docid, self._value(docid))
+
+    def _items(self, result):
+        return list(result.items()) if hasattr(result, 'items') else list(result)
+
+    def test_estimate_and_filter(self):
+        index = self.index
+        IF = family.IF
+        candidates = [IF.Set(range(0, 70, 3)),
+                      IF.Bucket([(d, 2.0) for d in range(5, 40, 4)]),
+                      IF.Set()]
+        for query in self._queries:
+            expected = index.apply(query)
+            if expected is None:
+                assert_that(index.apply_filtered(query, candidates[0]), is_(none()))
+                assert_that(index.count(query), is_(none()))
+                continue
+            if isinstance(expected, list):
+                # zc.catalog's result for values of the wrong type
+                expected = IF.Set(expected)
+            assert_that(index.count(query), is_(len(expected)), query)
+            estimate = index.estimate(query)
+            if estimate is not None:
+                assert_that(estimate >= len(expected), is_(True), query)
+            for docids in candidates:
+                filtered = index.apply_filtered(query, docids)
+                # What matters is the result of intersecting.
+                assert_that(self._items(IF.weightedIntersection(docids, filtered)[1]),
+                            is_(self._items(IF.weightedIntersection(docids, expected)[1])),
+                            query)
+
+    def test_estimate_too_many_postings(self):
+        index = self.index
+        index._ESTIMATE_MAX_POSTINGS = 1
+        query = self._queries[0]
+        assert_that(index.estimate(query), is_(index.documentCount()))
+
+
+class TestNormalizingFieldIndexPlan(_AbstractPlanTest, unittest.TestCase):
+
+    _queries = (
+        (1, 3),
+        (None, 2),
+        (4, None),
+        (5, 5),
+        (9, 20),
+    )
+
+    def _makeOne(self):
+        class _NormalizingIndex(NormalizingFieldIndex):
+            def normalize(self, value):
+                return value
+        return _NormalizingIndex()
+
+    def _value(self, i):
+        return i % 7 if i % 11 else None
+
+    def test_not_a_range(self):
+        index = self.index
+        assert_that(index.estimate([1, 2]), is_(16))
+        assert_that(index.estimate((1, 2, 3)), is_(none()))
+        assert_that(index.estimate(('a', 'b')), is_(none()))
+        for method in index.apply, index.count:
+            assert_that(calling(method).with_args((1, 2, 3)),
+                        raises(TypeError))
+        assert_that(calling(index.apply_filtered).with_args((1, 2, 3), family.IF.Set([1])),
+                    raises(TypeError))
+
+
+class TestValueIndexPlan(_AbstractPlanTest, unittest.TestCase):
+
+    _queries = (
+        {'between': (1, 3)},
+        {'between': (1, 3, True, True)},
+        {'any_of': (1, 2, 99)},
+        {'any_of': ([],)},
+        (2, 2),
+        (2, 4),
+        {'any': None},
+        {},
+        {'between': ('a', 'b')},
+        {'any_of': (1, 1, 3)},
+    )
+
+    def _makeOne(self):
+        return ValueIndex()
+
+    def _value(self, i):
+        return i % 7
+
+    def test_estimate(self):
+        index = self.index
+        assert_that(index.estimate({'any_of': (1, 99)}), is_(9))
+        assert_that(index.estimate({'any_of': (99,)}), is_(0))
+        assert_that(index.estimate({'any': None}), is_(60))
+        assert_that(index.estimate({}), is_(none()))
+        assert_that(index.estimate({'between': ('a', 'b')}), is_(0))
+
+
+class TestIntegerValueIndexPlan(TestValueIndexPlan):
+
+    _queries = TestValueIndexPlan._queries[:3] + TestValueIndexPlan._queries[4:]
+
+    def _makeOne(self):
+        return IntegerValueIndex()
+
+
+class TestSetIndexPlan(_AbstractPlanTest, unittest.TestCase):
+
+    _queries = (
+        {'any_of': (1, 12, 99)},
+        {'all_of': (1, 12)},
+        {'all_of': ()},
+        {'between': (2, 10)},
+        {'any': None},
+        {'any_of': ([],)},
+        {'between': ('a', 'b')},
+        {'any_of': (1, 1)},
+        {'all_of': (12,)},
+        {'all_of': ('a',)},
+        {'any_of': ('a',)},
+    )
+
+    def _makeOne(self):
+        return SetIndex()
+
+    def _value(self, i):
+        return {i % 5, i % 3 + 10}
+
+    def test_estimate(self):
+        index = self.index
+        assert_that(index.estimate({'all_of': (1, 12)}), is_(12))
+        assert_that(index.estimate({'all_of': (1, 99)}), is_(0))
+        # Posting lengths overestimate the union.
+        assert_that(index.estimate({'any_of': (1, 12)}), is_(32))
+
+
+class TestNormalizingKeywordIndexPlan(_AbstractPlanTest, unittest.TestCase):
+
+    _queries = (
+        ['w1', 'x2'],
+        'W1',
+        {'any_of': ['w1', 'X2']},
+        {'query': ['w1', 'w2'], 'operator': 'or'},
+        {'between': ('w1', 'w3')},
+        {'any': None},
+        {},
+        [1],
+        ['W1', 'w1'],
+        {'any_of': ['x2']},
+    )
+
+    def _makeOne(self):
+        return NormalizingKeywordIndex()
+
+    def _value(self, i):
+        return ['w%d' % (i % 5), 'X%d' % (i % 3)]
+
+    def test_estimate(self):
+        index = self.index
+        assert_that(index.estimate(['w1', 'x2']), is_(12))
+        assert_that(index.estimate({'any_of': ['w1', 'x2']}), is_(32))
+        assert_that(index.estimate({}), is_(0))
+        assert_that(index.estimate({'any': None}), is_(60))
+
+        from zc.catalog.extentcatalog import Extent
+        extent = Extent(family)
+        extent.add(1, None)
+        assert_that(index.estimate(extent), is_(none()))
+        assert_that(list(index.apply_filtered(extent, family.IF.Set([1, 2]))),
+                    is_([1]))
+
+
+class TestPlanMixin(unittest.TestCase):
+
+    def test_defaults(self):
+        from nti.zope_catalog.index import _PlanMixin
+        assert_that(_PlanMixin().estimate({}), is_(none()))
+        assert_that(_PlanMixin()._query_filter({}), is_(none()))
+
+
+class TestShardedIntegerValueIndex(unittest.TestCase):
+
+    _queries = TestIntegerValueIndexPlan._queries
+
+    def _makeOne(self):
+        from nti.zope_catalog.index import ShardedIntegerValueIndex
+        return ShardedIntegerValueIndex(shards=4)
+
+    def setUp(self):
+        self.index = self._makeOne()
+        self.unsharded = IntegerValueIndex()
+        for docid in range(1, 61):
+            for index in self.index, self.unsharded:
+                index.index_doc(docid, docid % 7)
+
+    def _items(self, result):
+        return list(result.items()) if hasattr(result, 'items') else list(result)
+
+    def test_provides(self):
+        from zope.index.interfaces import IIndexSort
+        from nti.testing.matchers import verifiably_provides
+        from nti.zope_catalog.interfaces import IIntegerValueIndex
+        assert_that(self.index, verifiably_provides(IIntegerValueIndex, IIndexSort))
+        assert_that(self.index.shards, has_length(4))
+        assert_that(self.index.shards[1].documentCount(), is_(15))
+
+    def test_family(self):
+        from nti.zope_catalog.index import ShardedIntegerValueIndex
+        index = ShardedIntegerValueIndex(family=BTrees.family32)
+        assert_that(index.shards, has_length(ShardedIntegerValueIndex.SHARDS))
+        assert_that(index.shards[0], has_property('family', BTrees.family32))
+
+    def test_apply_matches_unsharded(self):
+        from zc.catalog.extentcatalog import Extent
+        index = self.index
+        unsharded = self.unsharded
+        IF = family.IF
+        candidates = [IF.Set(range(0, 70, 3)), IF.Set()]
+        for query in self._queries:
+            expected = unsharded.apply(query)
+            result = index.apply(query)
+            assert_that(list(result) if result is not None else None,
+                        is_(list(expected) if expected is not None else None), query)
+            assert_that(index.count(query), is_(unsharded.count(query)), query)
+            assert_that(index.estimate(query), is_(unsharded.estimate(query)), query)
+            for docids in candidates:
+                filtered = index.apply_filtered(query, docids)
+                expected = unsharded.apply_filtered(query, docids)
+                assert_that(self._items(filtered) if filtered is not None else None,
+                            is_(self._items(expected) if expected is not None else None),
+                            query)
+
+        extent = Extent(family)
+        for docid in (1, 2, 99):
+            extent.add(docid, None)
+        assert_that(list(index.apply({'none': extent})), is_([99]))
+
+    def test_values(self):
+        index = self.index
+        unsharded = self.unsharded
+        assert_that(list(index.values()), is_(list(unsharded.values())))
+        assert_that(list(index.values(2, 4, excludemin=True)), is_([3, 4]))
+        assert_that(list(index.values(doc_id=9)), is_([2]))
+        assert_that(list(index.ids()), is_(list(unsharded.ids())))
+        assert_that(index.documentCount(), is_(60))
+        # Each value is in every shard.
+        assert_that(index.wordCount(), is_(28))
+        assert_that(index.containsValue(3), is_(True))
+        assert_that(index.containsValue(7), is_(False))
+        assert_that(index.minValue(), is_(0))
+        assert_that(index.minValue(3), is_(3))
+        assert_that(index.maxValue(), is_(6))
+        assert_that(list(index.zip([7, 8, 99])), is_([(7, 0), (8, 1), (99, None)]))
+        assert_that(list(index.zip()), is_([]))
+
+        empty = self._makeOne()
+        empty.index_doc(1, 5)
+        assert_that(empty.maxValue(), is_(5))
+        empty.clear()
+        assert_that(calling(empty.minValue), raises(ValueError))
+        assert_that(calling(empty.maxValue), raises(ValueError))
+
+    def test_sort(self):
+        index = self.index
+        unsharded = self.unsharded
+        for docids in (None, [3, 77, 38, 50, 1], list(range(1, 70, 2))):
+            for reverse in (False, True):
+                for limit in (None, 1, 5, 100):
+                    assert_that(list(index.sort(docids, reverse=reverse, limit=limit)),
+                                is_(list(unsharded.sort(docids, reverse=reverse,
+                                                        limit=limit))))
+        assert_that(calling(list).with_args(index.sort(None, limit=0)),
+                    raises(ValueError))
+
+    def test_batch(self):
+        index = self.index
+        unsharded = self.unsharded
+        for idx in index, unsharded:
+            idx.index_docs([(docid, docid % 3) for docid in range(50, 80)] + [(1, None)])
+            idx.unindex_docs([2, 3, 99])
+            idx.unindex_doc(4)
+        assert_that(dict(index.zip(range(100))), is_(dict(unsharded.zip(range(100)))))
+        assert_that(index.documentCount(), is_(unsharded.documentCount()))
+
+    def test_bulk_load(self):
+        index = self._makeOne()
+        loader = index.bulk_loader()
+        loader.add([(docid, docid % 7) for docid in range(1, 61)])
+        loader.finish()
+        assert_that(dict(index.zip(range(100))), is_(dict(self.unsharded.zip(range(100)))))
+        # Not empty.
+        assert_that(index.bulk_loader(), is_(none()))
+
+
+class TestShardedIntegerAttributeIndex(unittest.TestCase):
+
+    def _makeOne(self):
+        from nti.zope_catalog.index import ShardedIntegerAttributeIndex
+        return ShardedIntegerAttributeIndex('field', shards=3)
+
+    def test_index(self):
+        from zope.catalog.interfaces import ICatalogIndex
+        from nti.testing.matchers import verifiably_provides
+        index = self._makeOne()
+        assert_that(index, verifiably_provides(ICatalogIndex))
+        index.index_doc(1, Doc(10))
+        index.index_docs([(2, Doc(20)), (3, Doc(10)), (4, object())])
+        index.index_docs([(1, Doc(None))])
+        assert_that(list(index.apply({'any_of': (10,)})), is_([3]))
+        assert_that(index.documentCount(), is_(2))
+
+        bulk = self._makeOne()
+        bulk.bulk_load([(docid, Doc(docid % 4)) for docid in range(20)])
+        assert_that(list(bulk.apply({'between': (1, 2)})),
+                    is_([d for d in range(20) if d % 4 in (1, 2)]))
+
+    def test_in_catalog(self):
+        from nti.zope_catalog.catalog import Catalog
+        catalog = Catalog(family=family)
+        catalog['field'] = self._makeOne()
+        documents = {docid: Doc(docid * 10) for docid in range(1, 10)}
+        catalog._visitAllSublocations = lambda *_args: iter(documents.items())
+        catalog.updateIndexes()
+        assert_that(list(catalog.apply({'field': {'between': (20, 40)}})),
+                    is_([2, 3, 4]))
+        assert_that(list(catalog['field'].sort(None, reverse=True, limit=2)),
+                    is_([9, 8]))
+
+
+class TestShardedIntegerIndexConflicts(unittest.TestCase):
+
+    def test_concurrent_same_value(self):
+        import os
+        import shutil
+        import tempfile
+        import transaction
+        from ZODB.DB import DB
+        from ZODB.FileStorage import FileStorage
+        from nti.zope_catalog.index import ShardedIntegerValueIndex
+
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        db = DB(FileStorage(os.path.join(tempdir, 'Data.fs')))
+        self.addCleanup(db.close)
+
+        def open_index():
+            tm = transaction.TransactionManager()
+            conn = db.open(tm)
+            self.addCleanup(conn.close)
+            self.addCleanup(tm.abort)
+            return tm, conn.root.index
+
+        tm = transaction.TransactionManager()
+        conn = db.open(tm)
+        conn.root.index = ShardedIntegerValueIndex(shards=2)
+        tm.commit()
+        conn.close()
+
+        tm1, index1 = open_index()
+        tm2, index2 = open_index()
+        # The same (latest) timestamp, different shards.
+        index1.index_doc(1, 1000)
+        index2.index_doc(2, 1000)
+        tm1.commit()
+        tm2.commit()
+
+        tm1.begin()
+        assert_that(list(index1.apply({'any_of': (1000,)})), is_([1, 2]))
+
+
+class TestSkipUnchangedWrites(unittest.TestCase):
+
+    def setUp(self):
+        import transaction
+        from ZODB.DB import DB
+        from nti.zope_catalog import instrumentation
+        self.db = DB(None)
+        self.addCleanup(self.db.close)
+        self.tm = transaction.TransactionManager()
+        self.conn = self.db.open(self.tm)
+        self.addCleanup(self.conn.close)
+        self.addCleanup(self.tm.abort)
+        self.recorder = instrumentation.enable()
+        self.addCleanup(instrumentation.disable)
+
+    def _check(self, index, values, changed):
+        index.__name__ = 'index'
+        self.conn.root.index = index
+        index.index_docs(list(enumerate(values)))
+        self.tm.commit()
+        self.recorder.reset()
+
+        for docid, value in enumerate(values):
+            index.index_doc(docid, value)
+        index.index_docs(list(enumerate(values)))
+        assert_that(self.conn._registered_objects, is_([]))
+        assert_that(self.recorder.counters[('index', 'skipped_writes')],
+                    is_(2 * len(values)))
+
+        index.index_doc(0, changed)
+        assert_that(self.conn._registered_objects, is_not([]))
+        self.tm.commit()
+
+    def test_field_index(self):
+        self._check(CaseInsensitiveAttributeFieldIndex('field'),
+                    [Doc('A'), Doc('b')], Doc('B'))
+
+    def test_value_index(self):
+        from nti.zope_catalog.index import AttributeValueIndex
+        self._check(AttributeValueIndex('field'), [Doc('a'), Doc('b')], Doc('c'))
+        self._check(ValueIndex(), ['a', 'b'], 'c')
+
+    def test_integer_index(self):
+        self._check(IntegerAttributeIndex('field'), [Doc(1), Doc(2)], Doc(3))
+
+    def test_set_index(self):
+        from nti.zope_catalog.index import AttributeSetIndex
+        self._check(AttributeSetIndex('field'), [Doc(('a', 'b')), Doc(('c',))], Doc(('a',)))
+        self._check(SetIndex(), [('a', 'b'), ('c',)], ('a', 'd'))
+
+    def test_keyword_index(self):
+        from nti.zope_catalog.index import AttributeKeywordIndex
+        self._check(AttributeKeywordIndex('field'),
+                    [Doc(('A', 'b')), Doc(('c',))], Doc(('a',)))
+
+    def test_text_index(self):
+        self._check(AttributeTextIndex('field'),
+                    [Doc('some text'), Doc('more text')], Doc('new words'))
+
+    def test_value_extracted_once(self):
+        from nti.zope_catalog.index import AttributeSetIndex
+        from nti.zope_catalog.index import AttributeValueIndex
+
+        class CountingDoc(object):
+            calls = 0
+
+            def __init__(self, value):
+                self.value = value
+
+            def field(self):
+                self.calls += 1
+                return self.value
+
+        for index, value, changed in (
+                (IntegerAttributeIndex('field', field_callable=True), 1, 2),
+                (AttributeValueIndex('field', field_callable=True), 'a', 'b'),
+                (AttributeSetIndex('field', field_callable=True), ('a',), ('b',)),
+                (AttributeTextIndex('field', field_callable=True), 'some text', 'more'),
+        ):
+            for doc in CountingDoc(value), CountingDoc(value), CountingDoc(changed):
+                index.index_doc(1, doc)
+                assert_that(doc.calls, is_(1), index)
+            assert_that(index.documentCount(), is_(1))
+            index.index_doc(1, CountingDoc(None))
+            assert_that(index.documentCount(), is_(0))
+
+        index = AttributeTextIndex('field', interface=IOtherDoc)
+        index.index_doc(1, Doc('some text'))
+        assert_that(index.documentCount(), is_(0))
+
+
+class TestArrays(unittest.TestCase):
+
+    def test_integer_round_trip(self):
+        import numpy
+        index = IntegerValueIndex()
+        # Enough for several buckets
+        for docid in range(1000, 0, -1):
+            index.index_doc(docid, docid * 3)
+        docids, values = index.to_arrays()
+        assert_that(docids.dtype, is_(numpy.dtype('int64')))
+        assert_that(values.dtype, is_(numpy.dtype('int64')))
+        assert_that(docids.tolist(), is_(list(range(1, 1001))))
+        assert_that((values == docids * 3).all(), is_(True))
+
+        copy = IntegerValueIndex()
+        copy.from_arrays(docids, values)
+        assert_that(list(copy.zip(range(1002))), is_(list(index.zip(range(1002)))))
+        assert_that(copy.documentCount(), is_(1000))
+
+        docids, values = index.to_arrays([5, 2000, 3])
+        assert_that(docids.tolist(), is_([5, 3]))
+        assert_that(values.tolist(), is_([15, 9]))
+
+    def test_value_index(self):
+        index = ValueIndex()
+        index.from_arrays([1, 2, 3], ['a', 'b', None])
+        docids, values = index.to_arrays()
+        assert_that(docids.tolist(), is_([1, 2]))
+        assert_that(values.tolist(), is_(['a', 'b']))
+        _, values = index.to_arrays(value_dtype='U1')
+        assert_that(str(values.dtype), is_('<U1'))
+        assert_that(calling(index.from_arrays).with_args([1], []),
+                    raises(ValueError))
+
+    def test_empty(self):
+        docids, values = IntegerValueIndex().to_arrays()
+        assert_that(docids.tolist(), is_([]))
+        assert_that(values.tolist(), is_([]))
+
+    def test_attribute_index(self):
+        import numpy
+        index = IntegerAttributeIndex('field', field_callable=True)
+        index.from_arrays(numpy.array([1, 2]), numpy.array([10, 20]))
+        # Not empty, so not bulk loaded.
+        index.from_arrays([3], [30])
+        assert_that(list(index.apply({'between': (15, 30)})), is_([2, 3]))
+
+
+class TestRangeArrays(unittest.TestCase):
+
+    queries = (
+        {'between': (10, 50)},
+        {'between': (10, 50, True, True)},
+        {'between': (None, 25)},
+        {'between': (25, None)},
+        (30, 60),
+        {'any_of': (30,)},
+    )
+
+    def _check(self, index, plain):
+        for query in self.queries:
+            assert_that(list(index.apply(query)), is_(list(plain.apply(query))), query)
+
+    def _both(self, func, *args):
+        func(self.index, *args)
+        func(self.plain, *args)
+        self._check(self.index, self.plain)
+
+    def test_maintained(self):
+        self.index = IntegerValueIndex()
+        self.index.enable_range_arrays()
+        self.plain = IntegerValueIndex()
+        # Bulk loaded.
+        self._both(IntegerValueIndex.index_docs, [(d, d % 70) for d in range(200)])
+        self._both(IntegerValueIndex.index_doc, 1, 30)
+        self._both(IntegerValueIndex.index_doc, 1, 30)
+        self._both(IntegerValueIndex.index_doc, 2, None)
+        self._both(IntegerValueIndex.unindex_doc, 3)
+        self._both(IntegerValueIndex.unindex_doc, 3)
+        self._both(IntegerValueIndex.index_docs, [(d, d % 40) for d in range(100, 300)])
+        self._both(IntegerValueIndex.unindex_docs, range(0, 300, 3))
+        assert_that(self.index.apply({'between': ('a', 'b')}), is_([]))
+
+        # Enabling again keeps them.
+        arrays = self.index._range_arrays
+        self.index.enable_range_arrays()
+        assert_that(self.index._range_arrays, is_(arrays))
+
+        self._both(IntegerValueIndex.clear)
+        self._both(IntegerValueIndex.index_doc, 1, 30)
+        self.index.disable_range_arrays()
+        self._both(IntegerValueIndex.index_doc, 2, 40)
+
+    def test_enabled_later(self):
+        index = IntegerAttributeIndex('field')
+        for docid in range(100):
+            index.index_doc(docid, Doc(docid % 60))
+        plain = IntegerValueIndex()
+        plain.index_docs([(d, d % 60) for d in range(100)])
+        index.enable_range_arrays()
+        self._check(index, plain)
+        index.index_doc(1, Doc(None))
+        plain.index_doc(1, None)
+        self._check(index, plain)
+
+
+class TestStatistics(unittest.TestCase):
+
+    def test_single_valued(self):
+        from nti.testing.matchers import verifiably_provides
+        from nti.zope_catalog.interfaces import IIndexStatistics
+        class _FieldIndex(NormalizingFieldIndex):
+            def normalize(self, value):
+                return value
+        for index in (ValueIndex(), IntegerValueIndex(),
+                      _FieldIndex(), ShardedIntegerValueIndex(shards=3)):
+            # Value v has v documents.
+            docid = 0
+            for value in range(1, 11):
+                for _ in range(value):
+                    index.index_doc(docid, value)
+                    docid += 1
+            stats = index.statistics(top=3, buckets=4)
+            assert_that(stats, verifiably_provides(IIndexStatistics))
+            assert_that(stats.documents, is_(55))
+            assert_that(stats.distinct_values, is_(10))
+            assert_that(stats.exact, is_(True))
+            assert_that(stats.heavy_hitters, is_([(10, 10), (9, 9), (8, 8)]))
+            assert_that(stats.values_per_document, is_(1.0))
+            assert_that(stats.histogram,
+                        is_([(1, 5, 15), (6, 7, 13), (8, 9, 17), (10, 10, 10)]))
+            assert_that(repr(stats), is_('<IndexStatistics documents=55 distinct_values=10 '
+                                         'values_per_document=1.00 sampled=55>'))
+
+    def test_sharded_sampled(self):
+        index = ShardedIntegerValueIndex(shards=4)
+        index.index_docs([(docid, docid % 10) for docid in range(1000)])
+        # The keys aren't read.
+        index.values = None
+        stats = index.statistics(sample_size=100)
+        assert_that(stats.exact, is_(False))
+        # The values are spread over the shards: 0, 2, 4, 6 and 8 are
+        # in shards 0 and 2, the others in shards 1 and 3.
+        assert_that(stats.distinct_values, is_(20))
+        assert_that(stats.distinct_values, is_(index.wordCount()))
+        # Exact when every document is examined.
+        del index.values
+        assert_that(index.statistics().distinct_values, is_(10))
+
+    def test_multi_valued(self):
+        for index in (SetIndex(), NormalizingKeywordIndex()):
+            index.index_doc(1, ['a', 'b'])
+            index.index_doc(2, ['a'])
+            index.index_doc(3, ['a', 'b', 'c'])
+            stats = index.statistics()
+            assert_that(stats.documents, is_(3))
+            assert_that(stats.distinct_values, is_(3))
+            assert_that(stats.heavy_hitters, is_([('a', 3), ('b', 2), ('c', 1)]))
+            assert_that(stats.values_per_document, is_(2.0))
+            assert_that(stats.histogram,
+                        is_([('a', 'a', 3), ('b', 'b', 2), ('c', 'c', 1)]))
+
+    def test_empty(self):
+        stats = ValueIndex().statistics(buckets=0)
+        assert_that(stats.documents, is_(0))
+        assert_that(stats.heavy_hitters, is_([]))
+        assert_that(stats.histogram, is_([]))
+        assert_that(stats.values_per_document, is_(0.0))
+
+    def test_sampled(self):
+        index = IntegerValueIndex()
+        index.index_docs([(docid, docid % 2) for docid in range(10000)])
+        stats = index.statistics(top=2, buckets=2, sample_size=500)
+        assert_that(stats.exact, is_(False))
+        assert_that(stats.documents, is_(10000))
+        assert_that(stats.distinct_values, is_(2))
+        assert_that(stats.sampled_documents, is_(less_than(501)))
+        assert_that(stats.values_per_document, is_(1.0))
+        histogram = stats.histogram
+        assert_that((histogram[0][0], histogram[-1][1]), is_((0, 1)))
+        assert_that(abs(sum(count for _, _, count in histogram) - 10000), is_(less_than(3)))
+        for _, count in stats.heavy_hitters:
+            assert_that(abs(count - 5000), is_(less_than(1500)))
+
+    def test_normalization_wrapper(self):
+        from nti.zope_catalog.index import NormalizationWrapper
+        from nti.zope_catalog.string import StringTokenNormalizer
+        index = NormalizationWrapper('field', index=ValueIndex(),
+                                     normalizer=StringTokenNormalizer())
+        index.index_docs([(1, Doc('A ')), (2, Doc(' a'))])
+        assert_that(index.statistics().heavy_hitters, is_([('a', 2)]))
+
+    def test_text(self):
+        index = AttributeTextIndex('field')
+        index.index_doc(1, Doc('the cat sat on the mat'))
+        index.index_doc(2, Doc('the cat'))
+        stats = index.statistics(top=1)
+        # Without the stop words.
+        assert_that(stats.documents, is_(2))
+        assert_that(stats.distinct_values, is_(3))
+        assert_that(stats.heavy_hitters, is_([('cat', 2)]))
+        assert_that(stats.values_per_document, is_(2.0))
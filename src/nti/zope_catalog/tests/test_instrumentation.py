@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+from hamcrest import assert_that
+from hamcrest import contains_string
+from hamcrest import has_entries
+from hamcrest import has_key
+from hamcrest import is_
+from hamcrest import is_not as does_not
+from hamcrest import none
+from hamcrest import same_instance
+
+from nti.testing.matchers import verifiably_provides
+
+from nti.zope_catalog import instrumentation
+from nti.zope_catalog.catalog import Catalog
+from nti.zope_catalog.catalog import CatalogPrefetchIterator
+from nti.zope_catalog.index import AttributeValueIndex
+from nti.zope_catalog.index import CaseInsensitiveAttributeFieldIndex
+from nti.zope_catalog.index import NormalizingFieldIndex
+from nti.zope_catalog.interfaces import IInstrumentationRecorder
+
+__docformat__ = "restructuredtext en"
+
+# pylint:disable=protected-access
+
+
+class Content(object):
+
+    def __init__(self, value):
+        self.value = value
+
+
+class _VisitingCatalog(Catalog):
+
+    def __init__(self, data):
+        super().__init__()
+        self.data = data
+
+    def _visitSublocations(self, min_uid=None, max_uid=None):
+        return iter(self.data)
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(instrumentation.disable)
+
+    def test_disabled_by_default(self):
+        assert_that(instrumentation.get_recorder(), is_(none()))
+        assert_that(instrumentation.disable(), is_(none()))
+        assert_that(AttributeValueIndex.__dict__, does_not(has_key('apply')))
+
+    def test_enable_and_disable_restore_classes(self):
+        index_doc = NormalizingFieldIndex.__dict__['index_doc']
+        recorder = instrumentation.enable()
+        assert_that(recorder, verifiably_provides(IInstrumentationRecorder))
+        assert_that(instrumentation.get_recorder(), is_(same_instance(recorder)))
+        assert_that(NormalizingFieldIndex.__dict__['index_doc'],
+                    does_not(same_instance(index_doc)))
+        assert_that(AttributeValueIndex.__dict__, has_key('apply'))
+
+        # Enabling again only replaces the recorder.
+        other = instrumentation.StatsRecorder()
+        assert_that(instrumentation.enable(other), is_(same_instance(other)))
+
+        assert_that(instrumentation.disable(), is_(same_instance(other)))
+        assert_that(instrumentation.get_recorder(), is_(none()))
+        assert_that(NormalizingFieldIndex.__dict__['index_doc'],
+                    is_(same_instance(index_doc)))
+        assert_that(AttributeValueIndex.__dict__, does_not(has_key('apply')))
+
+    def test_index_and_catalog_timings(self):
+        recorder = instrumentation.enable()
+        catalog = Catalog()
+        catalog.__name__ = 'catalog'
+        catalog['value'] = AttributeValueIndex('value')
+        # The subclass calls the NormalizingFieldIndex method; that's
+        # only one call.
+        catalog['field'] = CaseInsensitiveAttributeFieldIndex('value')
+
+        catalog.index_doc(1, Content('a'))
+        catalog.index_doc(2, Content('b'))
+        catalog.unindex_doc(2)
+        assert_that(list(catalog.apply({'value': {'any_of': ('a',)}})), is_([1]))
+
+        timings = recorder.timings
+        assert_that(timings[('catalog', 'index_doc')].calls, is_(2))
+        assert_that(timings[('catalog', 'unindex_doc')].calls, is_(1))
+        assert_that(timings[('catalog', 'apply')].calls, is_(1))
+        assert_that(timings[('value', 'index_doc')].calls, is_(2))
+        assert_that(timings[('field', 'index_doc')].calls, is_(2))
+        assert_that(timings[('field', 'unindex_doc')].calls, is_(1))
+        assert_that(timings[('value', 'apply')].calls, is_(1))
+        assert_that(timings, does_not(has_key(('field', 'apply'))))
+
+        stats = timings[('value', 'index_doc')]
+        assert_that(sum(stats.histogram), is_(2))
+        assert_that(stats.mean_seconds, is_(stats.seconds / 2))
+        assert_that(repr(stats), contains_string('calls=2'))
+        assert_that(instrumentation.OperationStats().mean_seconds, is_(0.0))
+
+        report = recorder.report()
+        assert_that(report, contains_string('catalog.index_doc: 2 calls'))
+
+        recorder.reset()
+        assert_that(recorder.timings, is_({}))
+
+    def test_timed_on_error(self):
+        recorder = instrumentation.enable()
+        index = NormalizingFieldIndex()
+        with self.assertRaises(TypeError):
+            index.apply(None)
+        assert_that(recorder.timings[('NormalizingFieldIndex', 'apply')].calls,
+                    is_(1))
+
+    def test_updateIndexes_counts_documents(self):
+        recorder = instrumentation.enable()
+        catalog = _VisitingCatalog([(i, Content(i)) for i in range(5)])
+        catalog['value'] = AttributeValueIndex('value')
+        catalog.PREFETCH_CHUNK_SIZE = 2
+        catalog.updateIndexes()
+
+        assert_that(recorder.counters,
+                    has_entries({('_VisitingCatalog', 'documents_visited'): 5}))
+        assert_that(recorder.timings[('_VisitingCatalog', 'updateIndexes')].calls,
+                    is_(1))
+        assert_that(recorder.report(),
+                    contains_string('_VisitingCatalog.documents_visited: 5'))
+
+    def test_prefetch_counters(self):
+        class Jar(object):
+            databases = ()
+
+            def db(self):
+                return self
+
+            def prefetch(self, oids):
+                pass
+
+        class Obj(object):
+            def __init__(self, oid):
+                self._p_jar = jar
+                self._p_oid = oid
+
+        jar = Jar()
+        recorder = instrumentation.enable()
+        objects = [(i, Obj(i)) for i in range(5)]
+        assert_that(list(CatalogPrefetchIterator(objects, 2)), is_(objects))
+        # Nothing persistent, no round trips.
+        assert_that(list(CatalogPrefetchIterator([(1, None)], 2)),
+                    is_([(1, None)]))
+
+        name = 'CatalogPrefetchIterator'
+        assert_that(recorder.counters,
+                    has_entries({(name, 'prefetch_round_trips'): 3,
+                                 (name, 'objects'): 6}))
+        assert_that(recorder.timings[(name, 'prefetch')].calls, is_(4))
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import BTrees
+from hamcrest import assert_that
+from hamcrest import calling
+from hamcrest import contains_string
+from hamcrest import has_length
+from hamcrest import has_value
+from hamcrest import is_
+from hamcrest import is_not
+from hamcrest import none
+from hamcrest import raises
+
+from zc.catalog.extentcatalog import Extent
+
+from nti.zope_catalog.index import AttributeTextIndex
+from nti.zope_catalog.index import IntegerValueIndex
+from nti.zope_catalog.index import NormalizingKeywordIndex
+from nti.zope_catalog.index import SetIndex
+from nti.zope_catalog.index import ValueIndex
+from nti.zope_catalog.snapshot import IndexSnapshot
+from nti.zope_catalog.snapshot import SnapshotIndex
+from nti.zope_catalog.snapshot import write_snapshot
+from nti.zope_catalog.topic import ExtentFilteredSet
+
+__docformat__ = "restructuredtext en"
+
+# pylint:disable=protected-access
+
+family = BTrees.family64
+
+
+def is_even(_extent, docid, _document):
+    return docid % 2 == 0
+
+
+def _result(result):
+    if isinstance(result, family.IF.Bucket):
+        return dict(result.items())
+    return list(result)
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        self.path = os.path.join(tempdir, 'index.snapshot')
+
+    def _snapshot(self, index, tid=None):
+        write_snapshot(index, self.path, tid)
+        snapshot = IndexSnapshot(self.path)
+        self.addCleanup(snapshot.close)
+        return snapshot
+
+    def _check(self, index, snapshot_index, queries):
+        for query in queries:
+            assert_that(_result(snapshot_index.apply(query)),
+                        is_(_result(index.apply(query))),
+                        query)
+        assert_that(list(snapshot_index.ids()), is_(list(index.ids())))
+
+    def _check_snapshot(self, index, queries, change):
+        snapshot = self._snapshot(index)
+        snapshot_index = SnapshotIndex(index, snapshot)
+        self._check(index, snapshot_index, queries)
+        before = [_result(index.apply(query)) for query in queries]
+        changed = change(index)
+        # Until told, the snapshot doesn't know about the changes.
+        assert_that([_result(snapshot_index.apply(query)) for query in queries],
+                    is_(before))
+        snapshot_index.add_changed(changed)
+        self._check(index, snapshot_index, queries)
+        self._check(index, SnapshotIndex(index, snapshot, changed), queries)
+
+    def test_integer_value_index(self):
+        index = IntegerValueIndex()
+        for docid in range(100):
+            index.index_doc(docid, docid % 10)
+        queries = [
+            {'any_of': (1, 3, 42)},
+            {'between': (2, 5)},
+            {'between': (2, 5, True, True)},
+            {'between': (None, 3)},
+            {'between': (8, None)},
+            {'any': None},
+            (3, 3),
+            (3, 6),
+        ]
+
+        def change(index):
+            index.index_doc(1, 4)
+            index.unindex_doc(2)
+            index.index_doc(100, 3)
+            return [1, 2, 100]
+        self._check_snapshot(index, queries, change)
+
+        snapshot = self._snapshot(index)
+        assert_that(list(snapshot.keys()), is_(list(range(10))))
+        assert_that(snapshot, has_length(10))
+        assert_that(list(snapshot.posting(3)), is_(list(index.apply((3, 3)))))
+        assert_that(snapshot.posting(42), is_(none()))
+        assert_that(snapshot.postings(1, 2), has_length(2))
+        # Values of the wrong type find nothing.
+        assert_that(SnapshotIndex(index, snapshot).apply({'any_of': ('a',)}), is_([]))
+
+    def test_value_index(self):
+        index = ValueIndex()
+        for docid in range(100):
+            index.index_doc(docid, 'v%d' % (docid % 7))
+        queries = [
+            {'any_of': ('v1', 'v3', 'x')},
+            {'between': ('v2', 'v5')},
+            {'any': None},
+        ]
+
+        def change(index):
+            index.index_doc(1, 'v5')
+            index.unindex_doc(3)
+            return [1, 3]
+        self._check_snapshot(index, queries, change)
+
+        # The keys are read from the map, not kept in the header.
+        index.index_doc(200, u'v\xe9')
+        snapshot = self._snapshot(index)
+        assert_that(list(snapshot.keys()),
+                    is_(['v%d' % i for i in range(7)] + [u'v\xe9']))
+        assert_that(snapshot.keys()[7], is_(u'v\xe9'))
+        assert_that(list(snapshot.posting(u'v\xe9')), is_([200]))
+        assert_that(snapshot.posting('v'), is_(none()))
+        assert_that(calling(snapshot.keys().__getitem__).with_args(8),
+                    raises(IndexError))
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        header = pickle.loads(data[int.from_bytes(data[-16:-8], 'little'):-16])
+        assert_that(header, is_not(has_value(contains_string('v1'))))
+
+    def test_unsupported_keys(self):
+        index = ValueIndex()
+        index.index_doc(1, (1, 2))
+        index.index_doc(2, (3, 4))
+        assert_that(calling(write_snapshot).with_args(index, self.path),
+                    raises(TypeError, 'integer or string keys'))
+        index = ValueIndex()
+        index.index_doc(1, 1)
+        index.index_doc(2, 1.5)
+        assert_that(calling(write_snapshot).with_args(index, self.path),
+                    raises(TypeError, 'integer or string keys'))
+        assert_that(os.listdir(os.path.dirname(self.path)), is_([]))
+
+    def test_unwritable_path(self):
+        path = os.path.join(os.path.dirname(self.path), 'missing', 'index.snapshot')
+        with self.assertRaises(FileNotFoundError) as context:
+            write_snapshot(IntegerValueIndex(), path)
+        # The error is from creating the file, not from removing it.
+        assert_that(context.exception.__context__, is_(none()))
+
+    def test_set_index(self):
+        index = SetIndex()
+        for docid in range(100):
+            index.index_doc(docid, {docid % 3, docid % 5})
+        queries = [
+            {'any_of': (1, 2, 9)},
+            {'all_of': (1, 2)},
+            {'all_of': (1, 9)},
+            {'all_of': ()},
+            {'between': (1, 3)},
+            {'any': None},
+        ]
+
+        def change(index):
+            index.index_doc(1, {0, 9})
+            index.unindex_doc(2)
+            index.index_doc(100, {1, 2})
+            return [1, 2, 100]
+        self._check_snapshot(index, queries, change)
+
+    def test_keyword_index(self):
+        index = NormalizingKeywordIndex()
+        for docid in range(100):
+            index.index_doc(docid, ('Tag%d' % (docid % 3), 'tag%d' % (docid % 5)))
+        queries = [
+            {'query': ['TAG1', 'tag2'], 'operator': 'or'},
+            {'query': ['tag1', 'tag4'], 'operator': 'and'},
+            {'query': ['tag1', 'missing'], 'operator': 'and'},
+            {'between': ('tag1', 'tag3')},
+            {'any': None},
+            {'query': [1]},
+        ]
+
+        def change(index):
+            index.index_doc(1, ('tag4',))
+            index.unindex_doc(2)
+            return [1, 2]
+        self._check_snapshot(index, queries, change)
+
+    def test_unsupported_queries_use_index(self):
+        extent = Extent(family=family)
+        extent.add(1, None)
+        extent.add(3, None)
+        for index, values in ((NormalizingKeywordIndex(), (['a'], ['b'])),
+                              (SetIndex(), ({'a'}, {'b'})),
+                              (ValueIndex(), ('a', 'b'))):
+            index.index_doc(1, values[0])
+            index.index_doc(2, values[1])
+            snapshot_index = SnapshotIndex(index, self._snapshot(index))
+            assert_that(list(snapshot_index.apply({'none': extent})),
+                        is_(list(index.apply({'none': extent}))))
+        assert_that(snapshot_index.apply({}), is_(none()))
+
+    def test_filtered_set(self):
+        index = ExtentFilteredSet('even', is_even, family=family)
+        for docid in range(10):
+            index.index_doc(docid, None)
+        snapshot = self._snapshot(index, b'\x00' * 7 + b'\x01')
+        assert_that(snapshot.tid, is_(b'\x00' * 7 + b'\x01'))
+        snapshot_index = SnapshotIndex(index, snapshot)
+        assert_that(list(snapshot_index.ids()), is_([0, 2, 4, 6, 8]))
+        index.unindex_doc(2)
+        index.index_doc(10, None)
+        index.index_doc(11, None)
+        snapshot_index.add_changed([2, 10, 11])
+        assert_that(list(snapshot_index.ids()), is_([0, 4, 6, 8, 10]))
+        assert_that(calling(snapshot_index.apply).with_args({'any': None}),
+                    raises(TypeError))
+
+        index.clear()
+        index._ids = None
+        assert_that(list(SnapshotIndex(index, self._snapshot(index), [0]).ids()),
+                    is_([]))
+
+    def test_empty_index(self):
+        index = IntegerValueIndex()
+        snapshot_index = SnapshotIndex(index, self._snapshot(index))
+        assert_that(list(snapshot_index.apply({'between': (1, 10)})), is_([]))
+        assert_that(list(snapshot_index.ids()), is_([]))
+
+    def test_unsupported_index(self):
+        assert_that(calling(write_snapshot).with_args(AttributeTextIndex('text'), self.path),
+                    raises(TypeError))
+
+    def test_bad_files(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a snapshot at all')
+        assert_that(calling(IndexSnapshot).with_args(self.path),
+                    raises(ValueError, 'Not an index snapshot'))
+
+        index = IntegerValueIndex()
+        index.index_doc(1, 1)
+        write_snapshot(index, self.path)
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        with open(self.path, 'wb') as f:
+            f.write(data[:-1])
+        assert_that(calling(IndexSnapshot).with_args(self.path),
+                    raises(ValueError, 'Truncated'))
+
+        header_offset = int.from_bytes(data[-16:-8], 'little')
+        header = pickle.loads(data[header_offset:-16])
+        header['byteorder'] = 'big' if header['byteorder'] == 'little' else 'little'
+        with open(self.path, 'wb') as f:
+            f.write(data[:header_offset])
+            pickle.dump(header, f)
+            f.write(header_offset.to_bytes(8, 'little'))
+            f.write(data[-8:])
+        assert_that(calling(IndexSnapshot).with_args(self.path),
+                    raises(ValueError, 'Incompatible'))
+
+    def test_context_manager(self):
+        index = IntegerValueIndex(family=BTrees.family32)
+        index.index_doc(1, 1)
+        write_snapshot(index, self.path)
+        with IndexSnapshot(self.path) as snapshot:
+            assert_that(snapshot.family, is_(BTrees.family32))
+            assert_that(list(snapshot.union()), is_([1]))
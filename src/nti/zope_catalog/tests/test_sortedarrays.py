@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import BTrees
+from hamcrest import assert_that
+from hamcrest import calling
+from hamcrest import greater_than
+from hamcrest import has_length
+from hamcrest import is_
+from hamcrest import raises
+
+import transaction
+from ZODB.DB import DB
+from ZODB.FileStorage import FileStorage
+from ZODB.POSException import ConflictError
+
+from nti.zope_catalog.sortedarrays import SortedRangeArrays
+
+__docformat__ = "restructuredtext en"
+
+# pylint:disable=protected-access
+
+
+class SmallChunks(SortedRangeArrays):
+    CHUNK_SIZE = 8
+
+
+class TestSortedRangeArrays(unittest.TestCase):
+
+    def _check(self, arrays, pairs):
+        def expected(min_value, max_value):
+            return sorted({docid for value, docid in pairs if min_value <= value <= max_value})
+        for min_value, max_value in ((0, 100), (5, 5), (3, 17), (-5, 2), (18, 40)):
+            assert_that(list(arrays.between(min_value, max_value)),
+                        is_(expected(min_value, max_value)))
+        assert_that(list(arrays.between(3, 17, True, True)), is_(expected(4, 16)))
+        assert_that(list(arrays.between()), is_(expected(-2**63, 2**63 - 1)))
+        chunks = list(arrays._chunks.items())
+        for (key, chunk), (next_key, _) in zip(chunks, chunks[1:] + [(2**63, None)]):
+            assert_that(list(chunk.values), is_(sorted(chunk.values)))
+            assert_that(all(key <= v < next_key for v in chunk.values), is_(True))
+
+    def test_fill_add_remove(self):
+        pairs = [(docid % 20, docid) for docid in range(100)]
+        arrays = SmallChunks(pairs=sorted(pairs))
+        assert_that(arrays._chunks, has_length(20))
+        self._check(arrays, pairs)
+
+        arrays = SmallChunks()
+        for value, docid in pairs:
+            arrays.add(value, (docid,))
+        arrays.add(5, (5,))
+        self._check(arrays, pairs)
+        # Split as they filled.
+        assert_that(len(arrays._chunks), is_(greater_than(10)))
+
+        for value, docid in pairs[::2]:
+            arrays.remove(value, (docid,))
+        arrays.remove(5, (1000,))
+        self._check(arrays, pairs[1::2])
+
+    def test_one_value(self):
+        arrays = SmallChunks()
+        arrays.add(7, range(20))
+        arrays.add(1, (1,))
+        assert_that(arrays._chunks, has_length(2))
+        arrays.add(7, range(20, 40))
+        assert_that(arrays._chunks, has_length(2))
+        assert_that(list(arrays.between(7, 7)), is_(list(range(40))))
+
+    def test_bounds(self):
+        arrays = SortedRangeArrays(BTrees.family32)
+        arrays.add(2**31 - 1, (1,))
+        arrays.add(-2**31, (2,))
+        assert_that(list(arrays.between(-2**40, 2**40)), is_([1, 2]))
+        assert_that(list(arrays.between(2**40, None)), is_([]))
+        assert_that(list(arrays.between(None, -2**40)), is_([]))
+        assert_that(list(arrays.between(5, 4)), is_([]))
+        assert_that(calling(arrays.between).with_args('a'), raises(TypeError))
+
+
+class TestConflicts(unittest.TestCase):
+
+    def setUp(self):
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        self.db = DB(FileStorage(os.path.join(tempdir, 'Data.fs')))
+        self.addCleanup(self.db.close)
+        tm = transaction.TransactionManager()
+        conn = self.db.open(tm)
+        conn.root.arrays = SmallChunks(pairs=[(1, 1), (2, 2), (3, 3)])
+        tm.commit()
+        conn.close()
+
+    def _open(self):
+        tm = transaction.TransactionManager()
+        conn = self.db.open(tm)
+        self.addCleanup(conn.close)
+        self.addCleanup(tm.abort)
+        return tm, conn.root.arrays
+
+    def test_concurrent_changes_merged(self):
+        tm1, arrays1 = self._open()
+        tm2, arrays2 = self._open()
+        arrays1.add(4, (4,))
+        arrays1.remove(1, (1,))
+        arrays2.add(4, (5,))
+        arrays2.remove(2, (2,))
+        tm1.commit()
+        tm2.commit()
+
+        tm1.begin()
+        assert_that(list(arrays1.between()), is_([3, 4, 5]))
+
+    def test_bulk_append(self):
+        tm, arrays = self._open()
+        for value in range(4, 100):
+            arrays.add(value, (value,))
+            tm.commit()
+        chunks = list(arrays._chunks.values())
+        # Each chunk was filled in turn, never split.
+        assert_that([len(chunk) for chunk in chunks], is_([8] * 12 + [3]))
+        assert_that({chunk.generation for chunk in chunks}, is_({0}))
+        assert_that(list(arrays.between()), is_(list(range(1, 100))))
+
+        arrays.add(100, (100,))
+        assert_that(arrays._p_jar._registered_objects, is_([chunks[-1]]))
+        tm.commit()
+        # Until the chunk is full, the same value goes in it.
+        arrays.add(100, range(101, 105))
+        assert_that(arrays._chunks, has_length(13))
+        assert_that(chunks[-1], has_length(8))
+
+    def test_concurrent_split(self):
+        tm1, arrays1 = self._open()
+        tm2, arrays2 = self._open()
+        arrays1.add(10, range(10, 16))
+        arrays2.add(4, (4,))
+        tm1.commit()
+        assert_that(calling(tm2.commit), raises(ConflictError))
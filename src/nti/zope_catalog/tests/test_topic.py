@@ -157,3 +157,36 @@ class TestExtentFilteredSet(unittest.TestCase):
         extent.index_doc(in_none.docid, in_none)
 
         assert_that(extent.ids(), is_((1,)))
+
+
+class TestStatistics(unittest.TestCase):
+
+    def test_statistics(self):
+        extent = ExtentFilteredSet('extent', default_expression)
+        _filter = PythonFilteredSet('filter',
+                                    'context.in_filter',
+                                    family=extent.family)
+        empty = ExtentFilteredSet('empty', default_expression)
+        index = TopicIndex()
+        index.addFilter(extent)
+        index.addFilter(_filter)
+        index.addFilter(empty)
+        index.index_doc(1, Context(in_extent=True))
+        index.index_doc(2, Context(in_filter=True))
+        index.index_doc(3, Context(in_extent=True, in_filter=True))
+        index.index_doc(4, Context(in_extent=True))
+        empty.clear()
+
+        stats = index.statistics()
+        assert_that(stats.documents, is_(4))
+        assert_that(stats.distinct_values, is_(2))
+        assert_that(stats.exact, is_(True))
+        assert_that(stats.heavy_hitters, is_([('extent', 3), ('filter', 2)]))
+        assert_that(stats.values_per_document, is_(1.25))
+
+        assert_that(extent.statistics().heavy_hitters, is_([('extent', 3)]))
+        stats = empty.statistics()
+        assert_that(stats.documents, is_(0))
+        assert_that(stats.heavy_hitters, is_([]))
+        empty._ids = None
+        assert_that(empty.statistics().documents, is_(0))
@@ -10,6 +10,7 @@ from __future__ import division
 from __future__ import print_function
 
 
+import collections
 from collections.abc import Mapping
 
 import BTrees
@@ -20,12 +21,15 @@ from zope.container.contained import Contained
 from zope.index.topic import TopicIndex as _TopicIndex
 from zope.index.topic.filter import FilteredSetBase
 
+from nti.zope_catalog.index import IndexStatistics
+from nti.zope_catalog.mixin import BatchIndexMixin
+
 __docformat__ = "restructuredtext en"
 
 
 
 @interface.implementer(ICatalogIndex)
-class TopicIndex(_TopicIndex, Contained):
+class TopicIndex(BatchIndexMixin, _TopicIndex, Contained):
     """
     A topic index that implements ``IContained`` and ``ICatalogIndex``
     for use with catalog indexes.
@@ -76,6 +80,26 @@ class TopicIndex(_TopicIndex, Contained):
                 query = {'operator': 'and', 'query': query['all_of']}
         return super().apply(query)
 
+    def statistics(self, top=10, buckets=10, sample_size=None):
+        """
+        Return an :class:`~.IndexStatistics` whose values are the ids
+        of the filters each document is in. These are exact: the
+        size of each filter is used, and *sample_size* is ignored.
+
+        .. versionadded:: 4.3.0
+        """
+        # pylint:disable=unused-argument
+        counts = collections.Counter()
+        ids = []
+        for fid, filtered_set in self._filters.items():
+            filter_ids = filtered_set.getIds()
+            if filter_ids:
+                counts[fid] = len(filter_ids)
+                ids.append(self.family.IF.Set(filter_ids))
+        documents = len(self.family.IF.multiunion(ids))
+        return IndexStatistics.from_counts(documents, len(counts), counts, documents,
+                                           top, buckets)
+
 
 class ExtentFilteredSet(FilteredSetBase):
     """
@@ -118,6 +142,19 @@ class ExtentFilteredSet(FilteredSetBase):
     def ids(self):
         return tuple(self._ids) if self._ids is not None else ()
 
+    def statistics(self, top=10, buckets=10, sample_size=None):
+        """
+        Return an :class:`~.IndexStatistics` whose only value is the
+        id of this filter.
+
+        .. versionadded:: 4.3.0
+        """
+        # pylint:disable=unused-argument
+        documents = len(self._ids) if self._ids is not None else 0
+        counts = collections.Counter({self.getId(): documents} if documents else {})
+        return IndexStatistics.from_counts(documents, len(counts), counts, documents,
+                                           top, buckets)
+
     def clear(self):
         # Note that we ignore the super implementation.
         self._extent = FilterExtent(self.getExpression(), family=self.family)